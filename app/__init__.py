@@ -1,12 +1,20 @@
 from flask import Flask
-from .database.db_config import DatabaseConnection  
+from .database.db_config import DatabaseConnection, PoolConfig
+from .database.indexes import ensure_indexes
+from .visualizations.dashboard import DashboardRefresher
+from . import instrumentation
+from .logging_config import configure_logging
 from dotenv import load_dotenv
+import threading
 import os
 
 load_dotenv()
 
 def create_app():
     """Fonction de création et configuration de l'application Flask"""
+    # Logging non bloquant (file + thread d'écriture), niveau LOG_LEVEL
+    configure_logging()
+    
     app = Flask(__name__)
     
     # Configuration de base
@@ -16,8 +24,27 @@ def create_app():
         TEMPLATE_FOLDER='templates'
     )
     
-    # Initialisation de la base de données
-    app.db = DatabaseConnection()
+    # Configuration du pool MongoDB (surchargeable par variables d'environnement)
+    app.config.update({
+        key: os.environ[key] for key in PoolConfig.KEYS if os.environ.get(key)
+    })
+    
+    # Initialisation de la base de données : un client partagé par worker
+    app.db = DatabaseConnection.shared(PoolConfig.from_mapping(app.config))
+    
+    # Création idempotente des index, en arrière-plan pour ne pas bloquer le démarrage
+    if os.environ.get('MONGODB_ENSURE_INDEXES', '1') != '0':
+        threading.Thread(target=ensure_indexes, args=(app.db,), daemon=True).start()
+    
+    # Tableau de bord pré-calculé, rafraîchi périodiquement (0 : désactivé)
+    app.dashboard = DashboardRefresher(app.db)
+    interval = float(os.environ.get('DASHBOARD_REFRESH_INTERVAL', 300))
+    if interval > 0:
+        app.dashboard.start(interval)
+    
+    # Spans, en-tête Server-Timing, histogrammes (/metrics) et profilage à la demande
+    if os.environ.get('INSTRUMENTATION', '1') != '0':
+        instrumentation.init_app(app)
     
     # Enregistrement des routes
     from .routes import main_bp  # Notez le point avant routes
@@ -25,5 +52,15 @@ def create_app():
     
     return app
 
-# Créer une instance de l'application pour Gunicorn
-app = create_app()
\ No newline at end of file
+def __getattr__(name):
+    """
+    Instance de l'application pour Gunicorn (`app:app`), créée au premier accès.
+
+    Importer le paquet (par exemple depuis wsgi.py ou le scraper) ne
+    construit donc plus une seconde application ni un second client MongoDB.
+    """
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -1,41 +1,244 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from pymongo.monitoring import ConnectionPoolListener
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, Iterable, Iterator, Mapping
+from datetime import datetime
+import threading
 import logging
 import atexit
+import time
 import ssl
 import os
 
-class DatabaseConnection:
+from app.instrumentation import CommandTimer
+
+
+@dataclass
+class PoolConfig:
+    """Paramètres du pool de connexions MongoDB partagé par le processus"""
+    max_pool_size: int = 10
+    min_pool_size: int = 0
+    max_idle_time_ms: Optional[int] = None
+    wait_queue_timeout_ms: Optional[int] = 5000
+    server_selection_timeout_ms: int = 30000
+    connect_timeout_ms: int = 30000
+    socket_timeout_ms: Optional[int] = None
+    health_check_interval: float = 30.0
+
+    # Correspondance clé de configuration -> attribut
+    KEYS = {
+        'MONGODB_MAX_POOL_SIZE': 'max_pool_size',
+        'MONGODB_MIN_POOL_SIZE': 'min_pool_size',
+        'MONGODB_MAX_IDLE_TIME_MS': 'max_idle_time_ms',
+        'MONGODB_WAIT_QUEUE_TIMEOUT_MS': 'wait_queue_timeout_ms',
+        'MONGODB_SERVER_SELECTION_TIMEOUT_MS': 'server_selection_timeout_ms',
+        'MONGODB_CONNECT_TIMEOUT_MS': 'connect_timeout_ms',
+        'MONGODB_SOCKET_TIMEOUT_MS': 'socket_timeout_ms',
+        'MONGODB_HEALTH_CHECK_INTERVAL': 'health_check_interval',
+    }
+
+    @classmethod
+    def from_mapping(cls, mapping: Mapping[str, Any]) -> 'PoolConfig':
+        """Construit la configuration à partir d'un dict (app.config, os.environ)"""
+        config = cls()
+        for key, attr in cls.KEYS.items():
+            value = mapping.get(key)
+            if value is None or value == '':
+                continue
+            caster = float if attr == 'health_check_interval' else int
+            setattr(config, attr, caster(value))
+        return config
+
+    @classmethod
+    def from_env(cls) -> 'PoolConfig':
+        return cls.from_mapping(os.environ)
+
+    def client_options(self) -> Dict[str, Any]:
+        """Options passées à MongoClient"""
+        options = {
+            'maxPoolSize': self.max_pool_size,
+            'minPoolSize': self.min_pool_size,
+            'serverSelectionTimeoutMS': self.server_selection_timeout_ms,
+            'connectTimeoutMS': self.connect_timeout_ms,
+            'retryWrites': True
+        }
+        if self.max_idle_time_ms is not None:
+            options['maxIdleTimeMS'] = self.max_idle_time_ms
+        if self.wait_queue_timeout_ms is not None:
+            options['waitQueueTimeoutMS'] = self.wait_queue_timeout_ms
+        if self.socket_timeout_ms is not None:
+            options['socketTimeoutMS'] = self.socket_timeout_ms
+        return options
+
+
+class PoolMetrics(ConnectionPoolListener):
+    """Collecte les métriques du pool (connexions empruntées, temps d'attente)"""
+
     def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.total_checkouts = 0
+        self.checkout_failures = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.connections_created = 0
+        self.connections_closed = 0
+        self.pool_clears = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'checked_out': self.checked_out,
+                'max_checked_out': self.max_checked_out,
+                'total_checkouts': self.total_checkouts,
+                'checkout_failures': self.checkout_failures,
+                'avg_wait_ms': (self.total_wait_ms / self.total_checkouts
+                                if self.total_checkouts else 0.0),
+                'max_wait_ms': self.max_wait_ms,
+                'open_connections': self.connections_created - self.connections_closed,
+                'pool_clears': self.pool_clears
+            }
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        started = getattr(self._local, 'started', None)
+        wait_ms = (time.perf_counter() - started) * 1000 if started else 0.0
+        with self._lock:
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.total_checkouts += 1
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out = max(0, self.checked_out - 1)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_created += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_closed += 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+
+@dataclass
+class ColumnChunk:
+    """Bloc de colonnes lu d'un curseur (voir DatabaseConnection.iter_column_chunks)"""
+    size: int
+    columns: Dict[str, Any]
+
+    @classmethod
+    def build(cls, columns: Dict[str, Any], present: set, size: int,
+              dtypes: Mapping[str, Any]) -> 'ColumnChunk':
+        chunk = {}
+        for field, values in columns.items():
+            if field not in present:
+                continue
+            values = values[:size]
+            chunk[field] = values.astype(dtypes[field]) if field in dtypes else values
+        return cls(size, chunk)
+
+
+class DatabaseConnection:
+    # Instance partagée par processus (un pool par worker gunicorn)
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, pool_config: Optional[PoolConfig] = None):
         # Récupération de l'URI depuis les variables d'environnement
         self.connection_string = os.environ.get('MONGODB_URI')
         
         if not self.connection_string:
             raise ValueError("MONGODB_URI n'est pas définie dans les variables d'environnement")
         
-        # Configuration du logging
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[logging.StreamHandler()]
-        )
         self.logger = logging.getLogger(__name__)
+        self.pool_config = pool_config or PoolConfig.from_env()
+        self.metrics = PoolMetrics()
+        self._pid = os.getpid()
+        self._healthy = None
+        self._last_health_check = 0.0
+        self._health_lock = threading.Lock()
         
         try:
+            # Pas de ping ici : MongoClient se connecte en arrière-plan,
+            # la vérification de santé est faite à la demande (check_health)
             self.client = MongoClient(
                 self.connection_string,
-                serverSelectionTimeoutMS=30000,
-                connectTimeoutMS=30000,
-                retryWrites=True
+                event_listeners=[self.metrics, CommandTimer()],
+                **self.pool_config.client_options()
             )
-            # Tester la connexion
-            self.client.admin.command('ping')
             self.db = self.client.koutchoumi_db
-            self.logger.info("Connexion à MongoDB établie avec succès")
+            self.logger.info("Client MongoDB initialisé (pool max %d)",
+                             self.pool_config.max_pool_size)
             atexit.register(self.cleanup)
         except Exception as e:
             self.logger.error(f"Erreur de connexion à MongoDB : {e}")
             raise
 
+    @classmethod
+    def shared(cls, pool_config: Optional[PoolConfig] = None) -> 'DatabaseConnection':
+        """Retourne la connexion partagée du processus, créée au premier appel.
+
+        Après un fork (workers gunicorn), un nouveau client est créé car
+        MongoClient n'est pas fork-safe.
+        """
+        with cls._shared_lock:
+            if cls._shared is None or cls._shared._pid != os.getpid():
+                cls._shared = cls(pool_config)
+            return cls._shared
+
+    def check_health(self, force: bool = False) -> bool:
+        """Ping MongoDB au plus une fois par intervalle de vérification"""
+        with self._health_lock:
+            now = time.monotonic()
+            interval = self.pool_config.health_check_interval
+            if not force and self._healthy is not None and now - self._last_health_check < interval:
+                return self._healthy
+            try:
+                self.client.admin.command('ping')
+                self._healthy = True
+            except Exception as e:
+                self.logger.error(f"MongoDB injoignable : {e}")
+                self._healthy = False
+            self._last_health_check = now
+            return self._healthy
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Métriques du pool de connexions"""
+        stats = self.metrics.snapshot()
+        stats.update({
+            'max_pool_size': self.pool_config.max_pool_size,
+            'healthy': self._healthy
+        })
+        return stats
+
     def cleanup(self):
         """Ferme proprement la connexion"""
         try:
@@ -54,37 +257,120 @@ class DatabaseConnection:
             self.logger.error(f"Erreur lors de la sauvegarde : {e}")
             return None
 
-    def get_all_apartments(self):
-        """Récupère tous les appartements"""
+    def get_all_apartments(self, projection=None):
+        """Récupère tous les appartements (champs de `projection` uniquement si fournie)"""
         try:
-            return list(self.db.apartments.find())
+            return list(self.db.apartments.find({}, projection))
         except Exception as e:
             self.logger.error(f"Erreur lors de la récupération : {e}")
             return []
 
-    def get_apartments_by_city(self, city):
+    def get_apartments_by_city(self, city, projection=None):
         """Récupère les appartements par ville"""
         try:
-            return list(self.db.apartments.find({"ville": city}))
+            return list(self.db.apartments.find({"ville": city}, projection))
         except Exception as e:
             self.logger.error(f"Erreur lors de la recherche par ville : {e}")
             return []
     
-    def get_apartments_by_criteria(self, criteria):
+    def get_apartments_by_criteria(self, criteria, projection=None):
         """Récupère les appartements selon des critères spécifiques"""
         try:
-            return list(self.db.apartments.find(criteria))
+            return list(self.db.apartments.find(criteria, projection))
         except Exception as e:
             self.logger.error(f"Erreur lors de la recherche avec critères : {e}")
             return []
 
+    def iter_apartments(self, criteria=None, projection=None, batch_size=1000) -> Iterator[Dict[str, Any]]:
+        """Parcourt les appartements un document à la fois, sans les charger tous en mémoire"""
+        try:
+            yield from self.db.apartments.find(criteria or {}, projection).batch_size(batch_size)
+        except Exception as e:
+            self.logger.error(f"Erreur lors du parcours des appartements : {e}")
+
+    def iter_column_chunks(self, fields: Iterable[str], criteria=None, dtypes=None,
+                           chunk_size: int = 5000) -> Iterator['ColumnChunk']:
+        """
+        Parcourt les appartements par blocs de colonnes NumPy.
+
+        Seuls `fields` sont demandés au serveur ; chaque document est rangé
+        directement dans les tableaux du bloc (jamais de liste de dicts).
+        Un bloc ne contient que les champs présents dans au moins un de ses
+        documents, les valeurs manquantes valant NaN. Les champs de `dtypes`
+        sont convertis au type indiqué, les autres restent des objets.
+        """
+        import numpy as np
+
+        fields = list(fields)
+        dtypes = dtypes or {}
+        projection = {field: 1 for field in fields}
+        if '_id' not in projection:
+            projection['_id'] = 0
+
+        def new_columns():
+            return {field: np.full(chunk_size, np.nan, dtype=object) for field in fields}
+
+        columns, present, size = new_columns(), set(), 0
+        for doc in self.iter_apartments(criteria, projection, batch_size=chunk_size):
+            for field, value in doc.items():
+                columns[field][size] = value
+                present.add(field)
+            size += 1
+            if size == chunk_size:
+                yield ColumnChunk.build(columns, present, size, dtypes)
+                columns, present, size = new_columns(), set(), 0
+        if size:
+            yield ColumnChunk.build(columns, present, size, dtypes)
+
+    def load_frame(self, fields: Iterable[str], criteria=None, dtypes=None,
+                   chunk_size: int = 5000):
+        """
+        Construit un DataFrame typé des champs `fields` à partir du curseur.
+
+        Comme pd.DataFrame(list(find())), seuls les champs présents dans au
+        moins un document deviennent des colonnes et le type des colonnes
+        sans `dtypes` est déduit des valeurs ; mais les documents ne sont
+        jamais matérialisés en dicts, et les champs non demandés ne sont pas
+        transférés.
+        """
+        import numpy as np
+        import pandas as pd
+
+        fields = list(fields)
+        dtypes = dtypes or {}
+        chunks = list(self.iter_column_chunks(fields, criteria, dtypes, chunk_size))
+        present = [field for field in fields if any(field in chunk.columns for chunk in chunks)]
+
+        data = {}
+        for field in present:
+            parts = [chunk.columns.get(field, np.full(chunk.size, np.nan, dtype=object))
+                     for chunk in chunks]
+            column = pd.Series(np.concatenate(parts) if len(parts) > 1 else parts[0], name=field)
+            data[field] = column.astype(dtypes[field]) if field in dtypes else column.infer_objects()
+            # Libère les blocs au fur et à mesure
+            for chunk in chunks:
+                chunk.columns.pop(field, None)
+        return pd.DataFrame(data)
+
+    # Champs dont dépend la classification matérialisée
+    CLASSIFICATION_INPUTS = ('prix', 'nb_chambres')
+
     def update_apartment(self, apartment_id, update_data):
-        """Met à jour un appartement"""
+        """
+        Met à jour un appartement.
+
+        Si le prix ou le nombre de chambres change sans nouvelle
+        classification, l'ancienne est retirée : le document sera reclassé
+        par le prochain refresh_classifications.
+        """
+        update = {"$set": {**update_data, "derniere_maj": datetime.now()}}
+        if 'classification' not in update_data and \
+                any(field in update_data for field in self.CLASSIFICATION_INPUTS):
+            update["$unset"] = {"classification": "", "classification_version": ""}
         try:
-            result = self.db.apartments.update_one(
-                {"_id": apartment_id},
-                {"$set": update_data}
-            )
+            result = self.db.apartments.update_one({"_id": apartment_id}, update)
+            if result.modified_count > 0:
+                self.bump_data_version()
             return result.modified_count > 0
         except Exception as e:
             self.logger.error(f"Erreur lors de la mise à jour : {e}")
@@ -94,11 +380,172 @@ class DatabaseConnection:
         """Supprime un appartement"""
         try:
             result = self.db.apartments.delete_one({"_id": apartment_id})
+            if result.deleted_count > 0:
+                self.bump_data_version(deleted=True)
             return result.deleted_count > 0
         except Exception as e:
             self.logger.error(f"Erreur lors de la suppression : {e}")
             return False
 
+    # Champs réécrits à chaque passage du scraper ; les autres ne sont posés qu'à l'insertion
+    UPSERT_FIELDS = ('empreinte', 'titre', 'quartier', 'prix', 'nb_chambres', 'popularite', 'description',
+                     'classification', 'classification_version')
+
+    def bulk_upsert_apartments(self, apartments):
+        """
+        Insère ou met à jour des annonces en un seul bulk_write non ordonné.
+
+        Une annonce nouvelle est insérée en entier ($setOnInsert, avec
+        date_ajout). Une annonce connue n'est réécrite (champs de UPSERT_FIELDS
+        et derniere_maj) que si son empreinte a changé ; sinon seule sa
+        popularité (hors empreinte) est mise à jour, si elle a changé. Une
+        annonce identique n'est pas modifiée et ne change pas la version des
+        données.
+        Retourne les compteurs inserted / updated / unchanged / errors.
+        """
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'errors': 0}
+        if not apartments:
+            return counts
+
+        now = datetime.now()
+        operations = []
+        for apartment in apartments:
+            url = apartment['url_annonce']
+            updates = {field: apartment[field] for field in self.UPSERT_FIELDS if field in apartment}
+            updates['derniere_maj'] = now
+            if 'empreinte' not in apartment:
+                # Sans empreinte, impossible de savoir si le contenu a changé : réécriture
+                on_insert = {
+                    field: value for field, value in apartment.items()
+                    if field not in updates and field not in ('url_annonce', '_id')
+                }
+                on_insert.setdefault('date_ajout', now)
+                operations.append(UpdateOne(
+                    {"url_annonce": url},
+                    {"$set": updates, "$setOnInsert": on_insert},
+                    upsert=True
+                ))
+                continue
+
+            document = {field: value for field, value in apartment.items()
+                        if field not in ('url_annonce', '_id')}
+            document['derniere_maj'] = now
+            document.setdefault('date_ajout', now)
+            # Annonce connue dont le contenu a changé (sans effet sinon)
+            operations.append(UpdateOne(
+                {"url_annonce": url, "empreinte": {"$ne": apartment['empreinte']}},
+                {"$set": updates}
+            ))
+            # Annonce nouvelle (sans effet si elle existe déjà)
+            operations.append(UpdateOne(
+                {"url_annonce": url},
+                {"$setOnInsert": document},
+                upsert=True
+            ))
+            if 'popularite' in apartment:
+                # Contenu inchangé, vues modifiées : les trois opérations sont
+                # exclusives (une annonce compte au plus une fois), quel que
+                # soit leur ordre d'exécution
+                operations.append(UpdateOne(
+                    {"url_annonce": url, "empreinte": apartment['empreinte'],
+                     "popularite": {"$ne": apartment['popularite']}},
+                    {"$set": {"popularite": apartment['popularite'], "derniere_maj": now}}
+                ))
+
+        try:
+            result = self.db.apartments.bulk_write(operations, ordered=False)
+            details = {
+                'nUpserted': result.upserted_count,
+                'nModified': result.modified_count
+            }
+        except BulkWriteError as e:
+            details = e.details
+            counts['errors'] = len(details.get('writeErrors', []))
+            self.logger.error(f"Erreurs lors de l'écriture groupée : {counts['errors']}")
+        except Exception as e:
+            self.logger.error(f"Erreur lors de l'écriture groupée : {e}")
+            counts['errors'] = len(apartments)
+            return counts
+
+        counts['inserted'] = details.get('nUpserted', 0)
+        counts['updated'] = details.get('nModified', 0)
+        counts['unchanged'] = max(0, len(apartments) - counts['inserted'] - counts['updated']
+                                  - counts['errors'])
+        if counts['inserted'] or counts['updated']:
+            self.bump_data_version()
+        return counts
+
+    def get_fingerprints(self, urls):
+        """Empreintes connues des annonces, par url_annonce"""
+        try:
+            cursor = self.db.apartments.find(
+                {"url_annonce": {"$in": list(urls)}},
+                {"url_annonce": 1, "empreinte": 1, "_id": 0}
+            )
+            return {doc["url_annonce"]: doc.get("empreinte") for doc in cursor}
+        except Exception as e:
+            self.logger.error(f"Erreur lors de la lecture des empreintes : {e}")
+            return {}
+
+    def get_data_version(self):
+        """Retourne le compteur de version des données (None si jamais incrémenté)"""
+        return self.get_data_state()[0]
+
+    def get_data_state(self):
+        """
+        Compteurs de la collection : (version, suppressions).
+
+        `version` change à chaque modification, `suppressions` seulement
+        quand des documents sont supprimés. (None, 0) si jamais incrémentés.
+        """
+        try:
+            meta = self.db.meta.find_one({"_id": "apartments"}, {"version": 1, "suppressions": 1})
+            return (meta["version"], meta.get("suppressions", 0)) if meta else (None, 0)
+        except Exception as e:
+            self.logger.error(f"Erreur lors de la lecture de la version : {e}")
+            return None, 0
+
+    def bump_data_version(self, deleted: bool = False):
+        """
+        Incrémente le compteur de version après une modification de la collection.
+
+        `deleted` signale une suppression : les lecteurs incrémentaux (instantané
+        en mémoire) ne peuvent pas la voir via derniere_maj et rechargent tout.
+        """
+        increments = {"version": 1, "suppressions": 1} if deleted else {"version": 1}
+        try:
+            meta = self.db.meta.find_one_and_update(
+                {"_id": "apartments"},
+                {"$inc": increments, "$set": {"updated_at": datetime.now()}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            return meta["version"]
+        except Exception as e:
+            self.logger.error(f"Erreur lors de l'incrément de version : {e}")
+            return None
+
+    def get_latest_update(self):
+        """Retourne la date de dernière mise à jour la plus récente"""
+        try:
+            doc = self.db.apartments.find_one(
+                {"derniere_maj": {"$exists": True}},
+                {"derniere_maj": 1},
+                sort=[("derniere_maj", -1)]
+            )
+            return doc["derniere_maj"] if doc else None
+        except Exception as e:
+            self.logger.error(f"Erreur lors de la lecture de la dernière mise à jour : {e}")
+            return None
+
+    def estimated_count(self):
+        """Nombre approximatif de documents (métadonnées, sans parcours)"""
+        try:
+            return self.db.apartments.estimated_document_count()
+        except Exception as e:
+            self.logger.error(f"Erreur lors du comptage estimé : {e}")
+            return 0
+
     def get_distinct_values(self, field):
         """Récupère les valeurs distinctes pour un champ donné"""
         try:
@@ -136,8 +583,13 @@ class DatabaseConnection:
 
 # Test de la connexion si ce fichier est exécuté directement
 if __name__ == "__main__":
+    from app.logging_config import configure_logging
+
+    configure_logging()
     try:
         db = DatabaseConnection()
+        if not db.check_health(force=True):
+            raise ConnectionError("ping sans réponse")
         print("✅ Connexion à MongoDB réussie")
         print("✅ Base de données prête pour le scraping")
     except Exception as e:
@@ -0,0 +1,305 @@
+"""
+Historique des prix et de la popularité des annonces.
+
+Le scraper réécrit `prix` et `popularite` en place dans `apartments` ;
+chaque passage est aussi ajouté (sans jamais être modifié) à la collection
+`observations`. Pour rester compacte, elle regroupe les observations par
+seau : un document par annonce et par mois, contenant la liste des points
+{t, prix, vues} et un résumé (premier / dernier point, bornes de prix).
+
+Les tendances sont lues dans `observation_rollups`, pré-agrégée par ville,
+quartier et mois à la fin de chaque scraping : le tableau de bord n'a
+jamais à parcourir les observations brutes. Le même recalcul range dans
+chaque seau ses vues gagnées par jour, indexées pour le classement des
+annonces les plus consultées.
+
+    python -m app.database.history --ville Douala
+    python -m app.database.history --rollup 2024-05 2024-06
+"""
+
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set
+import logging
+
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+INDEXES = {
+    'observations': [
+        # Agrégation des seaux d'un mois, filtrée par ville / quartier
+        IndexModel([("mois", ASCENDING), ("ville", ASCENDING), ("quartier", ASCENDING)],
+                   name="mois_ville_quartier"),
+        # Historique d'une annonce
+        IndexModel([("url_annonce", ASCENDING), ("mois", ASCENDING)], name="url_annonce_mois"),
+        # Classement par vues gagnées par jour (view_velocity)
+        IndexModel([("mois", ASCENDING), ("vues_par_jour", DESCENDING)], name="mois_vues_par_jour"),
+        IndexModel([("mois", ASCENDING), ("ville", ASCENDING), ("vues_par_jour", DESCENDING)],
+                   name="mois_ville_vues_par_jour"),
+    ],
+    'observation_rollups': [
+        IndexModel([("ville", ASCENDING), ("quartier", ASCENDING), ("mois", DESCENDING)],
+                   name="ville_quartier_mois"),
+        IndexModel([("mois", DESCENDING)], name="mois"),
+    ],
+}
+
+
+def month_key(moment: datetime) -> str:
+    return moment.strftime('%Y-%m')
+
+
+class ObservationStore:
+    def __init__(self, db):
+        self.db = db
+        self.observations = db.db.observations
+        self.rollups = db.db.observation_rollups
+        # Mois touchés depuis le dernier recalcul des agrégats
+        self.pending_months: Set[str] = set()
+        self.logger = logging.getLogger(__name__)
+
+    def ensure_indexes(self) -> List[str]:
+        created = []
+        for name, indexes in INDEXES.items():
+            try:
+                created.extend(self.db.db[name].create_indexes(indexes))
+            except Exception as e:
+                self.logger.warning("Index de %s non créés : %s", name, e)
+        return created
+
+    def record(self, listings: List[Dict[str, Any]], observed_at: Optional[datetime] = None) -> int:
+        """
+        Ajoute une observation par annonce, en un seul bulk_write.
+
+        Chaque annonce va dans le seau de son mois (créé au besoin) ;
+        retourne le nombre d'observations écrites.
+        """
+        if not listings:
+            return 0
+
+        operations = []
+        for listing in listings:
+            t = observed_at or listing.get('derniere_maj') or datetime.now()
+            mois = month_key(t)
+            point = {'t': t, 'prix': listing.get('prix'), 'vues': listing.get('popularite')}
+            operations.append(UpdateOne(
+                {'_id': f"{listing['url_annonce']}|{mois}"},
+                {
+                    '$push': {'points': point},
+                    '$inc': {'count': 1},
+                    '$min': {'prix_min': point['prix']},
+                    '$max': {'prix_max': point['prix']},
+                    '$set': {'dernier': point, 'quartier': listing.get('quartier'),
+                             'ville': listing.get('ville')},
+                    '$setOnInsert': {'url_annonce': listing['url_annonce'], 'mois': mois,
+                                     'premier': point}
+                },
+                upsert=True
+            ))
+            self.pending_months.add(mois)
+
+        try:
+            self.observations.bulk_write(operations, ordered=False)
+            return len(operations)
+        except BulkWriteError as e:
+            errors = len(e.details.get('writeErrors', []))
+            self.logger.error(f"Erreurs lors de l'écriture des observations : {errors}")
+            return len(operations) - errors
+        except Exception as e:
+            self.logger.error(f"Erreur lors de l'écriture des observations : {e}")
+            return 0
+
+    def refresh_rollups(self, months: Optional[Iterable[str]] = None) -> int:
+        """
+        Recalcule les agrégats ville / quartier / mois des mois indiqués
+        (par défaut, ceux touchés depuis le dernier appel).
+
+        Par quartier et par mois : nombre d'annonces observées, prix moyen
+        (dernier prix de chaque annonce), bornes de prix et vues gagnées
+        par jour. Les vues gagnées par jour de chaque annonce sont aussi
+        rangées dans son seau. Retourne le nombre d'agrégats écrits.
+        """
+        if months is None:
+            months, self.pending_months = self.pending_months, set()
+        months = sorted(set(months))
+        if not months:
+            return 0
+
+        try:
+            groups = list(self.observations.aggregate([
+                {"$match": {"mois": {"$in": months}}},
+                {"$group": {
+                    "_id": {"ville": "$ville", "quartier": "$quartier", "mois": "$mois"},
+                    "annonces": {"$sum": 1},
+                    "observations": {"$sum": "$count"},
+                    "prix_moyen": {"$avg": "$dernier.prix"},
+                    "prix_min": {"$min": "$prix_min"},
+                    "prix_max": {"$max": "$prix_max"},
+                    "vues_gagnees": {"$sum": {"$subtract": ["$dernier.vues", "$premier.vues"]}},
+                    # Durée cumulée d'observation des annonces, en millisecondes
+                    "duree_ms": {"$sum": {"$subtract": ["$dernier.t", "$premier.t"]}}
+                }}
+            ]))
+        except Exception as e:
+            self.logger.error(f"Erreur lors du calcul des agrégats d'observations : {e}")
+            return 0
+
+        now = datetime.now()
+        operations = []
+        for group in groups:
+            key = group.pop("_id")
+            jours = group.pop("duree_ms") / 86400000
+            rollup = {
+                "_id": f"{key['ville']}|{key['quartier']}|{key['mois']}",
+                **key,
+                **group,
+                "vues_par_jour": round(group["vues_gagnees"] / jours, 2) if jours else 0.0,
+                "calcule_le": now
+            }
+            operations.append(ReplaceOne({"_id": rollup["_id"]}, rollup, upsert=True))
+        if operations:
+            try:
+                self.rollups.bulk_write(operations, ordered=False)
+            except Exception as e:
+                self.logger.error(f"Erreur lors de l'écriture des agrégats d'observations : {e}")
+                return 0
+        self.logger.info("%d agrégat(s) d'observations recalculé(s) pour %s",
+                         len(operations), ', '.join(months))
+        self._refresh_velocity(months)
+        return len(operations)
+
+    def _refresh_velocity(self, months: List[str]) -> int:
+        """Range dans chaque seau des mois indiqués ses vues gagnées et vues gagnées par jour"""
+        try:
+            buckets = self.observations.aggregate([
+                {"$match": {"mois": {"$in": months}, "count": {"$gte": 2}}},
+                {"$project": {
+                    "vues_gagnees": {"$subtract": [{"$ifNull": ["$dernier.vues", 0]},
+                                                   {"$ifNull": ["$premier.vues", 0]}]},
+                    "duree_ms": {"$subtract": ["$dernier.t", "$premier.t"]}
+                }}
+            ])
+            operations = [
+                UpdateOne({"_id": bucket["_id"]}, {"$set": {
+                    "vues_gagnees": bucket["vues_gagnees"],
+                    "vues_par_jour": round(bucket["vues_gagnees"] * 86400000 / bucket["duree_ms"], 2)
+                }})
+                for bucket in buckets if bucket["duree_ms"] > 0
+            ]
+            if operations:
+                self.observations.bulk_write(operations, ordered=False)
+            return len(operations)
+        except Exception as e:
+            self.logger.error(f"Erreur lors du calcul des vues par jour : {e}")
+            return 0
+
+    def price_trend(self, ville: Optional[str] = None, quartier: Optional[str] = None,
+                    months: int = 12) -> List[Dict[str, Any]]:
+        """
+        Évolution mensuelle du prix moyen (du plus ancien au plus récent mois),
+        pour une ville, un quartier ou l'ensemble des annonces.
+
+        Le prix moyen de plusieurs quartiers est pondéré par leur nombre
+        d'annonces.
+        """
+        criteria = {}
+        if ville:
+            criteria["ville"] = ville
+        if quartier:
+            criteria["quartier"] = quartier
+        try:
+            rollups = list(self.rollups.find(criteria, {"mois": 1, "annonces": 1, "prix_moyen": 1,
+                                                        "prix_min": 1, "prix_max": 1}))
+        except Exception as e:
+            self.logger.error(f"Erreur lors de la lecture des tendances de prix : {e}")
+            return []
+
+        per_month: Dict[str, Dict[str, Any]] = {}
+        for rollup in rollups:
+            point = per_month.setdefault(rollup["mois"], {"mois": rollup["mois"], "annonces": 0,
+                                                          "total": 0.0, "prix_min": None,
+                                                          "prix_max": None})
+            point["annonces"] += rollup["annonces"]
+            point["total"] += (rollup["prix_moyen"] or 0) * rollup["annonces"]
+            for bound, pick in (("prix_min", min), ("prix_max", max)):
+                if rollup.get(bound) is not None:
+                    point[bound] = rollup[bound] if point[bound] is None \
+                        else pick(point[bound], rollup[bound])
+
+        trend = []
+        for mois in sorted(per_month)[-months:]:
+            point = per_month[mois]
+            total = point.pop("total")
+            point["prix_moyen"] = round(total / point["annonces"]) if point["annonces"] else 0
+            trend.append(point)
+        return trend
+
+    def quartier_trends(self, ville: str, months: int = 12) -> Dict[str, List[Dict[str, Any]]]:
+        """Tendance de prix de chaque quartier d'une ville"""
+        try:
+            quartiers = self.rollups.distinct("quartier", {"ville": ville})
+        except Exception as e:
+            self.logger.error(f"Erreur lors de la lecture des quartiers : {e}")
+            return {}
+        return {quartier: self.price_trend(ville, quartier, months)
+                for quartier in sorted(q for q in quartiers if q)}
+
+    def view_velocity(self, ville: Optional[str] = None, mois: Optional[str] = None,
+                      limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Annonces dont les vues progressent le plus vite (vues gagnées par
+        jour) sur un mois, par défaut le mois courant.
+
+        Lu par l'index (mois, [ville,] vues_par_jour) : les valeurs sont
+        celles du dernier refresh_rollups.
+        """
+        criteria = {"mois": mois or month_key(datetime.now()), "vues_par_jour": {"$exists": True}}
+        if ville:
+            criteria["ville"] = ville
+        try:
+            buckets = self.observations.find(
+                criteria, {"url_annonce": 1, "ville": 1, "quartier": 1, "dernier": 1,
+                           "vues_gagnees": 1, "vues_par_jour": 1}
+            ).sort("vues_par_jour", DESCENDING).limit(limit)
+            return [{
+                "url_annonce": bucket["url_annonce"],
+                "ville": bucket.get("ville"),
+                "quartier": bucket.get("quartier"),
+                "prix": bucket["dernier"]["prix"],
+                "vues": bucket["dernier"]["vues"],
+                "vues_gagnees": bucket["vues_gagnees"],
+                "vues_par_jour": bucket["vues_par_jour"]
+            } for bucket in buckets]
+        except Exception as e:
+            self.logger.error(f"Erreur lors de la lecture de la vélocité des vues : {e}")
+            return []
+
+    def history(self, url_annonce: str) -> List[Dict[str, Any]]:
+        """Toutes les observations d'une annonce, dans l'ordre chronologique"""
+        try:
+            buckets = self.observations.find({"url_annonce": url_annonce}).sort("mois", ASCENDING)
+            return [point for bucket in buckets for point in bucket["points"]]
+        except Exception as e:
+            self.logger.error(f"Erreur lors de la lecture de l'historique : {e}")
+            return []
+
+
+if __name__ == "__main__":
+    import argparse
+    from app.database.db_config import DatabaseConnection
+
+    parser = argparse.ArgumentParser(description="Historique des prix et des vues")
+    parser.add_argument('--ville', help="ville (toutes par défaut)")
+    parser.add_argument('--months', type=int, default=12, help="nombre de mois affichés")
+    parser.add_argument('--rollup', nargs='+', metavar='AAAA-MM',
+                        help="recalculer les agrégats de ces mois")
+    args = parser.parse_args()
+
+    store = ObservationStore(DatabaseConnection.shared())
+    if args.rollup:
+        print(f"{store.refresh_rollups(args.rollup)} agrégat(s) recalculé(s)")
+    print(f"Prix moyen mensuel ({args.ville or 'toutes les villes'}) :")
+    for point in store.price_trend(args.ville, months=args.months):
+        print(f"  {point['mois']} : {point['prix_moyen']:>10,} FCFA ({point['annonces']} annonces)")
+    print("Vues gagnées par jour (mois courant) :")
+    for item in store.view_velocity(args.ville):
+        print(f"  {item['vues_par_jour']:8.1f}  {item['quartier']}, {item['ville']} - {item['url_annonce']}")
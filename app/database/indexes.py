@@ -0,0 +1,170 @@
+"""
+Gestion des index de la collection `apartments`.
+
+Les index sont définis d'après les requêtes réelles du projet (filtres,
+tris, clés d'upsert). ensure_indexes() est idempotent : il est appelé au
+démarrage de l'application et par le scraper. explain_report() exécute
+explain() sur chaque forme de requête et signale celles qui parcourent
+toute la collection (COLLSCAN).
+
+    python -m app.database.indexes            # crée les index
+    python -m app.database.indexes --explain  # rapport COLLSCAN
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import logging
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+logger = logging.getLogger(__name__)
+
+INDEXES = [
+    # Clé des upserts du scraper
+    IndexModel([("url_annonce", ASCENDING)], unique=True, name="url_annonce_unique"),
+    # Filtres ville + budget (recommandations, statistiques par ville)
+    IndexModel([("ville", ASCENDING), ("prix", ASCENDING)], name="ville_prix"),
+    # Top des annonces les plus consultées par ville
+    IndexModel([("ville", ASCENDING), ("popularite", DESCENDING), ("prix", ASCENDING)],
+               name="ville_popularite_prix"),
+    # Top global (toutes les villes)
+    IndexModel([("popularite", DESCENDING), ("prix", ASCENDING)], name="popularite_prix"),
+    # Recherche par quartier (ApartmentClassifier.get_recommendations)
+    IndexModel([("ville", ASCENDING), ("quartier", ASCENDING), ("prix", ASCENDING)],
+               name="ville_quartier_prix"),
+    # Classification matérialisée : top par catégorie et reclassification
+    IndexModel([("classification", ASCENDING), ("popularite", DESCENDING)],
+               name="classification_popularite"),
+    IndexModel([("classification_version", ASCENDING)], name="classification_version"),
+    # Rafraîchissement incrémental de l'instantané en mémoire
+    IndexModel([("derniere_maj", DESCENDING)], name="derniere_maj"),
+]
+
+
+def ensure_indexes(db_connection) -> List[str]:
+    """Crée les index manquants ; retourne les noms des index en place"""
+    collection = db_connection.db.apartments
+    created = []
+    for index in INDEXES:
+        try:
+            created.extend(collection.create_indexes([index]))
+        except Exception as e:
+            logger.warning("Index %s non créé : %s", index.document['name'], e)
+    return created
+
+
+@dataclass
+class QueryShape:
+    """Forme d'une requête du projet, rejouée par explain()"""
+    name: str
+    filter: Dict[str, Any] = field(default_factory=dict)
+    sort: Optional[List] = None
+    limit: int = 0
+    pipeline: Optional[List[Dict[str, Any]]] = None
+    # Parcours complet attendu (chargement de toute la collection, agrégat global)
+    full_scan: bool = False
+
+
+def query_shapes(db_connection) -> List[QueryShape]:
+    """
+    Formes des requêtes exécutées par l'application.
+
+    Les pipelines du tableau de bord et les requêtes de la classification
+    sont produits par leurs propres constructeurs : le rapport suit donc
+    le code au lieu d'en garder une copie.
+    """
+    from app.models.classification import TOP_SORT, ApartmentClassifier
+    from app.visualizations.charts import AppartementVisualizer
+    from app.visualizations.dashboard import DASHBOARD_VILLES
+
+    classifier = ApartmentClassifier(db_connection)
+    villes = [ville for ville in DASHBOARD_VILLES if ville]
+    return [
+        QueryShape("snapshot.chargement_complet", full_scan=True),
+        QueryShape("snapshot.incremental", {"derniere_maj": {"$gte": datetime(2024, 1, 1)}}),
+        QueryShape("snapshot.derniere_maj", {"derniere_maj": {"$exists": True}},
+                   sort=[("derniere_maj", DESCENDING)], limit=1),
+        QueryShape("scraper.upsert", {"url_annonce": "https://koutchoumi.com/x.html",
+                                      "empreinte": {"$ne": "0"}}),
+        QueryShape("db.par_ville", {"ville": "Douala"}),
+        QueryShape("classifier.recommandations",
+                   {"ville": "Douala", "prix": {"$lte": 300000}, "nb_chambres": {"$gte": 2},
+                    "quartier": "Akwa"},
+                   sort=[("popularite", DESCENDING)], limit=5),
+        # Une seule agrégation $facet sur toute la collection, hors requête HTTP
+        QueryShape("dashboard.facet", full_scan=True,
+                   pipeline=AppartementVisualizer._dashboard_pipeline(villes, 5)),
+        QueryShape("classifier.effectifs", pipeline=classifier.counts_pipeline()),
+        *[QueryShape(f"classifier.top.{category}", classifier.top_filter(category),
+                     sort=TOP_SORT, limit=5)
+          for category in classifier.categories],
+        QueryShape("classifier.a_reclasser", classifier.pending_filter()),
+    ]
+
+
+def _plan_stages(node: Any) -> List[str]:
+    """Liste de tous les étages (stage) présents dans une sortie explain()"""
+    stages = []
+    if isinstance(node, dict):
+        if isinstance(node.get('stage'), str):
+            stages.append(node['stage'])
+        for key, value in node.items():
+            if key != 'rejectedPlans':
+                stages.extend(_plan_stages(value))
+    elif isinstance(node, list):
+        for item in node:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+def explain_report(db_connection) -> List[Dict[str, Any]]:
+    """
+    Exécute explain() sur chaque forme de requête du projet.
+
+    Chaque entrée indique les étages du plan retenu et `flagged` quand un
+    COLLSCAN apparaît sur une requête qui devrait utiliser un index.
+    """
+    collection = db_connection.db.apartments
+    report = []
+    for shape in query_shapes(db_connection):
+        try:
+            if shape.pipeline is not None:
+                explain = db_connection.db.command(
+                    'aggregate', collection.name, pipeline=shape.pipeline, explain=True
+                )
+            else:
+                cursor = collection.find(shape.filter)
+                if shape.sort:
+                    cursor = cursor.sort(shape.sort)
+                if shape.limit:
+                    cursor = cursor.limit(shape.limit)
+                explain = cursor.explain()
+            stages = _plan_stages(explain.get('queryPlanner', explain))
+            collscan = 'COLLSCAN' in stages
+            report.append({
+                'query': shape.name,
+                'stages': stages,
+                'collscan': collscan,
+                'flagged': collscan and not shape.full_scan
+            })
+        except Exception as e:
+            report.append({'query': shape.name, 'error': str(e), 'flagged': True})
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    from app.database.db_config import DatabaseConnection
+
+    parser = argparse.ArgumentParser(description="Index de la collection apartments")
+    parser.add_argument('--explain', action='store_true', help="rapport explain() / COLLSCAN")
+    args = parser.parse_args()
+
+    db = DatabaseConnection.shared()
+    print(f"Index en place : {', '.join(ensure_indexes(db))}")
+    if args.explain:
+        for entry in explain_report(db):
+            status = "⚠️  COLLSCAN" if entry['flagged'] else "✅"
+            detail = entry.get('error') or ' > '.join(entry['stages'])
+            print(f"{status} {entry['query']}: {detail}")
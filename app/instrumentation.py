@@ -0,0 +1,245 @@
+"""
+Instrumentation des requêtes : spans, histogrammes de latence et profilage.
+
+- span(name) / timed(name) mesurent une étape (recommandation,
+  classification, rendu d'un graphique...). Les commandes MongoDB sont
+  mesurées par CommandTimer (écouteur pymongo) et les templates Jinja par
+  les signaux de Flask.
+- Pendant une requête, les spans sont regroupés par nom et renvoyés dans
+  l'en-tête Server-Timing (les spans imbriqués se recouvrent : chacun donne
+  sa durée totale).
+- Toutes les durées alimentent des histogrammes (par processus), exposés
+  au format texte Prometheus par la route /metrics.
+- Profilage à la demande : avec PROFILING_ENABLED=1, une requête portant
+  l'en-tête `X-Profile` est profilée par cProfile ; le profil est écrit dans
+  PROFILE_DIR (`X-Profile: text` renvoie directement le rapport pstats).
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Dict, List, Optional, Tuple
+import cProfile
+import io
+import os
+import pstats
+import tempfile
+import threading
+import time
+
+from pymongo.monitoring import CommandListener
+
+# Bornes des histogrammes, en secondes
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Spans de la requête en cours : nom -> [durée cumulée (s), nombre]
+_request_spans: ContextVar[Optional[Dict[str, List[float]]]] = ContextVar('request_spans', default=None)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        index = 0
+        while index < len(self.buckets) and seconds > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+
+
+class MetricsRegistry:
+    """Histogrammes de latence par famille (span, requête HTTP) et jeu d'étiquettes"""
+
+    def __init__(self):
+        self._histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, family: str, seconds: float, **labels: str):
+        key = (family, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def render(self, gauges: Optional[Dict[str, float]] = None) -> str:
+        """Format d'exposition texte de Prometheus"""
+        lines = []
+        with self._lock:
+            items = sorted(self._histograms.items())
+            families = sorted({family for (family, _), _ in items})
+            for family in families:
+                lines.append(f"# TYPE {family} histogram")
+                for (name, labels), histogram in items:
+                    if name != family:
+                        continue
+                    base = ','.join(f'{key}="{value}"' for key, value in labels)
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f'{family}_bucket{{{base}{"," if base else ""}le="{le}"}} {cumulative}')
+                    lines.append(f"{family}_sum{{{base}}} {histogram.sum:.6f}")
+                    lines.append(f"{family}_count{{{base}}} {histogram.count}")
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = MetricsRegistry()
+
+
+def record(name: str, seconds: float):
+    """Enregistre la durée d'une étape (histogramme et requête en cours)"""
+    METRICS.observe('koutchoumi_span_seconds', seconds, span=name)
+    spans = _request_spans.get()
+    if spans is not None:
+        entry = spans.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+
+@contextmanager
+def span(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def timed(name: str) -> Callable:
+    """Décorateur : mesure chaque appel de la fonction sous le span `name`"""
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class CommandTimer(CommandListener):
+    """Durée de chaque commande MongoDB (find, aggregate, update...)"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        record(f"mongo.{event.command_name}", event.duration_micros / 1e6)
+
+    def failed(self, event):
+        record(f"mongo.{event.command_name}", event.duration_micros / 1e6)
+
+
+def server_timing(spans: Dict[str, List[float]], total: float) -> str:
+    """Valeur de l'en-tête Server-Timing (spans triés par durée décroissante)"""
+    entries = [f'{name};dur={seconds * 1000:.1f};desc="{count}x"'
+               for name, (seconds, count) in sorted(spans.items(), key=lambda item: -item[1][0])]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ', '.join(entries)
+
+
+class RequestProfiler:
+    """Profilage cProfile d'une requête à la fois (profileur unique par processus)"""
+
+    def __init__(self, profile_dir: str):
+        self.profile_dir = profile_dir
+        self._lock = threading.Lock()
+
+    def start(self) -> Optional[cProfile.Profile]:
+        if not self._lock.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def stop(self, profiler: cProfile.Profile, name: str) -> Tuple[str, str]:
+        """Arrête le profil, l'écrit sur disque ; retourne (fichier, rapport texte)"""
+        try:
+            profiler.disable()
+        finally:
+            self._lock.release()
+        os.makedirs(self.profile_dir, exist_ok=True)
+        filename = f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof"
+        profiler.dump_stats(os.path.join(self.profile_dir, filename))
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(40)
+        return filename, report.getvalue()
+
+    def abort(self, profiler: cProfile.Profile):
+        """Arrête le profil sans rapport (requête interrompue par une exception)"""
+        try:
+            profiler.disable()
+        finally:
+            self._lock.release()
+
+
+def init_app(app):
+    """Branche les spans, Server-Timing, les histogrammes et le profilage sur l'application"""
+    from flask import g, request, before_render_template, template_rendered
+
+    profiler = RequestProfiler(os.environ.get(
+        'PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'koutchoumi_profiles')
+    ))
+    profiling_enabled = os.environ.get('PROFILING_ENABLED', '0') == '1'
+
+    @app.before_request
+    def start_request():
+        g.request_started = time.perf_counter()
+        g.request_spans_token = _request_spans.set({})
+        g.profiler = None
+        if profiling_enabled and request.headers.get('X-Profile'):
+            g.profiler = profiler.start()
+
+    @app.after_request
+    def finish_request(response):
+        started = g.pop('request_started', None)
+        spans = _request_spans.get()
+        if started is None or spans is None:
+            return response
+        total = time.perf_counter() - started
+        METRICS.observe('koutchoumi_request_seconds', total,
+                        endpoint=request.endpoint or 'none', method=request.method)
+        response.headers['Server-Timing'] = server_timing(spans, total)
+
+        active = g.pop('profiler', None)
+        if active is not None:
+            filename, report = profiler.stop(active, request.endpoint or 'none')
+            response.headers['X-Profile-File'] = filename
+            if request.headers.get('X-Profile') == 'text':
+                response.set_data(report)
+                response.mimetype = 'text/plain'
+        elif profiling_enabled and request.headers.get('X-Profile'):
+            response.headers['X-Profile-File'] = 'busy'
+        return response
+
+    @app.teardown_request
+    def reset_request(exc):
+        active = g.pop('profiler', None)
+        if active is not None:
+            profiler.abort(active)
+        token = g.pop('request_spans_token', None)
+        if token is not None:
+            _request_spans.reset(token)
+
+    def template_started(sender, template, context, **extra):
+        g.setdefault('template_starts', []).append(time.perf_counter())
+
+    def template_finished(sender, template, context, **extra):
+        starts = g.get('template_starts')
+        if starts:
+            record(f"template.{template.name}", time.perf_counter() - starts.pop())
+
+    before_render_template.connect(template_started, app, weak=False)
+    template_rendered.connect(template_finished, app, weak=False)
@@ -0,0 +1,63 @@
+"""
+Configuration du logging de l'application et des scripts.
+
+Les threads applicatifs (workers Gunicorn, scraper, rafraîchissement du
+tableau de bord) déposent les enregistrements dans une file (QueueHandler)
+et l'écriture sur la sortie standard est faite par un thread dédié
+(QueueListener). Le message est toutefois mis en forme dans le thread
+appelant (QueueHandler.prepare fusionne msg et args, et y ajoute la trace
+d'une exception) : seuls la ligne finale (LOG_FORMAT) et l'écriture sont
+faites par le listener. Une requête n'attend donc jamais les entrées /
+sorties du logging, et les lignes de threads différents ne s'entremêlent
+plus.
+
+Le niveau est lu dans LOG_LEVEL (INFO par défaut). Les modules gardent leur
+`logging.getLogger(__name__)` ; seuls les points d'entrée (create_app et les
+blocs __main__) appellent configure_logging.
+"""
+
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional, Union
+import atexit
+import logging
+import os
+import queue
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - [%(threadName)s] %(name)s - %(message)s'
+
+_listener: Optional[QueueListener] = None
+
+
+def configure_logging(level: Union[int, str, None] = None) -> QueueListener:
+    """
+    Branche le logger racine sur une file consommée par un thread d'écriture.
+
+    Idempotent : un second appel ne modifie que le niveau. Retourne le
+    QueueListener (arrêté et vidé automatiquement à la sortie du processus).
+    """
+    global _listener
+    root = logging.getLogger()
+    level = level or os.environ.get('LOG_LEVEL', 'INFO')
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    if _listener is not None:
+        return _listener
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    records = queue.SimpleQueue()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(QueueHandler(records))
+
+    _listener = QueueListener(records, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Écrit les enregistrements en attente et arrête le thread d'écriture"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -18,27 +18,90 @@ Caractéristiques moyennes par catégorie :
 
 try:
     from ..database.db_config import DatabaseConnection
+    from ..instrumentation import timed
 except ImportError:
     from app.database.db_config import DatabaseConnection
+    from app.instrumentation import timed
 
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Sequence
+from pymongo import UpdateOne
+import numpy as np
 import pandas as pd
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ['Low Cost', 'Moyen', 'Luxueux']
+
+@dataclass(frozen=True)
+class ClassificationRule:
+    """
+    Règle de classification : la catégorie s'applique si toutes les bornes
+    renseignées sont respectées (prix ≥ min_price, prix ≤ max_price,
+    chambres ≥ min_rooms). Les règles sont évaluées dans l'ordre.
+    """
+    category: str
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    min_rooms: Optional[float] = None
+
+    def mask(self, prix: np.ndarray, chambres: np.ndarray) -> np.ndarray:
+        condition = np.ones(len(prix), dtype=bool)
+        if self.min_price is not None:
+            condition &= prix >= self.min_price
+        if self.max_price is not None:
+            condition &= prix <= self.max_price
+        if self.min_rooms is not None:
+            condition &= chambres >= self.min_rooms
+        return condition
+
+# Marché camerounais (Yaoundé / Douala)
+DEFAULT_RULES = (
+    ClassificationRule('Low Cost', max_price=350_000),
+    ClassificationRule('Luxueux', min_price=1_500_000),
+    ClassificationRule('Luxueux', min_price=1_000_000, min_rooms=4),
+)
+DEFAULT_CATEGORY = 'Moyen'
+
+def rules_version(rules: Sequence[ClassificationRule], default: str) -> str:
+    """Empreinte d'une table de règles : un changement force la reclassification"""
+    return hashlib.sha1(repr((tuple(rules), default)).encode()).hexdigest()[:12]
+
+# Version des règles par défaut, stockée avec chaque classification
+CLASSIFICATION_VERSION = rules_version(DEFAULT_RULES, DEFAULT_CATEGORY)
+
+# Documents pris en compte par la classification
+ELIGIBLE_FILTER = {
+    "prix": {"$exists": True, "$ne": None},
+    "nb_chambres": {"$exists": True, "$ne": None},
+    "popularite": {"$exists": True, "$ne": None}
+}
+
+# Document de la collection `meta` contenant le nombre d'annonces par catégorie
+COUNTS_META_ID = "classification"
+
+# Top par catégorie du résumé (index classification_popularite)
+TOP_SORT = [("popularite", -1)]
+TOP_PROJECTION = {"titre": 1, "prix": 1, "nb_chambres": 1, "quartier": 1, "ville": 1, "popularite": 1}
 
 class ApartmentClassifier:
-    def __init__(self):
-        self.db = DatabaseConnection()
+    def __init__(self, db=None, rules: Sequence[ClassificationRule] = DEFAULT_RULES,
+                 default_category: str = DEFAULT_CATEGORY, categories: Sequence[str] = CATEGORIES):
+        self.db = db if db is not None else DatabaseConnection.shared()
+        self.rules = tuple(rules)
+        self.default_category = default_category
+        self.categories = list(categories)
+        self.version = rules_version(self.rules, self.default_category)
     
     def get_apartments_data(self):
         """Récupère les données des appartements depuis MongoDB"""
         try:
             # Pipeline d'agrégation MongoDB pour obtenir les champs nécessaires
             pipeline = [
-                {
-                    "$match": {
-                        "prix": {"$exists": True, "$ne": None},
-                        "nb_chambres": {"$exists": True, "$ne": None},
-                        "popularite": {"$exists": True, "$ne": None}
-                    }
-                },
+                {"$match": ELIGIBLE_FILTER},
                 {
                     "$project": {
                         "_id": 1,
@@ -54,7 +117,7 @@ class ApartmentClassifier:
             
             return list(self.db.db.apartments.aggregate(pipeline))
         except Exception as e:
-            print(f"Erreur lors de la récupération des données: {e}")
+            logger.error(f"Erreur lors de la récupération des données: {e}")
             return []
     
     def get_category(self, row):
@@ -74,62 +137,247 @@ class ApartmentClassifier:
         """
         prix = float(row['prix'])
         chambres = float(row['nb_chambres'])
-        
-        if prix <= 350000:
-            return "Low Cost"
-        elif prix >= 1500000 or (prix >= 1000000 and chambres >= 4):
-            return "Luxueux"
-        else:
-            return "Moyen"
+        return self.classify_arrays(np.array([prix]), np.array([chambres]))[0]
+
+    def classify_arrays(self, prix, chambres) -> np.ndarray:
+        """
+        Classe des tableaux bruts de prix et de nombres de chambres.
+
+        Les règles sont appliquées colonne par colonne (np.select) ; une valeur
+        manquante (NaN) ne satisfait aucune borne.
+
+        Returns:
+            np.ndarray: Catégorie de chaque appartement (dtype object)
+        """
+        prix = np.asarray(prix, dtype=float)
+        chambres = np.asarray(chambres, dtype=float)
+        return np.select(
+            [rule.mask(prix, chambres) for rule in self.rules],
+            [rule.category for rule in self.rules],
+            default=self.default_category
+        ).astype(object)
+
+    def classify_frame(self, df: pd.DataFrame) -> pd.Series:
+        """Classe toutes les lignes d'un DataFrame (colonnes prix et nb_chambres)"""
+        categories = self.classify_arrays(
+            pd.to_numeric(df['prix'], errors='coerce'),
+            pd.to_numeric(df['nb_chambres'], errors='coerce')
+        )
+        return pd.Series(
+            pd.Categorical(categories, categories=self.categories),
+            index=df.index,
+            name='categorie'
+        )
     
+    @timed('classifier.classify')
     def classify_apartments(self):
         """Classifie les appartements et retourne les résultats"""
         data = self.get_apartments_data()
         if not data:
-            print("Aucune donnée trouvée dans la base de données")
+            logger.warning("Aucune donnée trouvée dans la base de données")
             return None
         
         # Convertir les données MongoDB en DataFrame
         df = pd.DataFrame(data)
-        df['categorie'] = df.apply(self.get_category, axis=1)
+        df['categorie'] = self.classify_frame(df)
         
-        self.display_results(df)
+        # Rapport construit seulement si le niveau DEBUG est actif
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s", self.format_report(df))
         return df
     
-    def display_results(self, df):
-        """Affiche les résultats détaillés de la classification"""
-        print("\n=== CLASSIFICATION DES APPARTEMENTS ===")
-        print("\nCritères de classification:")
-        print("- Low Cost  : ≤ 350k FCFA")
-        print("- Moyen     : Entre 350k et 1.5M FCFA")
-        print("- Luxueux   : ≥ 1.5M FCFA ou ≥ 1M FCFA avec ≥ 4 chambres")
-        print(f"\nNombre total d'appartements : {len(df)}\n")
+    def pending_filter(self):
+        """Documents à (re)classer : jamais classés ou classés avec d'autres règles"""
+        return {
+            **ELIGIBLE_FILTER,
+            "$or": [
+                {"classification": {"$exists": False}},
+                {"classification_version": {"$ne": self.version}}
+            ]
+        }
+
+    def counts_pipeline(self):
+        """Agrégation du nombre d'annonces par catégorie"""
+        return [
+            {"$match": {**ELIGIBLE_FILTER, "classification": {"$in": self.categories}}},
+            {"$group": {"_id": "$classification", "count": {"$sum": 1}}}
+        ]
+
+    @staticmethod
+    def top_filter(category):
+        """Filtre du top d'une catégorie (trié par TOP_SORT)"""
+        return {**ELIGIBLE_FILTER, "classification": category}
+
+    @timed('classifier.refresh')
+    def refresh_classifications(self, batch_size=1000):
+        """
+        Classe uniquement les documents nouveaux ou modifiés.
+
+        La catégorie est matérialisée dans le champ `classification` de chaque
+        document. Le scraper classe les annonces à l'ingestion ; une mise à
+        jour du prix ou des chambres par DatabaseConnection.update_apartment
+        retire ce champ. Restent à classer les documents sans classification
+        ou classés avec d'autres règles.
+
+        Le nombre d'annonces par catégorie est ensuite recalculé et publié
+        dans `meta` (lu par get_classification_summary), seulement si tout
+        s'est bien passé. Appelé par le scraper et en ligne de commande, jamais
+        pendant une requête. Retourne le nombre de documents (re)classés.
+        """
+        try:
+            pending = self.db.db.apartments.find(
+                self.pending_filter(), {"prix": 1, "nb_chambres": 1}
+            ).batch_size(batch_size)
+
+            updated = 0
+            batch = []
+            for doc in pending:
+                batch.append(doc)
+                if len(batch) >= batch_size:
+                    updated += self._write_classifications(batch)
+                    batch = []
+            if batch:
+                updated += self._write_classifications(batch)
+            self._store_counts()
+            return updated
+        except Exception as e:
+            logger.error(f"Erreur lors de la mise à jour des classifications: {e}")
+            return 0
+
+    def _store_counts(self):
+        """Publie le nombre d'annonces par catégorie (une agrégation par rafraîchissement)"""
+        counts = {category: 0 for category in self.categories}
+        for row in self.db.db.apartments.aggregate(self.counts_pipeline()):
+            counts[row["_id"]] = row["count"]
+        self.db.db.meta.update_one(
+            {"_id": COUNTS_META_ID},
+            {"$set": {"counts": counts, "version": self.version, "calcule_le": datetime.now()}},
+            upsert=True
+        )
+        return counts
+
+    def get_category_counts(self):
+        """
+        Nombre d'annonces par catégorie, publié par le dernier rafraîchissement.
+
+        None si aucun rafraîchissement n'a encore réussi avec les règles
+        actuelles (lancer `python -m app.models.classification`).
+        """
+        meta = self.db.db.meta.find_one({"_id": COUNTS_META_ID})
+        if not meta or meta.get("version") != self.version:
+            return None
+        return meta.get("counts")
+
+    def tag_documents(self, docs):
+        """Ajoute classification et classification_version à des documents (ex: à l'ingestion)"""
+        if not docs:
+            return docs
+        categories = self.classify_arrays(
+            pd.to_numeric(pd.Series([doc.get('prix') for doc in docs]), errors='coerce'),
+            pd.to_numeric(pd.Series([doc.get('nb_chambres') for doc in docs]), errors='coerce')
+        )
+        for doc, category in zip(docs, categories):
+            doc['classification'] = category
+            doc['classification_version'] = self.version
+        return docs
+
+    def _write_classifications(self, docs):
+        now = datetime.now()
+        self.tag_documents(docs)
+        operations = [
+            UpdateOne(
+                {"_id": doc["_id"]},
+                {"$set": {
+                    "classification": doc["classification"],
+                    "classification_version": doc["classification_version"],
+                    "classifie_le": now
+                }}
+            )
+            for doc in docs
+        ]
+        return self.db.db.apartments.bulk_write(operations, ordered=False).modified_count
+
+    @timed('classifier.summary')
+    def get_classification_summary(self, limit=5):
+        """
+        Résultats groupés par catégorie, lus depuis la classification matérialisée.
+
+        Les effectifs viennent du document `meta` tenu à jour par
+        refresh_classifications ; les top `limit` sont lus par l'index
+        (classification, popularite). Le coût ne dépend donc pas de la taille
+        de la collection.
+
+        Retourne {catégorie: {'count': int, 'apartments': [top `limit` par popularité]}}
+        ou None si aucun appartement n'est classé.
+        """
+        try:
+            counts = self.get_category_counts()
+            if not counts:
+                logger.warning("Classification non disponible : lancer `python -m app.models.classification`")
+                return None
+            if not any(counts.values()):
+                return None
+
+            summary = {}
+            for category in self.categories:
+                apartments = list(self.db.db.apartments.find(
+                    self.top_filter(category), TOP_PROJECTION
+                ).sort(TOP_SORT).limit(limit))
+                summary[category] = {
+                    'count': counts.get(category, 0),
+                    'apartments': apartments
+                }
+            return summary
+        except Exception as e:
+            logger.error(f"Erreur lors de la lecture des classifications: {e}")
+            return None
+
+    def format_report(self, df) -> str:
+        """Rapport détaillé de la classification (top 5 et statistiques par catégorie)"""
+        lines = [
+            "=== CLASSIFICATION DES APPARTEMENTS ===",
+            "",
+            "Critères de classification:",
+            "- Low Cost  : ≤ 350k FCFA",
+            "- Moyen     : Entre 350k et 1.5M FCFA",
+            "- Luxueux   : ≥ 1.5M FCFA ou ≥ 1M FCFA avec ≥ 4 chambres",
+            "",
+            f"Nombre total d'appartements : {len(df)}",
+            ""
+        ]
         
-        for category in ['Low Cost', 'Moyen', 'Luxueux']:
+        for category in self.categories:
             category_df = df[df['categorie'] == category]
             count = len(category_df)
             if count == 0:
                 continue
                 
             percentage = (count / len(df)) * 100
-            print(f"{category.upper()} ({count} appartements - {percentage:.1f}%)")
-            print("-" * 80)
+            lines.append(f"{category.upper()} ({count} appartements - {percentage:.1f}%)")
+            lines.append("-" * 80)
             
             top_5 = category_df.nlargest(5, 'popularite')
             
-            for _, apt in top_5.iterrows():
-                print(f"Titre    : {apt['titre']}")
-                print(f"Prix     : {apt['prix']:,} FCFA")
-                print(f"Quartier : {apt['quartier']}, {apt['ville']}")
-                print(f"Vue      : {apt['popularite']} vues")
-                print("- " * 20)
+            for apt in top_5.itertuples(index=False):
+                lines.append(f"Titre    : {apt.titre}")
+                lines.append(f"Prix     : {apt.prix:,} FCFA")
+                lines.append(f"Quartier : {apt.quartier}, {apt.ville}")
+                lines.append(f"Vue      : {apt.popularite} vues")
+                lines.append("- " * 20)
             
-            print(f"\nStatistiques de la catégorie {category}:")
-            print(f"Prix moyen     : {category_df['prix'].mean():,.0f} FCFA")
-            print(f"Prix médian    : {category_df['prix'].median():,.0f} FCFA")
-            print(f"Chambres moy.  : {category_df['nb_chambres'].mean():.1f}")
-            print(f"Popularité moy.: {category_df['popularite'].mean():.1f} vues")
-            print("=" * 80 + "\n")
+            lines.append("")
+            lines.append(f"Statistiques de la catégorie {category}:")
+            lines.append(f"Prix moyen     : {category_df['prix'].mean():,.0f} FCFA")
+            lines.append(f"Prix médian    : {category_df['prix'].median():,.0f} FCFA")
+            lines.append(f"Chambres moy.  : {category_df['nb_chambres'].mean():.1f}")
+            lines.append(f"Popularité moy.: {category_df['popularite'].mean():.1f} vues")
+            lines.append("=" * 80)
+            lines.append("")
+        return "\n".join(lines)
+
+    def display_results(self, df):
+        """Affiche le rapport de classification (commande `--report`)"""
+        print(self.format_report(df))
     
     def get_recommendations(self, ville, salaire, quartier=None, nb_personnes=1):
         """
@@ -160,9 +408,22 @@ class ApartmentClassifier:
             return recommendations
             
         except Exception as e:
-            print(f"Erreur lors de la recherche de recommandations: {e}")
+            logger.error(f"Erreur lors de la recherche de recommandations: {e}")
             return []
 
 if __name__ == "__main__":
+    import argparse
+    from app.logging_config import configure_logging
+
+    parser = argparse.ArgumentParser(description="Classification des appartements")
+    parser.add_argument('--report', action='store_true',
+                        help="afficher le rapport détaillé par catégorie")
+    args = parser.parse_args()
+
+    configure_logging()
     classifier = ApartmentClassifier()
-    classifier.classify_apartments()
\ No newline at end of file
+    print(f"{classifier.refresh_classifications()} appartement(s) classé(s)")
+    if args.report:
+        df = classifier.classify_apartments()
+        if df is not None:
+            classifier.display_results(df)
\ No newline at end of file
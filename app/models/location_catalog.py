@@ -0,0 +1,85 @@
+"""
+Catalogue des villes et quartiers connus, pour la validation et
+l'autocomplétion du formulaire.
+
+Construit une fois par instantané de données (snapshot.derive) : les noms
+sont normalisés une seule fois (accents, casse, espaces) et les quartiers
+de chaque ville sont rangés dans un tableau trié, ce qui permet de
+compléter un préfixe par recherche dichotomique (bisect). Les résultats de
+validation sont mis en cache dans un LRU borné, abandonné avec l'instantané.
+"""
+
+from bisect import bisect_left
+from difflib import get_close_matches
+from typing import Dict, Iterable, List, Optional
+
+try:
+    from .quartier_index import normalize_name
+    from ..cache import LRUCache
+except ImportError:
+    from app.models.quartier_index import normalize_name
+    from app.cache import LRUCache
+
+
+class LocationCatalog:
+    def __init__(self, ville_quartiers: Dict[str, Iterable[str]], cache_size: int = 1024):
+        self.villes: Dict[str, str] = {}
+        # Par ville normalisée : clés triées et nom d'affichage de chaque clé
+        self.keys: Dict[str, List[str]] = {}
+        self.names: Dict[str, Dict[str, str]] = {}
+        for ville, quartiers in ville_quartiers.items():
+            if not isinstance(ville, str):
+                continue
+            ville_key = normalize_name(ville)
+            self.villes.setdefault(ville_key, ville)
+            names = self.names.setdefault(ville_key, {})
+            for quartier in quartiers:
+                if isinstance(quartier, str) and normalize_name(quartier):
+                    names.setdefault(normalize_name(quartier), quartier)
+        for ville_key, names in self.names.items():
+            self.keys[ville_key] = sorted(names)
+        self._validations = LRUCache(maxsize=cache_size)
+
+    @classmethod
+    def from_snapshot(cls, snapshot, ville_quartiers: Dict[str, set]) -> 'LocationCatalog':
+        return cls(ville_quartiers)
+
+    def ville(self, ville: str) -> Optional[str]:
+        """Nom de la ville tel qu'il figure dans les données (None si inconnue)"""
+        return self.villes.get(normalize_name(ville))
+
+    def is_valid(self, ville: str, quartier: str) -> bool:
+        """
+        Vrai si la ville est connue et si le quartier correspond à l'un des
+        siens : exactement, par préfixe (dans un sens ou l'autre) ou de
+        façon approchée (ratio ≥ 0.8).
+        """
+        key = (normalize_name(ville), normalize_name(quartier))
+        return self._validations.get_or_set(key, lambda: self._validate(*key))
+
+    def _validate(self, ville_key: str, query: str) -> bool:
+        keys = self.keys.get(ville_key)
+        if keys is None:
+            return False
+        if query in self.names[ville_key] or self._completions(keys, query, 1):
+            return True
+        # Quartier connu préfixe de la saisie
+        if any(query.startswith(key) for key in keys):
+            return True
+        return bool(get_close_matches(query, keys, n=1, cutoff=0.8))
+
+    def complete(self, ville: str, prefix: str, limit: int = 10) -> List[str]:
+        """Quartiers de la ville commençant par `prefix`, par ordre alphabétique"""
+        keys = self.keys.get(normalize_name(ville), [])
+        names = self.names.get(normalize_name(ville), {})
+        return [names[key] for key in self._completions(keys, normalize_name(prefix), limit)]
+
+    @staticmethod
+    def _completions(keys: List[str], prefix: str, limit: int) -> List[str]:
+        start = bisect_left(keys, prefix)
+        matches = []
+        for key in keys[start:start + limit]:
+            if not key.startswith(prefix):
+                break
+            matches.append(key)
+        return matches
@@ -0,0 +1,104 @@
+"""
+Statistiques de marché pré-calculées par instantané.
+
+Prix (moyen, médian, min, max) et popularité (moyenne, max) sont calculés
+une seule fois par instantané de données pour chaque ville, chaque couple
+(ville, quartier) et chaque nombre de chambres (par ville, par quartier et
+toutes villes confondues), puis rangés dans une table : une consultation
+est un simple accès au dictionnaire.
+
+Chaque niveau de regroupement est calculé par un seul groupby().agg() sur
+les colonnes prix et popularite. Les moyennes peuvent différer d'un calcul
+à la demande (Series.mean) au dernier chiffre près, la sommation de groupby
+étant compensée ; médiane, bornes et effectifs sont identiques.
+"""
+
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import pandas as pd
+
+StatsKey = Tuple[Optional[str], Optional[str], Optional[int]]
+
+# Regroupements pré-calculés (colonnes de clé), en plus de l'ensemble des annonces
+GROUPINGS = [
+    ('ville',),
+    ('ville', 'quartier'),
+    ('ville', 'nb_chambres'),
+    ('ville', 'quartier', 'nb_chambres'),
+    ('nb_chambres',),
+]
+
+
+def stats_key(ville: Optional[str] = None, quartier: Optional[str] = None,
+              nb_chambres: Optional[int] = None) -> StatsKey:
+    return (
+        ville.lower() if ville is not None else None,
+        quartier.lower() if quartier is not None else None,
+        int(nb_chambres) if nb_chambres is not None else None
+    )
+
+
+# Statistiques d'un groupe : argument de `make` -> (colonne, réduction)
+AGGREGATES = dict(
+    avg_price=('prix', 'mean'),
+    median_price=('prix', 'median'),
+    min_price=('prix', 'min'),
+    max_price=('prix', 'max'),
+    avg_popularity=('popularite', 'mean'),
+    max_popularity=('popularite', 'max'),
+    count=('prix', 'size')
+)
+
+
+def _summary(prix: pd.Series, popularite: pd.Series) -> Dict[str, Any]:
+    return dict(
+        avg_price=prix.mean(),
+        median_price=prix.median(),
+        min_price=prix.min(),
+        max_price=prix.max(),
+        avg_popularity=popularite.mean(),
+        max_popularity=popularite.max(),
+        count=len(prix)
+    )
+
+
+class MarketStats:
+    def __init__(self, table: Dict[StatsKey, Any]):
+        self.table = table
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, make: Callable[..., Any]) -> 'MarketStats':
+        """
+        Construit la table à partir d'un DataFrame prétraité ; `make` reçoit
+        les statistiques d'un groupe en arguments nommés.
+        """
+        if len(df) == 0:
+            return cls({})
+
+        frame = pd.DataFrame({
+            'ville': df['ville'].str.lower(),
+            'quartier': df['quartier'].str.lower(),
+            'nb_chambres': df['nb_chambres'],
+            'prix': df['prix'],
+            'popularite': df['popularite']
+        })
+
+        table = {stats_key(): make(**_summary(frame['prix'], frame['popularite']))}
+        for columns in GROUPINGS:
+            summary = frame.groupby(list(columns), sort=False, dropna=True).agg(**AGGREGATES)
+            for values, row in zip(summary.index, summary.to_dict('records')):
+                values = values if isinstance(values, tuple) else (values,)
+                table[stats_key(**dict(zip(columns, values)))] = make(**row)
+        return cls(table)
+
+    @classmethod
+    def from_snapshot(cls, snapshot, make: Callable[..., Any]) -> 'MarketStats':
+        return cls.from_frame(snapshot.df, make)
+
+    def get(self, ville: Optional[str] = None, quartier: Optional[str] = None,
+            nb_chambres: Optional[int] = None) -> Optional[Any]:
+        """Statistiques du groupe demandé (None : aucune annonce dans ce groupe)"""
+        return self.table.get(stats_key(ville, quartier, nb_chambres))
+
+    def __len__(self) -> int:
+        return len(self.table)
@@ -0,0 +1,110 @@
+"""
+Index des quartiers pour la correspondance approximative.
+
+Construit une fois par instantané de données, il remplace les appels
+`get_close_matches` ligne par ligne : pour une requête (ville, quartier),
+la classe de correspondance est calculée une seule fois pour chaque
+quartier distinct de la ville, puis propagée aux lignes par le code du
+quartier.
+
+Classes de correspondance (score de localisation) :
+- exacte      : 1.0
+- préfixe     : 0.9
+- approchée   : 0.8 (ratio difflib ≥ 0.8)
+- autre       : 0.5
+"""
+
+from difflib import get_close_matches
+from functools import lru_cache
+from typing import Dict, Optional
+import unicodedata
+import re
+
+import numpy as np
+import pandas as pd
+
+EXACT_MATCH = 1.0
+PREFIX_MATCH = 0.9
+FUZZY_MATCH = 0.8
+NO_MATCH = 0.5
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_name(name: str) -> str:
+    """Normalise un nom de ville ou de quartier (accents, casse, espaces)"""
+    name = unicodedata.normalize('NFKD', name).encode('ASCII', 'ignore').decode('ASCII')
+    return _WHITESPACE.sub(' ', name).strip().casefold()
+
+
+class QuartierIndex:
+    def __init__(self, quartiers: pd.Series, ville_quartiers: Dict[str, set],
+                 cache_size: int = 256):
+        # Codes alignés sur les lignes de l'instantané (-1 : quartier manquant)
+        self.codes, self.quartiers = pd.factorize(quartiers)
+        self.keys = [normalize_name(q) if isinstance(q, str) else None for q in self.quartiers]
+
+        code_of = {q: code for code, q in enumerate(self.quartiers)}
+        self.ville_codes = {}
+        for ville, names in ville_quartiers.items():
+            if not isinstance(ville, str):
+                continue
+            codes = [code_of[q] for q in names if isinstance(q, str) and q in code_of]
+            self.ville_codes.setdefault(normalize_name(ville), []).extend(codes)
+
+        self._match_scores = lru_cache(maxsize=cache_size)(self._compute_match_scores)
+
+    @classmethod
+    def from_snapshot(cls, snapshot, ville_quartiers: Dict[str, set]) -> 'QuartierIndex':
+        return cls(snapshot.df['quartier'], ville_quartiers)
+
+    def match_scores(self, ville: str, quartier: str) -> np.ndarray:
+        """Score de localisation par code de quartier (dernier élément : quartier manquant)"""
+        return self._match_scores(normalize_name(ville), normalize_name(quartier))
+
+    def row_scores(self, ville: str, quartier: str,
+                   rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Score de localisation par ligne de l'instantané (ou des positions `rows`)"""
+        codes = self.codes if rows is None else self.codes[rows]
+        return self.match_scores(ville, quartier)[codes]
+
+    def resolve(self, ville: str, quartier: str) -> Optional[str]:
+        """
+        Nom du quartier de la ville correspondant le mieux à la saisie :
+        exact, sinon par préfixe (longueur la plus proche), sinon approché.
+        None si aucun quartier ne correspond.
+        """
+        query = normalize_name(quartier)
+        if not query:
+            return None
+        names = {}
+        for code in self.ville_codes.get(normalize_name(ville), []):
+            names.setdefault(self.keys[code], self.quartiers[code])
+        if query in names:
+            return names[query]
+        prefixed = [key for key in names if key.startswith(query) or query.startswith(key)]
+        if prefixed:
+            return names[min(prefixed, key=lambda key: (abs(len(key) - len(query)), key))]
+        close = get_close_matches(query, list(names), n=1, cutoff=0.8)
+        return names[close[0]] if close else None
+
+    def _compute_match_scores(self, ville_key: str, query: str) -> np.ndarray:
+        scores = np.full(len(self.quartiers) + 1, NO_MATCH)
+        scores[-1] = np.nan
+
+        codes = self.ville_codes.get(ville_key, [])
+        candidates = {}
+        for code in codes:
+            key = self.keys[code]
+            if key == query:
+                scores[code] = EXACT_MATCH
+            elif key.startswith(query) or query.startswith(key):
+                scores[code] = PREFIX_MATCH
+            else:
+                candidates.setdefault(key, []).append(code)
+
+        # Une seule passe approximative sur les noms distincts restants
+        if candidates:
+            for key in get_close_matches(query, list(candidates), n=len(candidates), cutoff=0.8):
+                scores[candidates[key]] = FUZZY_MATCH
+        return scores
@@ -1,13 +1,31 @@
-from dataclasses import dataclass
-from typing import Optional, List, Dict
+from dataclasses import dataclass, replace
+from typing import Optional, List, Dict, Tuple
 import pandas as pd
 import numpy as np
 import logging
-from functools import lru_cache
 from difflib import get_close_matches
 
+try:
+    from .snapshot import get_snapshot_store
+    from .quartier_index import QuartierIndex, FUZZY_MATCH, normalize_name
+    from .market_stats import MarketStats
+    from .location_catalog import LocationCatalog
+    from ..cache import LRUCache
+    from ..instrumentation import span, timed
+except ImportError:
+    from app.models.snapshot import get_snapshot_store
+    from app.models.quartier_index import QuartierIndex, FUZZY_MATCH, normalize_name
+    from app.models.market_stats import MarketStats
+    from app.models.location_catalog import LocationCatalog
+    from app.cache import LRUCache
+    from app.instrumentation import span, timed
+
 logger = logging.getLogger(__name__)
 
+# Cache des réponses de get_cached_recommendations (par instantané)
+RESPONSE_CACHE_SIZE = 512
+RESPONSE_CACHE_TTL = 300
+
 @dataclass
 class Location:
     ville: str
@@ -72,6 +90,34 @@ class Formatter:
     def rooms(rooms: int) -> str:
         return f"{int(rooms)} Ch."
 
+@dataclass
+class Ranking:
+    """Candidats retenus pour une requête (positions dans l'instantané) et leurs scores"""
+    positions: np.ndarray
+    scores: np.ndarray
+    total_results: int
+    in_quartier: bool
+    stats: ApartmentStats
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices des k meilleurs scores, triés par score décroissant.
+
+    Sélection partielle (argpartition) ; à score égal, la ligne la plus
+    ancienne passe en premier, comme DataFrame.nlargest(keep='first').
+    """
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k >= n:
+        return np.lexsort((np.arange(n), -scores))
+
+    threshold = np.partition(scores, n - k)[n - k]
+    above = np.flatnonzero(scores > threshold)
+    ties = np.flatnonzero(scores == threshold)[:k - len(above)]
+    selected = np.concatenate([above, ties])
+    return selected[np.lexsort((selected, -scores[selected]))]
+
 class ApartmentScorer:
     def __init__(self, weights=None):
         self.weights = weights or {
@@ -130,13 +176,96 @@ class ApartmentScorer:
             return 0
         return np.sqrt(popularity / max_popularity)
 
+    def score_frame(self, df: pd.DataFrame, request: RecommendationRequest,
+                    stats: ApartmentStats,
+                    quartier_scores: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Équivalent vectorisé de calculate_score pour toutes les lignes de df.
+
+        Les quatre composantes et les modificateurs sont calculés colonne par
+        colonne ; le score de localisation n'est évalué qu'une fois par
+        quartier distinct. Le résultat est identique, ligne à ligne, à
+        calculate_score (y compris le score 0 des lignes invalides).
+
+        quartier_scores permet de fournir la correspondance de quartier par
+        ligne déjà calculée (QuartierIndex, NaN pour un quartier manquant).
+        """
+        prix = df['prix'].to_numpy(dtype=float)
+        popularite = df['popularite'].to_numpy(dtype=float)
+        chambres = df['nb_chambres'].to_numpy(dtype=float)
+
+        location, invalid = self._location_scores(df, request.location, quartier_scores)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weighted_score = (
+                self._price_scores(prix, request.tranche_salariale.max_rent, stats.avg_price)
+                * self.weights['price']
+                + self._popularity_scores(popularite, stats.max_popularity)
+                * self.weights['popularity']
+                + location * self.weights['location']
+                + self._rooms_scores(chambres, request.nb_personnes) * self.weights['rooms']
+            )
+            total = weighted_score * self._modifiers_array(popularite, chambres, request)
+
+        # min(1.0, x) : comme en Python, un NaN donne 1.0
+        scores = np.where(total < 1.0, total, 1.0)
+        scores[invalid] = 0
+        return scores
+
+    def _price_scores(self, prix: np.ndarray, max_budget: float, avg_price: float) -> np.ndarray:
+        if max_budget == float('inf'):
+            scores = np.exp(-prix / (2 * avg_price))
+        else:
+            budget_ratio = prix / max_budget
+            scores = np.where(budget_ratio <= 0.7, 1.0, 1 - ((budget_ratio - 0.7) / 0.3))
+            scores = np.where(prix > max_budget, 0.0, scores)
+        return np.where(prix == 0, 0.0, scores)
+
+    def _popularity_scores(self, popularite: np.ndarray, max_popularity: float) -> np.ndarray:
+        if max_popularity == 0:
+            return np.zeros(len(popularite))
+        return np.sqrt(popularite / max_popularity)
+
+    def _location_scores(self, df: pd.DataFrame, location: Location,
+                         quartier_scores: Optional[np.ndarray] = None):
+        """Scores de localisation et masque des lignes dont le calcul échouerait"""
+        villes = df['ville'].str.lower()
+        same_ville = (villes == location.ville.lower()).to_numpy()
+
+        if quartier_scores is None:
+            codes, quartiers = pd.factorize(df['quartier'])
+            search_quartier = location.quartier.lower()
+            by_code = np.array([
+                self._quartier_score(q.lower(), search_quartier) if isinstance(q, str) else np.nan
+                for q in quartiers
+            ], dtype=float)
+            by_code = np.append(by_code, np.nan)  # code -1 : quartier manquant
+            quartier_scores = by_code[codes]
+
+        invalid = villes.isna().to_numpy() | (same_ville & np.isnan(quartier_scores))
+        scores = np.where(same_ville, quartier_scores, 0.0)
+        return scores, invalid
+
+    def _rooms_scores(self, chambres: np.ndarray, nb_personnes: int) -> np.ndarray:
+        required = max(1, (nb_personnes + 1) // 2)
+        return np.where(
+            chambres < required, 0.0,
+            np.where(chambres == required, 1.0, 1 - (0.1 * (chambres - required)))
+        )
+
+    def _modifiers_array(self, popularite: np.ndarray, chambres: np.ndarray,
+                         request: RecommendationRequest) -> np.ndarray:
+        modifier = np.ones(len(popularite))
+        modifier = np.where(popularite > 90, modifier * 1.1, modifier)
+        required_rooms = max(1, (request.nb_personnes + 1) // 2)
+        return np.where(chambres > required_rooms + 2, modifier * 0.9, modifier)
+
     def _location_score(self, apt: pd.Series, location: Location) -> float:
         if apt['ville'].lower() != location.ville.lower():
             return 0
-        
-        apt_quartier = apt['quartier'].lower()
-        search_quartier = location.quartier.lower()
-        
+        return self._quartier_score(apt['quartier'].lower(), location.quartier.lower())
+
+    def _quartier_score(self, apt_quartier: str, search_quartier: str) -> float:
         if apt_quartier == search_quartier:
             return 1.0
         elif apt_quartier.startswith(search_quartier) or search_quartier.startswith(apt_quartier):
@@ -162,122 +291,227 @@ class ApartmentScorer:
             modifier *= 0.9
         return modifier
 
+def preprocess_apartments(df: pd.DataFrame) -> pd.DataFrame:
+    """Typage et normalisation des colonnes brutes issues de MongoDB"""
+    # Conversion des prix en float
+    df['prix'] = pd.to_numeric(df['prix'], errors='coerce')
+    df = df[df['prix'] > 0].copy()
+    
+    # Conversion du nombre de chambres
+    df['nb_chambres'] = pd.to_numeric(df['nb_chambres'], errors='coerce')
+    
+    # Normalisation des chaînes
+    df['ville'] = df['ville'].str.strip().str.title()
+    df['quartier'] = df['quartier'].str.strip().str.title()
+    
+    # Préparation des prix formatés
+    df['prix_display'] = df['prix'].apply(Formatter.price)
+    
+    # Gestion de la popularité
+    if 'vues' in df.columns:
+        df['popularite'] = pd.to_numeric(df['vues'], errors='coerce').fillna(0)
+    else:
+        df['popularite'] = 50
+    return df
+
 class ApartmentRecommender:
     def __init__(self, db_connection):
         self.db = db_connection
         self.scorer = ApartmentScorer()
         self._load_data()
         
+    @timed('recommender.load')
     def _load_data(self):
         try:
-            apartments = self.db.get_all_apartments()
-            if not apartments:
+            # Instantané partagé par le processus, rafraîchi seulement si la collection change
+            self.snapshot = get_snapshot_store(self.db, preprocess_apartments).get()
+            if self.snapshot.raw_count == 0:
                 raise Exception("Aucune donnée d'appartement disponible")
                 
-            self.df = pd.DataFrame(apartments)
-            self._preprocess_data()
-            self._init_ville_quartiers()
+            self.df = self.snapshot.df
+            self.ville_quartiers = self.snapshot.derive('ville_quartiers', _build_ville_quartiers)
+            self.quartier_index = self.snapshot.derive(
+                'quartier_index',
+                lambda snapshot: QuartierIndex.from_snapshot(snapshot, self.ville_quartiers)
+            )
+            self.locations = self.snapshot.derive(
+                'locations',
+                lambda snapshot: LocationCatalog.from_snapshot(snapshot, self.ville_quartiers)
+            )
+            self.market_stats = self.snapshot.derive(
+                'market_stats',
+                lambda snapshot: MarketStats.from_snapshot(snapshot, ApartmentStats)
+            )
             
-            logger.info(f"Données chargées avec succès: {len(self.df)} appartements")
+            logger.debug("Données chargées avec succès: %d appartements", len(self.df))
             
         except Exception as e:
             logger.error(f"Erreur lors du chargement des données: {str(e)}")
             raise
 
     def _preprocess_data(self):
-        # Conversion des prix en float
-        self.df['prix'] = pd.to_numeric(self.df['prix'], errors='coerce')
-        self.df = self.df[self.df['prix'] > 0]
+        self.df = preprocess_apartments(self.df)
+
+    def get_recommendations(self, request: RecommendationRequest, limit: int = 6,
+                            offset: int = 0) -> Dict:
+        try:
+            return self._build_recommendations(request, limit, offset)
+        except Exception as e:
+            logger.error(f"Erreur lors de la recherche: {str(e)}")
+            return self._build_empty_response(request, f"Une erreur est survenue: {str(e)}")
+
+    def get_cached_recommendations(self, request: RecommendationRequest, limit: int = 6,
+                                   offset: int = 0) -> Tuple[RecommendationRequest, Dict, bool]:
+        """
+        Recommandations de la requête normalisée, servies depuis un cache LRU
+        à durée de vie limitée.
+
+        Le cache est propre à l'instantané : il est abandonné dès que la
+        version des données change. Retourne la requête normalisée, la
+        réponse et True si elle provient du cache.
+        """
+        canonical = self.normalize_request(request)
+        key = (
+            normalize_name(canonical.location.ville),
+            normalize_name(canonical.location.quartier),
+            # Seul le loyer maximum intervient (comme dans _rank) : valable pour
+            # SalaryRange de ce module comme pour celui de app.models.enums
+            canonical.tranche_salariale.max_rent,
+            canonical.nb_personnes,
+            limit,
+            offset
+        )
+        responses = self.snapshot.derive(
+            'responses',
+            lambda snapshot: LRUCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+        )
+        response = responses.get(key)
+        if response is not None:
+            return canonical, response, True
+        try:
+            response = self._build_recommendations(canonical, limit, offset)
+        except Exception as e:
+            # Les erreurs ne sont pas mises en cache
+            logger.error(f"Erreur lors de la recherche: {str(e)}")
+            return canonical, self._build_empty_response(
+                canonical, f"Une erreur est survenue: {str(e)}"
+            ), False
+        responses.set(key, response)
+        return canonical, response, False
+
+    def normalize_request(self, request: RecommendationRequest) -> RecommendationRequest:
+        """
+        Requête canonique : ville et quartier ramenés aux noms de l'instantané
+        (casse, accents, quartier approché résolu). Un nom inconnu est conservé.
+        """
+        ville = request.location.ville.strip()
+        ville = self.locations.ville(ville) or ville
+        quartier = request.location.quartier.strip()
+        quartier = self.quartier_index.resolve(ville, quartier) or quartier
+        return replace(request, location=replace(request.location, ville=ville, quartier=quartier))
+
+    def _build_recommendations(self, request: RecommendationRequest, limit: int,
+                               offset: int) -> Dict:
+        ranking = self._rank(request)
         
-        # Conversion du nombre de chambres
-        self.df['nb_chambres'] = pd.to_numeric(self.df['nb_chambres'], errors='coerce')
+        if ranking.total_results == 0:
+            return self._build_empty_response(request, "Aucune offre ne correspond à vos critères")
         
-        # Normalisation des chaînes
-        self.df['ville'] = self.df['ville'].str.strip().str.title()
-        self.df['quartier'] = self.df['quartier'].str.strip().str.title()
+        stats = ranking.stats
         
-        # Préparation des prix formatés
-        self.df['prix_display'] = self.df['prix'].apply(Formatter.price)
+        # Sélection partielle des k meilleurs, formatage limité à la page demandée
+        top = top_k_indices(ranking.scores, offset + limit)[offset:]
+        best_matches = self.df.take(ranking.positions[top])
         
-        # Gestion de la popularité
-        if 'vues' in self.df.columns:
-            self.df['popularite'] = pd.to_numeric(self.df['vues'], errors='coerce').fillna(0)
-        else:
-            self.df['popularite'] = 50
-
-    def get_recommendations(self, request: RecommendationRequest, limit: int = 6) -> Dict:
-        try:
-            mask = (
-                (self.df['ville'].str.lower() == request.location.ville.lower()) &
-                (self.df['prix'] <= request.tranche_salariale.max_rent) &
-                (self.df['nb_chambres'] >= max(1, (request.nb_personnes + 1) // 2))
+        if not ranking.in_quartier:
+            message = (
+                f"Aucune offre disponible dans le quartier {request.location.quartier}. "
+                f"Voici {len(best_matches)} suggestions dans d'autres quartiers de {request.location.ville}"
             )
-            
-            filtered_df = self.df[mask].copy()
-            
-            if len(filtered_df) == 0:
-                return self._build_empty_response(request, "Aucune offre ne correspond à vos critères")
-            
-            stats = self.get_stats(request.location.ville)
-            filtered_df['score'] = filtered_df.apply(
-                lambda x: self.scorer.calculate_score(x, request, stats),
-                axis=1
-            )
-            
-            search_quartier = request.location.quartier.lower()
-            quartier_exact = filtered_df[
-                filtered_df['quartier'].str.lower().apply(lambda x: 
-                    x == search_quartier or
-                    x.startswith(search_quartier) or
-                    search_quartier.startswith(x) or
-                    bool(get_close_matches(search_quartier, [x], n=1, cutoff=0.8))
-                )
-            ]
-
-            if len(quartier_exact) == 0:
-                best_matches = filtered_df.nlargest(limit, 'score')
-                message = (
-                    f"Aucune offre disponible dans le quartier {request.location.quartier}. "
-                    f"Voici {len(best_matches)} suggestions dans d'autres quartiers de {request.location.ville}"
-                )
-            else:
-                best_matches = quartier_exact.nlargest(limit, 'score')
-                message = f"Trouvé {len(best_matches)} offre(s) dans {request.location.quartier}"
+        else:
+            message = f"Trouvé {len(best_matches)} offre(s) dans {request.location.quartier}"
 
-            results = []
-            for _, apt in best_matches.iterrows():
-                formatted_apt = self.format_apartment(apt, request, stats)
+        results = []
+        with span('recommender.format'):
+            for (_, apt), score in zip(best_matches.iterrows(), ranking.scores[top]):
+                formatted_apt = self.format_apartment(apt, request, stats, score=score)
                 results.append(formatted_apt)
 
-            return {
-                'status': 'success',
-                'message': message,
-                'recommendations': results,
-                'summary': {
-                    'ville': request.location.ville,
-                    'quartier': request.location.quartier,
-                    'budget_max': (
-                        "Illimité" if request.tranche_salariale.max_rent == float('inf')
-                        else Formatter.price(request.tranche_salariale.max_rent)
-                    ),
-                    'nb_personnes': request.nb_personnes,
-                    'chambres_min': max(1, (request.nb_personnes + 1) // 2),
-                    'total_results': len(filtered_df),
-                    'stats': {
-                        'prix_moyen': Formatter.price(stats.avg_price),
-                        'prix_median': Formatter.price(stats.median_price),
-                        'nb_total': stats.count
-                    }
+        return {
+            'status': 'success',
+            'message': message,
+            'recommendations': results,
+            'summary': {
+                'ville': request.location.ville,
+                'quartier': request.location.quartier,
+                'budget_max': (
+                    "Illimité" if request.tranche_salariale.max_rent == float('inf')
+                    else Formatter.price(request.tranche_salariale.max_rent)
+                ),
+                'nb_personnes': request.nb_personnes,
+                'chambres_min': max(1, (request.nb_personnes + 1) // 2),
+                'total_results': ranking.total_results,
+                'stats': {
+                    'prix_moyen': Formatter.price(stats.avg_price),
+                    'prix_median': Formatter.price(stats.median_price),
+                    'nb_total': stats.count
                 }
+            },
+            'pagination': {
+                'offset': offset,
+                'limit': limit,
+                'total': len(ranking.positions),
+                'has_more': offset + limit < len(ranking.positions)
             }
-            
-        except Exception as e:
-            logger.error(f"Erreur lors de la recherche: {str(e)}")
-            return self._build_empty_response(request, f"Une erreur est survenue: {str(e)}")
+        }
+
+    def _rank(self, request: RecommendationRequest) -> 'Ranking':
+        """Scores des candidats d'une requête, mis en cache pour l'instantané courant"""
+        key = (
+            request.location.ville.lower(),
+            normalize_name(request.location.quartier),
+            request.tranche_salariale.max_rent,
+            request.nb_personnes
+        )
+        rankings = self.snapshot.derive('rankings', lambda snapshot: LRUCache(maxsize=64))
+        return rankings.get_or_set(key, lambda: self._compute_ranking(request))
+
+    @timed('recommender.rank')
+    def _compute_ranking(self, request: RecommendationRequest) -> 'Ranking':
+        mask = (
+            (self.df['ville'].str.lower() == request.location.ville.lower()) &
+            (self.df['prix'] <= request.tranche_salariale.max_rent) &
+            (self.df['nb_chambres'] >= max(1, (request.nb_personnes + 1) // 2))
+        ).to_numpy()
+        positions = np.flatnonzero(mask)
+        stats = self.get_stats(request.location.ville)
+        if len(positions) == 0:
+            return Ranking(positions, np.empty(0), 0, False, stats)
+
+        # Seules les colonnes utiles au score sont extraites, sans copie de la table
+        candidates = pd.DataFrame({
+            column: self.df[column].to_numpy()[positions]
+            for column in ('ville', 'prix', 'popularite', 'nb_chambres')
+        })
+        quartier_scores = self.quartier_index.row_scores(
+            request.location.ville,
+            request.location.quartier,
+            rows=positions
+        )
+        scores = self.scorer.score_frame(
+            candidates, request, stats, quartier_scores=quartier_scores
+        )
+        
+        # Correspondance exacte, par préfixe ou approchée du quartier
+        in_quartier = quartier_scores >= FUZZY_MATCH
+        if in_quartier.any():
+            return Ranking(positions[in_quartier], scores[in_quartier], len(positions), True, stats)
+        return Ranking(positions, scores, len(positions), False, stats)
 
     def format_apartment(self, apt: pd.Series, request: RecommendationRequest,
-                        stats: ApartmentStats) -> dict:
-        score = self.scorer.calculate_score(apt, request, stats)
+                        stats: ApartmentStats, score: Optional[float] = None) -> dict:
+        if score is None:
+            score = self.scorer.calculate_score(apt, request, stats)
         
         strong_points = []
         attention_points = []
@@ -328,48 +562,32 @@ class ApartmentRecommender:
             }
         }
 
-    def get_stats(self, ville: Optional[str] = None) -> ApartmentStats:
+    def get_stats(self, ville: Optional[str] = None, quartier: Optional[str] = None,
+                  nb_chambres: Optional[int] = None) -> ApartmentStats:
+        """Statistiques pré-calculées d'une ville, d'un quartier et/ou d'un nombre de chambres"""
         try:
-            df = self.df if ville is None else self.df[
-                self.df['ville'].str.lower() == ville.lower()
-            ]
-            
-            if len(df) == 0:
-                return ApartmentStats(0, 0, 0, 0, 0, 0, 0)
-            
-            return ApartmentStats(
-                avg_price=df['prix'].mean(),
-                median_price=df['prix'].median(),
-                min_price=df['prix'].min(),
-                max_price=df['prix'].max(),
-                avg_popularity=df['popularite'].mean(),
-                max_popularity=df['popularite'].max(),
-                count=len(df)
-            )
+            stats = self.market_stats.get(ville, quartier, nb_chambres)
+            return stats if stats is not None else ApartmentStats(0, 0, 0, 0, 0, 0, 0)
         except Exception as e:
             logger.error(f"Erreur lors du calcul des statistiques: {str(e)}")
             return ApartmentStats(0, 0, 0, 0, 0, 0, 0)
 
     def _init_ville_quartiers(self):
-        self.ville_quartiers = {}
-        for ville in self.df['ville'].unique():
-            quartiers = self.df[self.df['ville'] == ville]['quartier'].unique()
-            self.ville_quartiers[ville] = set(quartiers)
+        self.ville_quartiers = _build_ville_quartiers(self.snapshot)
 
-    @lru_cache(maxsize=128)
     def verify_ville_quartier(self, ville: str, quartier: str) -> bool:
-        ville_lower = ville.lower()
-        quartier_lower = quartier.lower()
-        
-        if ville_lower not in {v.lower() for v in self.ville_quartiers.keys()}:
-            return False
-            
-        quartiers = {q.lower() for q in self.ville_quartiers[ville]}
-        return (
-            quartier_lower in quartiers or
-            any(q.startswith(quartier_lower) or quartier_lower.startswith(q) 
-                for q in quartiers) or
-            bool(get_close_matches(quartier_lower, quartiers, n=1, cutoff=0.8))
-        )
-    
-    
\ No newline at end of file
+        # Catalogue propre à l'instantané : cache borné, sans référence au recommender
+        return self.locations.is_valid(ville, quartier)
+
+    def suggest_quartiers(self, ville: str, prefix: str, limit: int = 10) -> List[str]:
+        """Quartiers connus de la ville commençant par `prefix`"""
+        return self.locations.complete(ville, prefix, limit)
+
+
+def _build_ville_quartiers(snapshot) -> Dict[str, set]:
+    df = snapshot.df
+    ville_quartiers = {}
+    for ville in df['ville'].unique():
+        quartiers = df[df['ville'] == ville]['quartier'].unique()
+        ville_quartiers[ville] = set(quartiers)
+    return ville_quartiers
@@ -0,0 +1,231 @@
+"""
+Instantané en mémoire de la table des appartements.
+
+Le DataFrame prétraité est construit une seule fois par processus puis
+partagé entre les requêtes et les threads. Il n'est rafraîchi que lorsque
+la collection change :
+- chaque écriture incrémente un compteur de version (collection `meta`),
+  et un compteur de suppressions quand des documents sont supprimés ;
+- à défaut de compteur, on compare la date `derniere_maj` la plus récente
+  et le nombre de documents.
+
+Le rafraîchissement est incrémental : seuls les documents dont
+`derniere_maj` dépasse la dernière valeur connue, moins une marge
+(MERGE_OVERLAP), sont relus et fusionnés par `_id`. `derniere_maj` est
+posée par l'écrivain avant que son lot ne soit visible : un lot écrit en
+parallèle peut apparaître après un lot plus récent, la marge le rattrape.
+Un rechargement complet a lieu après une suppression (compteur de
+suppressions modifié), un changement de schéma, ou quand la collection
+n'est pas versionnée.
+
+Seuls les champs utiles au moteur de recommandation (SNAPSHOT_FIELDS) sont
+lus, en flux depuis le curseur (DatabaseConnection.load_frame) : ni la
+description ni les autres champs volumineux ne sont chargés.
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Sequence
+import threading
+import logging
+import time
+import weakref
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Champs bruts lus pour l'instantané (popularite est recalculée depuis `vues`)
+SNAPSHOT_FIELDS = ('_id', 'titre', 'ville', 'quartier', 'prix', 'nb_chambres', 'vues', 'derniere_maj')
+
+# Documents relus sous la dernière date connue : délai maximal entre la date
+# posée par un écrivain et la visibilité de son écriture
+MERGE_OVERLAP = timedelta(minutes=5)
+
+
+@dataclass
+class ApartmentSnapshot:
+    """Version figée (jamais modifiée) de la table prétraitée"""
+    df: pd.DataFrame
+    signature: Any
+    high_water_mark: Any
+    raw_columns: frozenset
+    raw_ids: frozenset
+    positions: np.ndarray
+    built_at: float = field(default_factory=time.time)
+    _derived: Dict[str, Any] = field(default_factory=dict, repr=False)
+    _derive_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def version(self) -> Any:
+        return self.signature
+
+    @property
+    def raw_count(self) -> int:
+        return len(self.raw_ids)
+
+    def derive(self, key: str, factory: Callable[['ApartmentSnapshot'], Any]) -> Any:
+        """Calcule une seule fois par instantané une structure dérivée (index, stats...)"""
+        try:
+            return self._derived[key]
+        except KeyError:
+            pass
+        with self._derive_lock:
+            if key not in self._derived:
+                self._derived[key] = factory(self)
+            return self._derived[key]
+
+
+class SnapshotStore:
+    """Fournit l'instantané courant et le rafraîchit quand la collection change"""
+
+    def __init__(self, db, preprocess: Callable[[pd.DataFrame], pd.DataFrame],
+                 check_interval: float = 5.0, fields: Sequence[str] = SNAPSHOT_FIELDS):
+        self.db = db
+        self.preprocess = preprocess
+        self.fields = fields
+        self.check_interval = check_interval
+        self._snapshot: Optional[ApartmentSnapshot] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> ApartmentSnapshot:
+        """Retourne l'instantané, en vérifiant au plus une fois par intervalle s'il a changé"""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._last_check < self.check_interval:
+            return snapshot
+
+        # Un seul thread rafraîchit ; les autres servent l'instantané existant
+        if snapshot is not None and not self._lock.acquire(blocking=False):
+            return snapshot
+        if snapshot is None:
+            self._lock.acquire()
+        try:
+            self._refresh()
+            return self._snapshot
+        finally:
+            self._lock.release()
+
+    def invalidate(self):
+        """Force une vérification au prochain accès"""
+        self._last_check = 0.0
+
+    def _signature(self):
+        version, deletions = self.db.get_data_state()
+        if version is None:
+            return (None, self.db.get_latest_update(), self.db.estimated_count())
+        return (version, deletions)
+
+    @staticmethod
+    def _can_merge(current: Optional[ApartmentSnapshot], signature) -> bool:
+        """Fusion incrémentale possible : collection versionnée et aucune suppression depuis"""
+        return (current is not None and current.high_water_mark is not None
+                and signature[0] is not None and current.signature[0] is not None
+                and signature[1] == current.signature[1])
+
+    def _refresh(self):
+        current = self._snapshot
+        if current is not None and time.monotonic() - self._last_check < self.check_interval:
+            return
+
+        signature = self._signature()
+        self._last_check = time.monotonic()
+        if current is not None and signature == current.signature:
+            return
+
+        snapshot = None
+        if self._can_merge(current, signature):
+            snapshot = self._merge(current, signature)
+        if snapshot is None:
+            snapshot = self._build(signature)
+        self._snapshot = snapshot
+        logger.info("Instantané des appartements mis à jour: %d lignes", len(snapshot.df))
+
+    def _build(self, signature) -> ApartmentSnapshot:
+        raw = self.db.load_frame(self.fields)
+        df = self._prepare(raw)
+        return ApartmentSnapshot(
+            df=df,
+            signature=signature,
+            high_water_mark=self._high_water_mark(raw),
+            raw_columns=frozenset(raw.columns),
+            raw_ids=frozenset(raw['_id']) if '_id' in raw.columns else frozenset(),
+            positions=np.arange(len(df))
+        )
+
+    def _merge(self, current: ApartmentSnapshot, signature) -> Optional[ApartmentSnapshot]:
+        """Fusionne les documents modifiés ; None si un rechargement complet s'impose"""
+        since = current.high_water_mark
+        if isinstance(since, datetime):
+            since = since - MERGE_OVERLAP
+        raw_delta = self.db.load_frame(self.fields, {"derniere_maj": {"$gte": since}})
+        if len(raw_delta) == 0:
+            return ApartmentSnapshot(
+                df=current.df,
+                signature=signature,
+                high_water_mark=current.high_water_mark,
+                raw_columns=current.raw_columns,
+                raw_ids=current.raw_ids,
+                positions=current.positions,
+                _derived=current._derived
+            )
+        if not set(raw_delta.columns) <= current.raw_columns:
+            return None
+
+        raw_ids = current.raw_ids | frozenset(raw_delta['_id'])
+        delta = self._prepare(raw_delta.reindex(columns=list(current.raw_columns)))
+        base = current.df
+        changed = base['_id'].isin(raw_delta['_id']).to_numpy()
+        kept = base[~changed]
+        kept_positions = current.positions[~changed]
+
+        # Les lignes mises à jour gardent leur position, les nouvelles sont ajoutées à la fin
+        old_positions = pd.Series(current.positions, index=base['_id'].to_numpy())
+        delta_positions = delta['_id'].map(old_positions)
+        next_position = current.positions.max() + 1 if len(current.positions) else 0
+        is_new = delta_positions.isna().to_numpy()
+        delta_positions = delta_positions.to_numpy(dtype=float)
+        delta_positions[is_new] = next_position + np.arange(is_new.sum())
+
+        positions = np.concatenate([kept_positions, delta_positions.astype(np.int64)])
+        order = np.argsort(positions, kind='stable')
+        df = pd.concat([kept, delta], ignore_index=True).take(order).reset_index(drop=True)
+
+        return ApartmentSnapshot(
+            df=df,
+            signature=signature,
+            high_water_mark=max(current.high_water_mark,
+                                self._high_water_mark(raw_delta) or current.high_water_mark),
+            raw_columns=current.raw_columns,
+            raw_ids=raw_ids,
+            positions=positions[order]
+        )
+
+    def _prepare(self, raw: pd.DataFrame) -> pd.DataFrame:
+        if len(raw) == 0:
+            return raw
+        return self.preprocess(raw.copy()).reset_index(drop=True)
+
+    @staticmethod
+    def _high_water_mark(raw: pd.DataFrame):
+        if 'derniere_maj' not in raw.columns:
+            return None
+        latest = raw['derniere_maj'].dropna().max()
+        if latest is None or pd.isna(latest):
+            return None
+        return latest.to_pydatetime() if isinstance(latest, pd.Timestamp) else latest
+
+
+_stores = weakref.WeakKeyDictionary()
+_stores_lock = threading.Lock()
+
+
+def get_snapshot_store(db, preprocess: Callable[[pd.DataFrame], pd.DataFrame]) -> SnapshotStore:
+    """Retourne le SnapshotStore associé à une connexion (un par processus)"""
+    with _stores_lock:
+        store = _stores.get(db)
+        if store is None:
+            store = SnapshotStore(db, preprocess)
+            _stores[db] = store
+        return store
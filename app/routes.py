@@ -1,13 +1,12 @@
-from flask import Blueprint, render_template, redirect, url_for, request
-from app.visualizations.charts import AppartementVisualizer
+from flask import Blueprint, render_template, redirect, url_for, request, current_app, send_from_directory, jsonify, abort, Response
 from app.models.enums import SalaryRange, PropertyCategory
-from app.models.recommendation import ApartmentRecommender
-from app.models.classification import ApartmentClassifier
-from app.database.db_config import DatabaseConnection
 from dataclasses import dataclass
+import logging
+import os
+
+logger = logging.getLogger(__name__)
 
 main_bp = Blueprint('main', __name__)
-visualizer = AppartementVisualizer()
 
 @dataclass
 class Location:
@@ -20,16 +19,65 @@ class RecommendationRequest:
     tranche_salariale: SalaryRange
     nb_personnes: int
 
+# Tranches salariales du formulaire de recommandation
+SALARY_RANGES = {
+    '50.000 - 150.000 FCFA': SalaryRange.LOW,
+    '150.000 - 300.000 FCFA': SalaryRange.MEDIUM_LOW,
+    '300.000 - 500.000 FCFA': SalaryRange.MEDIUM,
+    '500.000 - 800.000 FCFA': SalaryRange.MEDIUM_HIGH,
+    '800.000 - 1.500.000 FCFA': SalaryRange.HIGH,
+    'Plus de 1.500.000 FCFA': SalaryRange.VERY_HIGH
+}
+
+def parse_salary_range(value):
+    """Tranche salariale depuis un libellé du formulaire ou un nom (ex. MEDIUM)"""
+    if not value:
+        return None
+    value = value.strip()
+    return SALARY_RANGES.get(value) or SalaryRange.__members__.get(value.upper())
+
+def chart_urls(view):
+    """URLs des graphiques pré-rendus (None : image statique par défaut)"""
+    chart_cache = current_app.dashboard.visualizer.chart_cache
+    return {
+        name: url_for('main.chart', filename=filename)
+        if filename and os.path.exists(chart_cache.path(filename)) else None
+        for name, filename in view['charts'].items()
+    }
+
+@main_bp.route('/charts/<filename>')
+def chart(filename):
+    """Graphique rendu, servi avec ETag (hachage du contenu) et Last-Modified"""
+    etag = os.path.splitext(filename)[0].rsplit('_', 1)[-1]
+    return send_from_directory(current_app.dashboard.visualizer.chart_cache.cache_dir, filename,
+                               etag=etag, conditional=True, max_age=86400)
+
+# Villes du tableau de bord, par identifiant d'URL (None : toutes les villes)
+DASHBOARD_CITIES = {'all': None, 'yaounde': 'Yaoundé', 'douala': 'Douala'}
+
+@main_bp.route('/api/charts/<ville>/<chart_name>')
+def chart_data(ville, chart_name):
+    """Séries pré-agrégées d'un graphique du tableau de bord (JSON)"""
+    if ville.lower() not in DASHBOARD_CITIES or chart_name not in ('distribution', 'top'):
+        abort(404)
+    
+    view = current_app.dashboard.get(DASHBOARD_CITIES[ville.lower()])
+    response = jsonify(view['series'][chart_name])
+    response.set_etag(f"{view['data_version']}-{ville.lower()}-{chart_name}")
+    # Vue pas encore publiée : séries vides, à ne pas garder en cache
+    response.cache_control.max_age = 0 if view.get('pending') else 60
+    return response.make_conditional(request)
+
 @main_bp.route('/')
 @main_bp.route('/dashboard')
 def index():
     """Page d'accueil - Vue globale"""
-    stats = visualizer.get_stats_globales()
-    visualizer.plot_distribution_chambres()
-    visualizer.plot_top_appartements()
+    # Lecture seule : la vue est pré-calculée par DashboardRefresher
+    view = current_app.dashboard.get()
     
     return render_template('dashboard.html', 
-                         stats=stats,
+                         stats=view['stats'],
+                         charts=chart_urls(view),
                          active_city='all',
                          active_page='dashboard',
                          page_title='Aperçu Global')
@@ -38,23 +86,21 @@ def index():
 def ville_stats(ville):
     """Statistiques par ville"""
     try:
-        if ville.lower() not in ['yaounde', 'douala']:
+        # Identifiant d'URL -> nom de la ville en base ('yaounde' -> 'Yaoundé')
+        ville_db = DASHBOARD_CITIES.get(ville.lower())
+        if ville_db is None:
             return redirect(url_for('main.index'))
         
-        # Convertir 'Yaounde' en 'Yaoundé' pour la requête MongoDB
-        ville_db = 'Yaoundé' if ville.lower() == 'yaounde' else ville
-        
-        stats = visualizer.get_stats_globales(ville_db)
-        visualizer.plot_distribution_chambres(ville_db)
-        visualizer.plot_top_appartements(ville_db)
+        view = current_app.dashboard.get(ville_db)
         
         return render_template('dashboard.html',
-                             stats=stats,
+                             stats=view['stats'],
+                             charts=chart_urls(view),
                              active_city=ville.lower(),
                              active_page='dashboard',
                              page_title=f'Statistiques - {ville_db}')
     except Exception as e:
-        print(f"Erreur: {str(e)}")
+        logger.error(f"Erreur: {str(e)}")
         return redirect(url_for('main.index'))
 
 
@@ -62,11 +108,13 @@ def ville_stats(ville):
 @main_bp.route('/data', methods=['GET', 'POST'])
 def data():
     """Page des données, recommandations et classification"""
+    # Imports différés : pandas/numpy ne sont chargés qu'à la première visite
+    from app.models.recommendation import ApartmentRecommender
+    from app.models.classification import ApartmentClassifier
     
-    # Instance du classificateur (toujours chargé pour GET et POST)
-    classifier = ApartmentClassifier()
-    df_classification = classifier.classify_apartments()
-    classification_results = df_classification.to_dict('records') if df_classification is not None else None
+    # Classification matérialisée : top 5 par catégorie, indépendant de la taille de la collection
+    classifier = ApartmentClassifier(current_app.db)
+    classification_results = classifier.get_classification_summary(limit=5)
     
     # Pour une requête GET, afficher uniquement le formulaire
     if request.method == 'GET':
@@ -87,26 +135,18 @@ def data():
         location = request.form.get('location')
         salary_range = request.form.get('salary_range')
         num_occupants = request.form.get('num_occupants')
+        offset = max(0, request.form.get('offset', 0, type=int))
         
-        print(f"Données reçues: ville={city}, quartier={location}, "
-              f"salaire={salary_range}, occupants={num_occupants}")
+        logger.debug("Données reçues: ville=%s, quartier=%s, salaire=%s, occupants=%s",
+                     city, location, salary_range, num_occupants)
         
         if not all([city, location, salary_range, num_occupants]):
             raise ValueError("Tous les champs sont requis")
         
         # Conversion de la tranche salariale
-        salary_ranges = {
-            '50.000 - 150.000 FCFA': SalaryRange.LOW,
-            '150.000 - 300.000 FCFA': SalaryRange.MEDIUM_LOW,
-            '300.000 - 500.000 FCFA': SalaryRange.MEDIUM,
-            '500.000 - 800.000 FCFA': SalaryRange.MEDIUM_HIGH,
-            '800.000 - 1.500.000 FCFA': SalaryRange.HIGH,
-            'Plus de 1.500.000 FCFA': SalaryRange.VERY_HIGH
-        }
-        
-        tranche = salary_ranges.get(salary_range)
+        tranche = SALARY_RANGES.get(salary_range)
         if not tranche:
-            print(f"Tranche salariale invalide: {salary_range}")
+            logger.warning("Tranche salariale invalide: %s", salary_range)
             raise ValueError(f"Tranche salariale non reconnue: {salary_range}")
         
         # Création de la requête
@@ -116,23 +156,23 @@ def data():
             nb_personnes=int(num_occupants)
         )
         
-        # Initialisation du recommender avec la connexion DB
-        db = DatabaseConnection()
-        recommender = ApartmentRecommender(db)
+        # Initialisation du recommender avec la connexion partagée
+        recommender = ApartmentRecommender(current_app.db)
         
         # Obtention des recommandations
-        recommendations = recommender.get_recommendations(request_obj)
-        print(f"Recommandations obtenues: {recommendations}")
+        recommendations = recommender.get_recommendations(request_obj, offset=offset)
+        logger.debug("Recommandations obtenues: %s (%d offre(s))",
+                     recommendations.get('message'), len(recommendations.get('recommendations', [])))
         
     except ValueError as e:
-        print(f"Erreur de validation: {str(e)}")
+        logger.info("Erreur de validation: %s", e)
         recommendations = {
             'status': 'error',
             'message': str(e),
             'recommendations': []
         }
     except Exception as e:
-        print(f"Erreur inattendue: {str(e)}")
+        logger.exception(f"Erreur inattendue: {str(e)}")
         recommendations = {
             'status': 'error',
             'message': "Une erreur inattendue s'est produite",
@@ -147,6 +187,126 @@ def data():
                      classification_results=classification_results)
 
 
+def _int_param(params, name, default):
+    """Paramètre entier (query string, formulaire ou JSON) : `default` s'il est absent, None s'il est invalide"""
+    value = params.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _missing_params_error():
+    """Réponse 400 de /api/recommendations quand les paramètres requis manquent"""
+    return jsonify({
+        'status': 'error',
+        'message': "Paramètres requis : ville, quartier, tranche, nb_personnes (≥ 1)",
+        'tranches': [r['id'] for r in SalaryRange.get_all_ranges()],
+        'recommendations': []
+    }), 400
+
+
+@main_bp.route('/api/recommendations', methods=['GET', 'POST'])
+def api_recommendations():
+    """
+    Recommandations au format JSON.
+
+    Paramètres (query string, formulaire ou corps JSON) : ville, quartier,
+    tranche (libellé du formulaire ou nom, ex. MEDIUM), nb_personnes,
+    et optionnellement offset et limit. Les requêtes identiques une fois
+    normalisées sont servies depuis le cache (en-tête X-Cache).
+    """
+    from app.models.recommendation import ApartmentRecommender
+    
+    body = request.get_json(silent=True)
+    if body is not None and not isinstance(body, dict):
+        # Corps JSON qui n'est pas un objet (tableau, nombre, chaîne...)
+        return _missing_params_error()
+    params = body or request.values
+    ville = str(params.get('ville') or '').strip()
+    quartier = str(params.get('quartier') or '').strip()
+    tranche = parse_salary_range(str(params.get('tranche') or ''))
+    nb_personnes = _int_param(params, 'nb_personnes', 0)
+    offset = _int_param(params, 'offset', 0)
+    limit = _int_param(params, 'limit', 6)
+    
+    invalid = [name for name, value in (('nb_personnes', nb_personnes), ('offset', offset),
+                                        ('limit', limit)) if value is None]
+    if invalid:
+        return jsonify({
+            'status': 'error',
+            'message': f"Paramètre(s) non entier(s) : {', '.join(invalid)}",
+            'invalid': invalid,
+            'recommendations': []
+        }), 400
+    offset = max(0, offset)
+    limit = min(50, max(1, limit))
+    
+    if not ville or not quartier or tranche is None or nb_personnes < 1:
+        return _missing_params_error()
+    
+    try:
+        recommender = ApartmentRecommender(current_app.db)
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e), 'recommendations': []}), 503
+    
+    canonical, result, hit = recommender.get_cached_recommendations(
+        RecommendationRequest(Location(ville, quartier), tranche, nb_personnes),
+        limit=limit, offset=offset
+    )
+    response = jsonify({
+        **result,
+        'request': {
+            'ville': canonical.location.ville,
+            'quartier': canonical.location.quartier,
+            'tranche': canonical.tranche_salariale.name,
+            'nb_personnes': canonical.nb_personnes
+        }
+    })
+    response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+    response.cache_control.max_age = 60
+    return response
+
+
+@main_bp.route('/api/quartiers')
+def api_quartiers():
+    """Autocomplétion des quartiers d'une ville (paramètres ville, q, limit)"""
+    from app.models.recommendation import ApartmentRecommender
+    
+    ville = request.args.get('ville', '').strip()
+    prefix = request.args.get('q', '').strip()
+    limit = min(50, max(1, request.args.get('limit', 10, type=int)))
+    if not ville:
+        return jsonify({'status': 'error', 'message': "Paramètre requis : ville"}), 400
+    
+    try:
+        recommender = ApartmentRecommender(current_app.db)
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 503
+    
+    response = jsonify({
+        'ville': recommender.locations.ville(ville),
+        'quartiers': recommender.suggest_quartiers(ville, prefix, limit)
+    })
+    response.cache_control.max_age = 300
+    return response
+
+
+@main_bp.route('/metrics')
+def metrics():
+    """Histogrammes de latence (requêtes, étapes, MongoDB) et pool de connexions, format Prometheus"""
+    from app.instrumentation import METRICS
+    
+    gauges = {
+        f"koutchoumi_mongo_pool_{name}": float(value)
+        for name, value in current_app.db.pool_stats().items()
+        if isinstance(value, (int, float))
+    }
+    return Response(METRICS.render(gauges), mimetype='text/plain; version=0.0.4')
+
+
 @main_bp.route('/about')
 def about():
     """Page À propos"""
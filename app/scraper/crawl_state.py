@@ -0,0 +1,79 @@
+"""
+État du crawl incrémental.
+
+Chaque annonce porte une empreinte de son contenu (champ `empreinte`) et
+chaque page de listing visitée est suivie dans la collection `crawl_state` :
+empreinte de la page (suite des empreintes de ses annonces) et validateurs
+HTTP (ETag, Last-Modified) pour les requêtes conditionnelles.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import hashlib
+import threading
+
+# Contenu de l'annonce : toute modification change l'empreinte. Le compteur de
+# vues, qui change à presque chaque passage, n'en fait pas partie : il est mis à
+# jour à part (bulk_upsert_apartments) et suivi par l'historique des observations.
+FINGERPRINT_FIELDS = ('titre', 'quartier', 'prix', 'nb_chambres', 'description')
+
+
+def listing_fingerprint(listing: Dict[str, Any]) -> str:
+    payload = '\x1f'.join(str(listing.get(field)) for field in FINGERPRINT_FIELDS)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def page_fingerprint(listings: List[Dict[str, Any]]) -> str:
+    payload = '|'.join(listing['empreinte'] for listing in listings)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+class CrawlState:
+    """État des pages de listing, chargé en mémoire au début du crawl"""
+
+    def __init__(self, db):
+        self.collection = db.db.crawl_state
+        self._pages: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def load(self) -> int:
+        """Charge l'état de toutes les pages connues (une requête par crawl)"""
+        pages = {doc['_id']: doc for doc in self.collection.find()}
+        with self._lock:
+            self._pages = pages
+        return len(pages)
+
+    def get(self, url: str) -> Dict[str, Any]:
+        with self._lock:
+            return self._pages.get(url, {})
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """En-têtes If-None-Match / If-Modified-Since pour une page déjà vue"""
+        state = self.get(url)
+        headers = {}
+        if state.get('etag'):
+            headers['If-None-Match'] = state['etag']
+        if state.get('last_modified'):
+            headers['If-Modified-Since'] = state['last_modified']
+        return headers
+
+    def save(self, url: str, fingerprint: Optional[str], response=None) -> bool:
+        """
+        Enregistre l'état d'une page si son empreinte ou ses validateurs ont changé.
+
+        Retourne True si une écriture a été nécessaire.
+        """
+        update = {'empreinte': fingerprint}
+        if response is not None:
+            update['etag'] = response.headers.get('ETag')
+            update['last_modified'] = response.headers.get('Last-Modified')
+
+        previous = self.get(url)
+        if previous and all(previous.get(k) == v for k, v in update.items()):
+            return False
+
+        update['changed_at'] = datetime.now()
+        self.collection.update_one({'_id': url}, {'$set': update}, upsert=True)
+        with self._lock:
+            self._pages[url] = {**previous, '_id': url, **update}
+        return True
@@ -0,0 +1,84 @@
+"""
+Étape d'ingestion du scraper.
+
+Les annonces extraites sont mises en tampon (une ou plusieurs pages) puis
+écrites en un seul bulk_write d'upserts sur url_annonce, au lieu d'un
+find_one suivi d'un insert_one / update_one par annonce. Le même lot est
+ajouté à l'historique des observations (prix, vues) quand il est fourni.
+
+Un rappel peut accompagner les annonces d'une page : il n'est exécuté
+qu'une fois le lot qui les contient écrit sans erreur (le crawl incrémental
+n'enregistre l'état d'une page qu'à ce moment-là).
+"""
+
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import threading
+import logging
+
+
+class IngestionBuffer:
+    def __init__(self, db, batch_size: int = 200, history=None):
+        self.db = db
+        self.batch_size = batch_size
+        self.history = history
+        self.totals = Counter()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._callbacks: List[Callable[[], Any]] = []
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def add(self, listings: List[Dict[str, Any]],
+            on_written: Optional[Callable[[], Any]] = None) -> Dict[str, int]:
+        """
+        Ajoute des annonces à écrire ; écrit le lot dès que batch_size est atteint.
+
+        `on_written` est appelé après l'écriture réussie du lot contenant ces
+        annonces.
+        """
+        with self._lock:
+            for listing in listings:
+                # Une même annonce vue deux fois dans le lot : la dernière version gagne
+                self._pending[listing['url_annonce']] = listing
+            if on_written is not None:
+                self._callbacks.append(on_written)
+            if len(self._pending) < self.batch_size:
+                return {}
+            taken = self._take()
+        return self._write(*taken)
+
+    def flush(self) -> Dict[str, int]:
+        """Écrit les annonces restantes"""
+        with self._lock:
+            taken = self._take()
+        return self._write(*taken)
+
+    def _take(self) -> Tuple[List[Dict[str, Any]], List[Callable[[], Any]]]:
+        taken = list(self._pending.values()), self._callbacks
+        self._pending, self._callbacks = {}, []
+        return taken
+
+    def _write(self, batch: List[Dict[str, Any]],
+               callbacks: List[Callable[[], Any]]) -> Dict[str, int]:
+        if not batch and not callbacks:
+            return {}
+        counts = self.db.bulk_upsert_apartments(batch)
+        if self.history is not None:
+            counts = {**counts, 'observations': self.history.record(batch)}
+        with self._lock:
+            self.totals.update(counts)
+        if counts['errors']:
+            self.logger.error("Lot écrit avec des erreurs : %d page(s) à reprendre au prochain crawl",
+                              len(callbacks))
+        else:
+            for callback in callbacks:
+                try:
+                    callback()
+                except Exception as e:
+                    self.logger.error("Erreur après l'écriture du lot : %s", e)
+        if batch:
+            self.logger.info(
+                "Lot de %d annonces : %d ajoutée(s), %d mise(s) à jour, %d inchangée(s)",
+                len(batch), counts['inserted'], counts['updated'], counts['unchanged']
+            )
+        return counts
@@ -0,0 +1,216 @@
+"""
+Étape d'analyse HTML du scraper.
+
+ListingParser transforme une page de listing téléchargée en annonces et en
+liens de pagination. L'analyse est limitée aux cartes d'annonces et à la
+pagination : le document est d'abord borné à la zone qui les contient
+(en-tête, menus et pied de page ne sont pas analysés), puis filtré par un
+SoupStrainer. lxml est utilisé quand il est installé, et les expressions
+régulières sont précompilées.
+
+Le parseur ne dépend ni du réseau ni de la base : il peut tourner dans un
+pool de processus séparé des téléchargements (voir run_concurrent).
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from urllib.parse import urljoin
+import logging
+import re
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+_PRIX = re.compile(r'(\d+[\s\d]*)\s*F')
+_QUARTIER = re.compile(r'\|\s*(.*?),')
+_CHAMBRES = re.compile(r'(\d+)\s*chambre')
+_VUES = re.compile(r'(\d+)\s*vues')
+_VUES_MOT = re.compile('vues', re.IGNORECASE)
+_CARD_TAG = re.compile(rb'<div\s[^>]*class=["\'][^"\']*\bcard-list\b', re.IGNORECASE)
+_PAGINATION_TAG = re.compile(rb'<ul\s[^>]*class=["\'][^"\']*\bpagination\b', re.IGNORECASE)
+
+
+def _is_page_content(name: str, attrs: Dict[str, Any]) -> bool:
+    """Ne conserve que les cartes d'annonces et la pagination"""
+    classes = attrs.get('class') or ''
+    if not isinstance(classes, str):
+        classes = ' '.join(classes)
+    return ((name == 'div' and 'card-list' in classes)
+            or (name == 'ul' and 'pagination' in classes))
+
+
+PAGE_CONTENT = SoupStrainer(_is_page_content)
+
+
+def listing_region(content: bytes) -> bytes:
+    """
+    Portion du document allant de la première carte d'annonce à la fin de
+    la pagination (le document entier si ces repères sont introuvables).
+
+    Les repères sont les balises elles-mêmes (<div class="... card-list">,
+    <ul class="... pagination">) : le mot « pagination » dans le texte d'une
+    annonce ne coupe pas la zone.
+    """
+    if not isinstance(content, bytes):
+        return content
+    first_card = _CARD_TAG.search(content)
+    if first_card is None:
+        return content
+    start = first_card.start()
+    pagination = _PAGINATION_TAG.search(content, first_card.end())
+    end = content.find(b'</ul>', pagination.end()) if pagination else -1
+    return content[start:end + len(b'</ul>')] if end >= 0 else content[start:]
+
+
+@dataclass
+class PageResult:
+    """Résultat du traitement d'une page de listing"""
+    next_page: Optional[str]
+    links: List[str] = field(default_factory=list)
+    current_link: Optional[str] = None
+    # Crawl incrémental : page sans annonce nouvelle ni modifiée
+    unchanged: bool = False
+
+
+@dataclass
+class ParsedPage:
+    listings: List[Dict[str, Any]]
+    page: PageResult
+
+
+class ListingParser:
+    def __init__(self, site_root: str, parser: str = HTML_PARSER):
+        self.site_root = site_root
+        self.parser = parser
+        self.logger = logging.getLogger(__name__)
+
+    def parse(self, content: bytes, ville: str, page_url: Optional[str] = None) -> ParsedPage:
+        """Annonces et pagination d'une page de listing"""
+        soup = BeautifulSoup(listing_region(content), self.parser, parse_only=PAGE_CONTENT)
+
+        listings = []
+        for card in soup.find_all('div', class_='card card-list'):
+            data = self.extract_apartment_info(card, ville)
+            if data:
+                listings.append(data)
+
+        return ParsedPage(listings, self.pagination(soup, page_url))
+
+    def pagination(self, soup, page_url: Optional[str] = None) -> PageResult:
+        """Page suivante et liens de la pagination"""
+        next_page = None
+        pagination = soup.find('ul', class_='pagination')
+        if pagination:
+            current_page = pagination.find('li', class_='active')
+            if current_page:
+                next_li = current_page.find_next_sibling('li')
+                if next_li and next_li.find('a'):
+                    next_url = next_li.find('a')['href']
+                    if not next_url.startswith('http'):
+                        next_page = f"{self.site_root}{next_url}"
+
+        result = PageResult(next_page)
+        if pagination:
+            for item in pagination.find_all('li'):
+                link = item.find('a', href=True)
+                if not link or link['href'].startswith(('#', 'javascript:')):
+                    continue
+                url = urljoin(page_url or self.site_root + '/', link['href'])
+                if 'active' in (item.get('class') or []):
+                    # Lien de la page courante : alias de page_url
+                    result.current_link = url
+                else:
+                    result.links.append(url)
+        return result
+
+    def determiner_categorie(self, prix: int) -> str:
+        """Détermine la catégorie de l'appartement en fonction du prix"""
+        if prix < 100000:
+            return "Low Cost"
+        elif prix < 300000:
+            return "Moyen"
+        else:
+            return "Luxueux"
+
+    def extract_apartment_info(self, card, ville: str) -> Optional[Dict[str, Any]]:
+        """Extrait les informations d'un appartement depuis une carte"""
+        try:
+            # Extraction du prix
+            price_element = card.find('h2', class_='text-primary')
+            if not price_element:
+                return None
+
+            prix_text = price_element.get_text(strip=True)
+            prix_match = _PRIX.search(prix_text)
+            prix = int(prix_match.group(1).replace(' ', '')) if prix_match else 0
+
+            # Extraction du quartier
+            quartier_match = _QUARTIER.search(prix_text)
+            quartier = quartier_match.group(1).strip() if quartier_match else ''
+
+            # Extraction du nombre de chambres
+            description = card.find('h3', class_='card-title')
+            if not description:
+                return None
+
+            description_text = description.get_text(strip=True)
+            chambres_match = _CHAMBRES.search(description_text.lower())
+            nb_chambres = int(chambres_match.group(1)) if chambres_match else 0
+
+            # Extraction de l'URL
+            url_element = card.find('a', href=True)
+            url = url_element['href'] if url_element else ''
+            if url and not url.startswith('http'):
+                url = f"{self.site_root}{url}"
+
+            # Extraction de la popularité
+            views_span = self._views_span(card)
+            popularite = 0
+            if views_span is not None:
+                views_match = _VUES.search(views_span.text)
+                popularite = int(views_match.group(1)) if views_match else 0
+
+            now = datetime.now()
+            return {
+                'titre': f"{prix} F | {quartier}, {ville}",
+                'ville': ville,
+                'quartier': quartier,
+                'prix': prix,
+                'nb_chambres': nb_chambres,
+                'description': description_text,
+                'popularite': popularite,
+                'url_annonce': url,
+                'categorie': self.determiner_categorie(prix),
+                'date_ajout': now,
+                'derniere_maj': now
+            }
+
+        except Exception as e:
+            self.logger.error(f"Erreur lors de l'extraction des données : {str(e)}")
+            return None
+
+    @staticmethod
+    def _views_span(card):
+        """
+        Premier <span> de la carte dont le texte contient « vues ».
+
+        On part des nœuds texte contenant le mot plutôt que de reconstruire
+        le texte de chaque <span> : le premier <span> dans l'ordre du
+        document est le plus externe qui englobe le premier de ces nœuds.
+        """
+        for text in card.find_all(string=_VUES_MOT):
+            span = None
+            for parent in text.parents:
+                if parent is card:
+                    break
+                if parent.name == 'span':
+                    span = parent
+            if span is not None:
+                return span
+        return None
@@ -1,30 +1,88 @@
 import requests
-from bs4 import BeautifulSoup
-import re
 import time
 import logging
-from typing import Optional, Dict, Any
+import argparse
+import threading
+from collections import Counter
+import multiprocessing
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlparse
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-from datetime import datetime
 from app.database.db_config import DatabaseConnection
+from app.database.history import ObservationStore
+from app.database.indexes import ensure_indexes
+from app.logging_config import configure_logging
+from app.models.classification import ApartmentClassifier
+from app.scraper.ingestion import IngestionBuffer
+from app.scraper.parsing import ListingParser, PageResult, ParsedPage
+from app.scraper.crawl_state import CrawlState, listing_fingerprint, page_fingerprint
+
+SITE_ROOT = "https://koutchoumi.com"
+
+class TokenBucket:
+    """Budget de politesse : `rate` requêtes par seconde, rafales de `capacity` requêtes"""
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Bloque jusqu'à ce qu'un jeton soit disponible"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
 
 class KoutchoumiScraper:
-    def __init__(self):
-        """Initialise le scraper avec les configurations nécessaires"""
-        self.base_urls = {
-            'Yaoundé': "https://koutchoumi.com/appartements-a-louer-a-yaounde-cameroun.html",
-            'Douala': "https://koutchoumi.com/appartements-a-louer-a-douala-cameroun.html"
+    def __init__(self, db=None, base_urls: Optional[Dict[str, str]] = None,
+                 site_root: str = SITE_ROOT, batch_size: int = 200, incremental: bool = False):
+        """
+        Initialise le scraper avec les configurations nécessaires.
+
+        En mode incrémental, les pages sont demandées conditionnellement
+        (ETag / If-Modified-Since), seules les annonces nouvelles ou modifiées
+        sont écrites, et la pagination d'une ville s'arrête à la première
+        page sans changement.
+        """
+        self.site_root = site_root
+        self.base_urls = base_urls or {
+            'Yaoundé': f"{site_root}/appartements-a-louer-a-yaounde-cameroun.html",
+            'Douala': f"{site_root}/appartements-a-louer-a-douala-cameroun.html"
         }
-        self.db = DatabaseConnection()
+        self.db = db if db is not None else DatabaseConnection.shared()
+        self.classifier = ApartmentClassifier(self.db)
+        ensure_indexes(self.db)
+        self.history = ObservationStore(self.db)
+        self.history.ensure_indexes()
+        self.ingestion = IngestionBuffer(self.db, batch_size, history=self.history)
+        self.parser = ListingParser(site_root)
+        self.incremental = incremental
+        self.crawl_state = CrawlState(self.db)
+        self.crawl_stats = Counter()
+        self._stats_lock = threading.Lock()
         self.session = self._init_session()
+        self._local = threading.local()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._buckets_lock = threading.Lock()
+        self.requests_per_second = 1.0
+        self.burst = 2
         
-        # Configuration du logging
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s'
-        )
         self.logger = logging.getLogger(__name__)
+        if self.incremental:
+            known = self.crawl_state.load()
+            self.logger.info("Crawl incrémental : %d page(s) connue(s)", known)
         
     def _init_session(self) -> requests.Session:
         """Initialise une session HTTP avec retry et timeout"""
@@ -45,122 +103,101 @@ class KoutchoumiScraper:
 
     def determiner_categorie(self, prix: int) -> str:
         """Détermine la catégorie de l'appartement en fonction du prix"""
-        if prix < 100000:
-            return "Low Cost"
-        elif prix < 300000:
-            return "Moyen"
-        else:
-            return "Luxueux"
+        return self.parser.determiner_categorie(prix)
 
     def extract_apartment_info(self, card, ville: str) -> Optional[Dict[str, Any]]:
         """Extrait les informations d'un appartement depuis une carte"""
-        try:
-            # Extraction du prix
-            price_element = card.find('h2', class_='text-primary')
-            if not price_element:
-                return None
-
-            prix_text = price_element.get_text(strip=True)
-            prix_match = re.search(r'(\d+[\s\d]*)\s*F', prix_text)
-            prix = int(prix_match.group(1).replace(' ', '')) if prix_match else 0
-
-            # Extraction du quartier
-            quartier_match = re.search(r'\|\s*(.*?),', prix_text)
-            quartier = quartier_match.group(1).strip() if quartier_match else ''
-
-            # Extraction du nombre de chambres
-            description = card.find('h3', class_='card-title')
-            if not description:
-                return None
-
-            description_text = description.get_text(strip=True)
-            chambres_match = re.search(r'(\d+)\s*chambre', description_text.lower())
-            nb_chambres = int(chambres_match.group(1)) if chambres_match else 0
-
-            # Extraction de l'URL
-            url_element = card.find('a', href=True)
-            url = url_element['href'] if url_element else ''
-            if url and not url.startswith('http'):
-                url = f"https://koutchoumi.com{url}"
-
-            # Extraction de la popularité
-            popularite = 0
-            views_span = card.find_all('span')
-            for span in views_span:
-                if 'vues' in span.text.lower():
-                    views_match = re.search(r'(\d+)\s*vues', span.text)
-                    popularite = int(views_match.group(1)) if views_match else 0
-                    break
-
-            return {
-                'titre': f"{prix} F | {quartier}, {ville}",
-                'ville': ville,
-                'quartier': quartier,
-                'prix': prix,
-                'nb_chambres': nb_chambres,
-                'description': description_text,
-                'popularite': popularite,
-                'url_annonce': url,
-                'categorie': self.determiner_categorie(prix),
-                'date_ajout': datetime.now(),
-                'derniere_maj': datetime.now()
-            }
-
-        except Exception as e:
-            self.logger.error(f"Erreur lors de l'extraction des données : {str(e)}")
-            return None
+        return self.parser.extract_apartment_info(card, ville)
 
     def scrape_page(self, url: str, ville: str) -> Optional[str]:
         """Scrape une page et retourne l'URL de la page suivante"""
         try:
-            self.logger.info(f"Scraping de l'URL : {url}")
-            response = self.session.get(url, timeout=30)
-            response.raise_for_status()
+            self.logger.debug("Scraping de l'URL : %s", url)
+            response = self._get(self.session, url)
             
-            soup = BeautifulSoup(response.content, 'html.parser')
-            apartment_cards = soup.find_all('div', class_='card card-list')
-            
-            for card in apartment_cards:
-                data = self.extract_apartment_info(card, ville)
-                if data:
-                    # Vérification de l'existence
-                    existing = self.db.db.apartments.find_one({"url_annonce": data['url_annonce']})
-                    
-                    if not existing:
-                        self.db.save_apartment(data)
-                        self.logger.info(f"✅ Nouvel appartement ajouté: {data['titre'][:50]}...")
-                    else:
-                        # Mise à jour
-                        self.db.db.apartments.update_one(
-                            {"url_annonce": data['url_annonce']},
-                            {"$set": {
-                                "prix": data['prix'],
-                                "popularite": data['popularite'],
-                                "description": data['description'],
-                                "derniere_maj": datetime.now()
-                            }}
-                        )
-                        self.logger.info(f"🔄 Appartement mis à jour: {data['titre'][:50]}...")
-
-            # Recherche de la page suivante
-            next_page = None
-            pagination = soup.find('ul', class_='pagination')
-            if pagination:
-                current_page = pagination.find('li', class_='active')
-                if current_page:
-                    next_li = current_page.find_next_sibling('li')
-                    if next_li and next_li.find('a'):
-                        next_url = next_li.find('a')['href']
-                        if not next_url.startswith('http'):
-                            next_page = f"https://koutchoumi.com{next_url}"
+            result = self.handle_page(url, ville, response)
 
             time.sleep(2)  # Délai pour éviter la surcharge
-            return next_page
+            if result.unchanged:
+                self.logger.info("Page inchangée, fin de la pagination : %s", url)
+                return None
+            return result.next_page
 
         except Exception as e:
             self.logger.error(f"Erreur lors du scraping de la page : {str(e)}")
             return None
 
+    def process_page(self, content: bytes, ville: str,
+                     page_url: Optional[str] = None) -> PageResult:
+        """
+        Enregistre les annonces d'une page déjà téléchargée.
+
+        Retourne l'URL de la page suivante et les URLs de la pagination.
+        """
+        parsed = self.parser.parse(content, ville, page_url)
+        return self._ingest_page(page_url, parsed)
+
+    def handle_page(self, url: str, ville: str, response: requests.Response,
+                    parsed: Optional[ParsedPage] = None) -> PageResult:
+        """Traite la réponse d'une page (analysée ou non), y compris un 304"""
+        if response.status_code == 304:
+            self._count(pages_not_modified=1)
+            return PageResult(None, unchanged=True)
+        self._count(pages_fetched=1)
+        if parsed is None:
+            parsed = self.parser.parse(response.content, ville, url)
+        return self._ingest_page(url, parsed, response)
+
+    def _ingest_page(self, url: Optional[str], parsed: ParsedPage,
+                     response: Optional[requests.Response] = None) -> PageResult:
+        listings = parsed.listings
+        for listing in listings:
+            listing['empreinte'] = listing_fingerprint(listing)
+        if not self.incremental:
+            self.ingest(listings)
+            return parsed.page
+
+        # Empreinte de page identique : aucune annonce à relire en base
+        fingerprint = page_fingerprint(listings)
+        if listings and self.crawl_state.get(url).get('empreinte') == fingerprint:
+            changed = []
+        else:
+            known = self.db.get_fingerprints(listing['url_annonce'] for listing in listings)
+            changed = [l for l in listings if known.get(l['url_annonce']) != l['empreinte']]
+        # Toutes les annonces sont écrites : le contenu des annonces inchangées
+        # n'est pas réécrit, mais leur popularité (hors empreinte) est mise à
+        # jour. État de la page enregistré seulement une fois le lot écrit.
+        self.ingest(listings, on_written=lambda: self.crawl_state.save(url, fingerprint, response))
+
+        self._count(listings_changed=len(changed), listings_skipped=len(listings) - len(changed))
+        if listings and not changed:
+            self._count(pages_unchanged=1)
+            parsed.page.unchanged = True
+        return parsed.page
+
+    def _count(self, **counts: int):
+        with self._stats_lock:
+            self.crawl_stats.update(counts)
+
+    def _get(self, session: requests.Session, url: str) -> requests.Response:
+        """GET (conditionnel en mode incrémental) ; un 304 n'est pas une erreur"""
+        headers = self.crawl_state.conditional_headers(url) if self.incremental else {}
+        response = session.get(url, timeout=30, headers=headers)
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response
+
+    def ingest(self, listings: List[Dict[str, Any]],
+               on_written: Optional[Callable[[], Any]] = None):
+        """Classe et met en tampon les annonces d'une page analysée"""
+        if not listings and on_written is None:
+            return
+        # Classification de toute la page en une seule passe vectorisée
+        self.classifier.tag_documents(listings)
+
+        # Écriture groupée (upserts) dès que le lot est plein
+        self.ingestion.add(listings, on_written)
+
     def scrape_city(self, ville: str):
         """Scrape tous les appartements d'une ville"""
         if ville not in self.base_urls:
@@ -180,11 +217,10 @@ class KoutchoumiScraper:
 
             current_url = next_url
             page_number += 1
-            
-            # Comptage
-            count = self.db.db.apartments.count_documents({"ville": ville})
-            self.logger.info(f"Total d'appartements pour {ville} : {count}")
 
+        self.ingestion.flush()
+        classified = self.classifier.refresh_classifications()
+        self.logger.info("%d appartement(s) classé(s) pour %s", classified, ville)
         self.logger.info(f"Scraping terminé pour {ville}!")
 
     def run(self):
@@ -193,8 +229,176 @@ class KoutchoumiScraper:
         for ville in self.base_urls.keys():
             self.scrape_city(ville)
             time.sleep(5)  # Pause entre les villes
-        self.logger.info("Scraping terminé!")
+        self.logger.info("Scraping terminé! %s", dict(self.ingestion.totals))
+        self._log_crawl_stats()
+        self.history.refresh_rollups()
+        self.refresh_dashboard()
+
+    def _log_crawl_stats(self):
+        if self.incremental:
+            stats = self.crawl_stats
+            self.logger.info(
+                "Crawl incrémental : %d page(s) téléchargée(s), %d non modifiée(s) (304), "
+                "%d sans changement ; %d annonce(s) modifiée(s), %d inchangée(s) (vues seulement)",
+                stats['pages_fetched'], stats['pages_not_modified'], stats['pages_unchanged'],
+                stats['listings_changed'], stats['listings_skipped']
+            )
+
+    def refresh_dashboard(self):
+        """Recalcule le tableau de bord pré-calculé après un scraping"""
+        try:
+            from app.visualizations.dashboard import DashboardRefresher
+            DashboardRefresher(self.db).refresh()
+        except Exception as e:
+            self.logger.error("Erreur lors du rafraîchissement du tableau de bord : %s", e)
+
+    def run_concurrent(self, max_workers: int = 4, requests_per_second: float = 1.0,
+                       burst: int = 2, parse_workers: int = 2):
+        """
+        Lance le scraping de toutes les villes en parallèle.
+
+        Les pages sont téléchargées par un pool borné de `max_workers` threads
+        (nombre maximal de requêtes simultanées). Chaque hôte dispose d'un
+        budget de politesse (TokenBucket) au lieu de pauses fixes, et toutes
+        les pages listées dans la pagination sont planifiées dès qu'elles
+        sont découvertes.
+
+        L'analyse HTML tourne dans un pool séparé de `parse_workers`
+        processus, de sorte que téléchargements et analyse se recouvrent
+        (0 : analyse dans les threads de téléchargement).
+
+        En mode incrémental, chaque ville suit uniquement le lien « page
+        suivante » et s'arrête à la première page sans changement.
+        """
+        self.logger.info("Début du scraping concurrent (%d workers, %d processus d'analyse)",
+                         max_workers, parse_workers)
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self._buckets = {}
+        pages = Counter()
+        seen = set()
+        pending = {}
+
+        parse_pool = None
+        if parse_workers > 0:
+            # spawn : les processus d'analyse n'héritent pas du client MongoDB
+            parse_pool = ProcessPoolExecutor(parse_workers,
+                                             mp_context=multiprocessing.get_context('spawn'))
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='scraper') as pool, \
+                (parse_pool or nullcontext()):
+            def submit(url: str, ville: str):
+                if url not in seen:
+                    seen.add(url)
+                    if parse_pool is None:
+                        pending[pool.submit(self._crawl_page, url, ville)] = (ville, url, 'crawl', None)
+                    else:
+                        pending[pool.submit(self._fetch_page, url)] = (ville, url, 'fetch', None)
+
+            for ville, url in self.base_urls.items():
+                submit(url, ville)
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    ville, url, stage, response = pending.pop(future)
+                    if stage == 'fetch':
+                        response = future.result()
+                        if response is None:
+                            continue
+                        if response.status_code != 304:
+                            pending[parse_pool.submit(self.parser.parse, response.content, ville, url)] = \
+                                (ville, url, 'parse', response)
+                            continue
+                        result = self.handle_page(url, ville, response)
+                    elif stage == 'parse':
+                        try:
+                            result = self.handle_page(url, ville, response, future.result())
+                        except Exception as e:
+                            self.logger.error("Erreur lors de l'analyse de la page %s : %s", url, e)
+                            continue
+                    else:
+                        result = future.result()
+                    if result is None:
+                        continue
+                    pages[ville] += 1
+                    if self.incremental:
+                        if result.unchanged:
+                            self.logger.info("Page inchangée, fin de la pagination : %s", url)
+                        elif result.next_page:
+                            submit(result.next_page, ville)
+                        continue
+                    if result.current_link:
+                        seen.add(result.current_link)
+                    for link in result.links:
+                        submit(link, ville)
+
+        self.ingestion.flush()
+        for ville in self.base_urls:
+            self.logger.info("📄 %d page(s) traitée(s) pour %s", pages[ville], ville)
+        classified = self.classifier.refresh_classifications()
+        self.logger.info("%d appartement(s) classé(s)", classified)
+        self.logger.info("Scraping terminé! %s", dict(self.ingestion.totals))
+        self._log_crawl_stats()
+        self.history.refresh_rollups()
+        self.refresh_dashboard()
+        return dict(pages)
+
+    def _fetch_page(self, url: str) -> Optional[requests.Response]:
+        """Télécharge une page (None en cas d'échec)"""
+        try:
+            self._bucket_for(url).acquire()
+            self.logger.debug("Scraping de l'URL : %s", url)
+            return self._get(self._thread_session(), url)
+        except Exception as e:
+            self.logger.error("Erreur lors du scraping de la page %s : %s", url, e)
+            return None
+
+    def _crawl_page(self, url: str, ville: str) -> Optional[PageResult]:
+        """Télécharge et traite une page (None en cas d'échec)"""
+        response = self._fetch_page(url)
+        if response is None:
+            return None
+        try:
+            return self.handle_page(url, ville, response)
+        except Exception as e:
+            self.logger.error("Erreur lors du traitement de la page %s : %s", url, e)
+            return None
+
+    def _bucket_for(self, url: str) -> TokenBucket:
+        host = urlparse(url).netloc
+        with self._buckets_lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.requests_per_second, self.burst)
+            return self._buckets[host]
+
+    def _thread_session(self) -> requests.Session:
+        """Une session HTTP par thread (requests.Session n'est pas thread-safe)"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self._init_session()
+        return session
 
 if __name__ == "__main__":
-    scraper = KoutchoumiScraper()
-    scraper.run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Scraper des annonces Koutchoumi")
+    parser.add_argument('--concurrent', action='store_true',
+                        help="villes et pages en parallèle avec budget de politesse par hôte")
+    parser.add_argument('--workers', type=int, default=4,
+                        help="nombre maximal de requêtes simultanées")
+    parser.add_argument('--rate', type=float, default=1.0,
+                        help="requêtes par seconde et par hôte")
+    parser.add_argument('--burst', type=int, default=2,
+                        help="rafale maximale de requêtes par hôte")
+    parser.add_argument('--parse-workers', type=int, default=2,
+                        help="processus d'analyse HTML (0 : analyse dans les threads réseau)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="requêtes conditionnelles, annonces inchangées ignorées, arrêt "
+                             "à la première page sans changement")
+    args = parser.parse_args()
+
+    configure_logging()
+    scraper = KoutchoumiScraper(incremental=args.incremental)
+    if args.concurrent:
+        scraper.run_concurrent(args.workers, args.rate, args.burst, args.parse_workers)
+    else:
+        scraper.run()
\ No newline at end of file
@@ -0,0 +1,131 @@
+"""
+Cache disque des graphiques rendus.
+
+Un graphique est identifié par le hachage de ses paramètres et des données
+agrégées qui l'alimentent : tant que l'agrégat ne change pas, le PNG déjà
+rendu est réutilisé. Les fichiers sont écrits de façon atomique (fichier
+temporaire puis os.replace), ce qui permet à plusieurs workers de partager
+le même répertoire. Le nom de fichier contenant le hachage, il sert aussi
+d'ETag.
+
+Éviction configurable :
+- CHART_CACHE_MAX_ENTRIES : nombre maximal de fichiers (64 par défaut)
+- CHART_CACHE_MAX_AGE     : âge maximal en secondes depuis le dernier accès
+"""
+
+from typing import Any, Callable, Dict, Optional
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+# pyplot n'est pas thread-safe : un seul rendu à la fois par processus
+RENDER_LOCK = threading.Lock()
+
+
+class ChartCache:
+    SUFFIX = '.png'
+
+    def __init__(self, cache_dir: str, max_entries: int = 64,
+                 max_age: Optional[float] = None):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.logger = logging.getLogger(__name__)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, cache_dir: str) -> 'ChartCache':
+        max_age = os.environ.get('CHART_CACHE_MAX_AGE')
+        return cls(
+            os.environ.get('CHART_CACHE_DIR', cache_dir),
+            max_entries=int(os.environ.get('CHART_CACHE_MAX_ENTRIES', 64)),
+            max_age=float(max_age) if max_age else None
+        )
+
+    @staticmethod
+    def content_key(params: Dict[str, Any], data: Any) -> str:
+        """Hachage des paramètres du graphique et des données agrégées"""
+        payload = json.dumps({'params': params, 'data': data},
+                             sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+    def filename(self, name: str, key: str) -> str:
+        return f"{name}_{key}{self.SUFFIX}"
+
+    def path(self, filename: str) -> str:
+        return os.path.join(self.cache_dir, filename)
+
+    def get_or_render(self, name: str, params: Dict[str, Any], data: Any,
+                      render: Callable[[str], None]) -> str:
+        """
+        Retourne le chemin du PNG correspondant à (params, data).
+
+        `render(path)` n'est appelé que si ce contenu n'a encore jamais été
+        rendu ; il doit écrire un PNG à l'emplacement donné.
+        """
+        filepath = self.path(self.filename(name, self.content_key(params, data)))
+        if os.path.exists(filepath):
+            self._touch(filepath)
+            return filepath
+
+        with RENDER_LOCK:
+            # Un autre thread a pu rendre le même graphique entre-temps
+            if os.path.exists(filepath):
+                return filepath
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            os.close(fd)
+            try:
+                render(tmp_path)
+                os.replace(tmp_path, filepath)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+        self.logger.info("Graphique rendu : %s", os.path.basename(filepath))
+        self.evict()
+        return filepath
+
+    def evict(self) -> int:
+        """Supprime les fichiers expirés puis les moins récemment utilisés"""
+        try:
+            filenames = os.listdir(self.cache_dir)
+        except OSError as e:
+            self.logger.warning("Éviction du cache des graphiques impossible : %s", e)
+            return 0
+
+        entries = []
+        for filename in filenames:
+            if filename.endswith(self.SUFFIX):
+                filepath = self.path(filename)
+                try:
+                    entries.append((os.stat(filepath).st_atime, filepath))
+                except FileNotFoundError:
+                    pass
+
+        entries.sort(reverse=True)
+        expired = entries[self.max_entries:]
+        if self.max_age is not None:
+            cutoff = time.time() - self.max_age
+            expired += [e for e in entries[:self.max_entries] if e[0] < cutoff]
+
+        removed = 0
+        for _, filepath in expired:
+            try:
+                os.remove(filepath)
+                removed += 1
+            except FileNotFoundError:
+                # Déjà supprimé par un autre worker
+                pass
+        return removed
+
+    def _touch(self, filepath: str):
+        # La date d'accès sert d'horodatage LRU ; la date de modification
+        # (Last-Modified) reste celle du rendu
+        try:
+            os.utime(filepath, (time.time(), os.path.getmtime(filepath)))
+        except OSError:
+            pass
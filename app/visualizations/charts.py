@@ -1,22 +1,28 @@
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import seaborn as sns
-import numpy as np
-import pandas as pd
 import os
 from app.database.db_config import DatabaseConnection
+from app.visualizations.chart_cache import ChartCache
+from app.instrumentation import timed
 from typing import Dict, Optional, List, Any
 import logging
 import unicodedata
 
+
+def _pyplot():
+    """Importe matplotlib au premier rendu (backend Agg), pas au démarrage du worker"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
 class AppartementVisualizer:
-    def __init__(self):
+    def __init__(self, db=None, chart_cache: Optional[ChartCache] = None):
         """Initialise le visualiseur avec logging"""
         self.logger = logging.getLogger(__name__)
         self.image_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static", "images")
         os.makedirs(self.image_dir, exist_ok=True)
-        self.db = DatabaseConnection()
+        self.db = db if db is not None else DatabaseConnection.shared()
+        # Graphiques rendus une seule fois par contenu agrégé
+        self.chart_cache = chart_cache or ChartCache.from_env(os.path.join(self.image_dir, "cache"))
 
     def cleanup_images(self):
         """Nettoie les anciennes images"""
@@ -25,6 +31,8 @@ class AppartementVisualizer:
                 if filename.startswith(('distribution_chambres_', 'top_appartements_')):
                     file_path = os.path.join(self.image_dir, filename)
                     os.remove(file_path)
+            for filename in os.listdir(self.chart_cache.cache_dir):
+                os.remove(self.chart_cache.path(filename))
         except Exception as e:
             self.logger.error(f"Erreur lors du nettoyage des images: {str(e)}")
     
@@ -36,43 +44,135 @@ class AppartementVisualizer:
         normalized = unicodedata.normalize('NFKD', ville).encode('ASCII', 'ignore').decode('ASCII')
         return normalized.lower()
 
+    @staticmethod
+    def _dashboard_pipeline(villes: List[str], limit: int) -> List[Dict[str, Any]]:
+        """
+        Agrégation unique du tableau de bord ($facet).
+
+        Chaque branche calcule un indicateur pour toutes les villes à la fois
+        (regroupement par ville) et pour l'ensemble ; les tops sont limités
+        par une branche $sort + $limit par ville.
+        """
+        totals = {"total": {"$sum": 1}, "prix_moyen": {"$avg": "$prix"}}
+        per_chambre = {"count": {"$sum": 1}, "prix_moyen": {"$avg": "$prix"}}
+        with_chambres = {"$match": {"nb_chambres": {"$ne": None}}}
+        with_quartier = {"$match": {"quartier": {"$exists": True}}}
+        top = [
+            {"$sort": {"popularite": -1, "prix": 1}},
+            {"$limit": limit},
+            {"$project": {"titre": 1, "quartier": 1, "prix": 1, "popularite": 1, "nb_chambres": 1}}
+        ]
+
+        facets = {
+            "totaux": [{"$group": {"_id": "$ville", **totals}}],
+            "totaux_global": [{"$group": {"_id": None, **totals}}],
+            # Quartiers distincts comptés par regroupement, sans tableau $addToSet
+            "quartiers": [
+                with_quartier,
+                {"$group": {"_id": {"ville": "$ville", "quartier": "$quartier"}}},
+                {"$group": {"_id": "$_id.ville", "count": {"$sum": 1}}}
+            ],
+            "quartiers_global": [
+                with_quartier,
+                {"$group": {"_id": "$quartier"}},
+                {"$count": "count"}
+            ],
+            "chambres": [
+                with_chambres,
+                {"$group": {"_id": {"ville": "$ville", "nb_chambres": "$nb_chambres"}, **per_chambre}},
+                {"$sort": {"_id.nb_chambres": 1}}
+            ],
+            "chambres_global": [
+                with_chambres,
+                {"$group": {"_id": "$nb_chambres", **per_chambre}},
+                {"$sort": {"_id": 1}}
+            ],
+            "top_global": top
+        }
+        for i, ville in enumerate(villes):
+            facets[f"top_{i}"] = [{"$match": {"ville": ville}}] + top
+
+        return [{"$match": {"prix": {"$gt": 0}}}, {"$facet": facets}]
+
+    @staticmethod
+    def _format_stats(total: int, quartiers: int, prix_moyen: Optional[float]) -> Dict[str, Any]:
+        return {
+            'total_appartements': total,
+            'quartiers_couverts': quartiers,
+            'prix_moyen': f"{int(prix_moyen):,} FCFA"
+        }
+
+    @timed('dashboard.aggregate')
+    def get_dashboard_data(self, villes: List[str], limit: int = 5) -> Dict[Optional[str], Dict[str, Any]]:
+        """
+        Données de toutes les vues du tableau de bord en un seul aller-retour.
+
+        Retourne, pour l'ensemble (clé None) et pour chaque ville de `villes`,
+        les statistiques, la distribution des chambres et le top `limit`.
+        """
+        result = next(iter(self.db.db.apartments.aggregate(
+            self._dashboard_pipeline(villes, limit)
+        )))
+
+        quartiers = {q['_id']: q['count'] for q in result['quartiers']}
+        quartiers_global = result['quartiers_global'][0]['count'] if result['quartiers_global'] else 0
+        totaux = {t['_id']: t for t in result['totaux']}
+
+        views = {None: {
+            'stats': self._format_stats(result['totaux_global'][0]['total'], quartiers_global,
+                                        result['totaux_global'][0]['prix_moyen'])
+            if result['totaux_global'] else {},
+            'distribution': result['chambres_global'],
+            'top': result['top_global']
+        }}
+        for i, ville in enumerate(villes):
+            totaux_ville = totaux.get(ville)
+            views[ville] = {
+                'stats': self._format_stats(totaux_ville['total'], quartiers.get(ville, 0),
+                                            totaux_ville['prix_moyen'])
+                if totaux_ville else {},
+                'distribution': [
+                    {'_id': c['_id']['nb_chambres'], 'count': c['count'], 'prix_moyen': c['prix_moyen']}
+                    for c in result['chambres'] if c['_id'].get('ville') == ville
+                ],
+                'top': result[f"top_{i}"]
+            }
+        return views
+
+    @staticmethod
+    def chart_series(ville: Optional[str], distribution: List[Dict], top: List[Dict],
+                     limit: int = 5) -> Dict[str, Any]:
+        """Séries compactes des deux graphiques, pour un rendu côté navigateur"""
+        suffix = ' à ' + ville if ville else ''
+        return {
+            'distribution': {
+                'title': f"Distribution des Appartements par Nombre de Chambres{suffix}",
+                'x': [d['_id'] for d in distribution],
+                'y': [d['count'] for d in distribution],
+                'prix_moyen': [round(d['prix_moyen']) for d in distribution]
+            },
+            'top': {
+                'title': f"Top {limit} Appartements les Plus Consultés{suffix}",
+                'labels': [f"{d['prix']:,} FCFA | {d['quartier']} ({d['nb_chambres']} ch)" for d in top],
+                'values': [d['popularite'] for d in top]
+            }
+        }
+
     def get_stats_globales(self, ville: Optional[str] = None) -> Dict[str, Any]:
         """Récupère uniquement les statistiques essentielles : total appartements, quartiers et prix moyen"""
         try:
-            # Construire le filtre MongoDB
-            match_filter = {"prix": {"$gt": 0}}
-            if ville:
-                match_filter["ville"] = ville
-
-            pipeline = [
-                {"$match": match_filter},
-                {"$group": {
-                    "_id": None,
-                    "total": {"$sum": 1},
-                    "total_quartiers": {"$addToSet": "$quartier"},
-                    "prix_moyen": {"$avg": "$prix"}
-                }}
-            ]
-
-            result = list(self.db.db.apartments.aggregate(pipeline))
-
-            if not result:
-                return {}
-
-            prix_moyen = f"{int(result[0]['prix_moyen']):,} FCFA"
-
-            return {
-                'total_appartements': result[0]['total'],
-                'quartiers_couverts': len(result[0]['total_quartiers']),
-                'prix_moyen': prix_moyen
-            }
+            villes = [ville] if ville else []
+            return self.get_dashboard_data(villes)[ville]['stats']
 
         except Exception as e:
             self.logger.error(f"Erreur lors de la génération des statistiques: {str(e)}")
             return {}
 
-    def plot_distribution_chambres(self, ville: Optional[str] = None) -> str:
-        """Génère le graphique de distribution des chambres"""
+    def plot_distribution_chambres(self, ville: Optional[str] = None,
+                                   data: Optional[List[Dict]] = None) -> str:
+        """Génère (ou réutilise) le graphique de distribution des chambres"""
+        if data is not None:
+            return self._cached_distribution_chambres(ville, data)
         try:
             # Construire le filtre MongoDB
             match_filter = {"prix": {"$gt": 0}, "nb_chambres": {"$ne": None}}
@@ -90,49 +190,66 @@ class AppartementVisualizer:
             ]
 
             data = list(self.db.db.apartments.aggregate(pipeline))
+            return self._cached_distribution_chambres(ville, data)
 
+        except Exception as e:
+            self.logger.error(f"Erreur lors de la génération du graphique: {str(e)}")
+            return ""
+
+    def _cached_distribution_chambres(self, ville: Optional[str], data: List[Dict]) -> str:
+        try:
             if not data:
                 self.logger.warning("Aucune donnée trouvée pour la distribution des chambres")
                 return ""
 
-            plt.style.use('seaborn-v0_8-whitegrid')
-            plt.rcParams['axes.grid'] = False
+            return self.chart_cache.get_or_render(
+                f"distribution_chambres_{self._normalize_ville(ville)}",
+                {'ville': ville, 'dpi': 300},
+                data,
+                lambda filepath: self._render_distribution_chambres(data, ville, filepath)
+            )
 
-            plt.figure(figsize=(12, 6))
+        except Exception as e:
+            self.logger.error(f"Erreur lors de la génération du graphique: {str(e)}")
+            return ""
 
-            nb_chambres = [d['_id'] for d in data]
-            counts = [d['count'] for d in data]
+    @timed('chart.render')
+    def _render_distribution_chambres(self, data: List[Dict], ville: Optional[str], filepath: str):
+        """Rendu matplotlib de la distribution des chambres dans `filepath`"""
+        plt = _pyplot()
+        plt.style.use('seaborn-v0_8-whitegrid')
+        plt.rcParams['axes.grid'] = False
 
-            bars = plt.bar(nb_chambres, counts, color='#4169E1', alpha=0.7)
+        plt.figure(figsize=(12, 6))
 
-            plt.title(f"Distribution des Appartements par Nombre de Chambres{' à ' + ville if ville else ''}")
-            plt.xlabel("Nombre de Chambres")
-            plt.ylabel("Nombre d'Appartements")
+        nb_chambres = [d['_id'] for d in data]
+        counts = [d['count'] for d in data]
 
-            for bar in bars:
-                height = bar.get_height()
-                plt.text(bar.get_x() + bar.get_width()/2, height,
-                        f'{int(height):,}',
-                        ha='center', va='bottom')
+        bars = plt.bar(nb_chambres, counts, color='#4169E1', alpha=0.7)
 
-            plt.xticks(nb_chambres)
+        plt.title(f"Distribution des Appartements par Nombre de Chambres{' à ' + ville if ville else ''}")
+        plt.xlabel("Nombre de Chambres")
+        plt.ylabel("Nombre d'Appartements")
 
-            plt.gca().spines['top'].set_visible(False)
-            plt.gca().spines['right'].set_visible(False)
+        for bar in bars:
+            height = bar.get_height()
+            plt.text(bar.get_x() + bar.get_width()/2, height,
+                    f'{int(height):,}',
+                    ha='center', va='bottom')
 
-            filename = f"distribution_chambres_{self._normalize_ville(ville)}.png"  # Correction du préfixe
-            filepath = os.path.join(self.image_dir, filename)
-            plt.savefig(filepath, bbox_inches='tight', dpi=300)
-            plt.close()
+        plt.xticks(nb_chambres)
 
-            return filepath
+        plt.gca().spines['top'].set_visible(False)
+        plt.gca().spines['right'].set_visible(False)
 
-        except Exception as e:
-            self.logger.error(f"Erreur lors de la génération du graphique: {str(e)}")
-            return ""
+        plt.savefig(filepath, format='png', bbox_inches='tight', dpi=300)
+        plt.close()
 
-    def plot_top_appartements(self, ville: Optional[str] = None, limit: int = 5) -> str:
-        """Génère le graphique des appartements les plus populaires"""
+    def plot_top_appartements(self, ville: Optional[str] = None, limit: int = 5,
+                              data: Optional[List[Dict]] = None) -> str:
+        """Génère (ou réutilise) le graphique des appartements les plus populaires"""
+        if data is not None:
+            return self._cached_top_appartements(ville, limit, data)
         try:
             # Construire le filtre MongoDB
             match_filter = {"prix": {"$gt": 0}}
@@ -153,59 +270,73 @@ class AppartementVisualizer:
             ]
 
             data = list(self.db.db.apartments.aggregate(pipeline))
+            return self._cached_top_appartements(ville, limit, data)
+
+        except Exception as e:
+            self.logger.error(f"Erreur lors de la génération du graphique: {str(e)}")
+            return ""
 
+    def _cached_top_appartements(self, ville: Optional[str], limit: int, data: List[Dict]) -> str:
+        try:
             if not data:
                 self.logger.warning("Aucune donnée trouvée pour les tops appartements")
                 return ""
 
-            plt.style.use('seaborn-v0_8-whitegrid')
-            plt.rcParams['axes.grid'] = False
+            return self.chart_cache.get_or_render(
+                f"top_appartements_{self._normalize_ville(ville)}",
+                {'ville': ville, 'limit': limit, 'dpi': 300},
+                data,
+                lambda filepath: self._render_top_appartements(data, ville, limit, filepath)
+            )
 
-            plt.figure(figsize=(14, 8))
+        except Exception as e:
+            self.logger.error(f"Erreur lors de la génération du graphique: {str(e)}")
+            return ""
 
-            titres = [f"{d['prix']:,} FCFA | {d['quartier']} ({d['nb_chambres']} ch)" for d in data][::-1]
-            popularite = [d['popularite'] for d in data][::-1]
+    @timed('chart.render')
+    def _render_top_appartements(self, data: List[Dict], ville: Optional[str], limit: int,
+                                 filepath: str):
+        """Rendu matplotlib du top des appartements dans `filepath`"""
+        import numpy as np
+        plt = _pyplot()
+        plt.style.use('seaborn-v0_8-whitegrid')
+        plt.rcParams['axes.grid'] = False
 
-            colors = plt.cm.viridis(np.linspace(0, 0.8, len(data)))
-            bars = plt.barh(titres, popularite, color=colors, alpha=0.7)
+        plt.figure(figsize=(14, 8))
 
-            plt.title(f"Top {limit} Appartements les Plus Consultés{' à ' + ville if ville else ''}", 
-                    pad=20, fontsize=12, fontweight='bold')
-            plt.xlabel("Nombre de Vues", fontsize=10)
+        titres = [f"{d['prix']:,} FCFA | {d['quartier']} ({d['nb_chambres']} ch)" for d in data][::-1]
+        popularite = [d['popularite'] for d in data][::-1]
 
-            for bar in bars:
-                x_val = bar.get_width()
-                y_val = bar.get_y() + bar.get_height()/2
-                plt.text(x_val + (max(popularite) * 0.02),
-                        y_val,
-                        f'{int(x_val):,}',
-                        va='center',
-                        ha='left',
-                        fontsize=9)
+        colors = plt.cm.viridis(np.linspace(0, 0.8, len(data)))
+        bars = plt.barh(titres, popularite, color=colors, alpha=0.7)
 
-            plt.subplots_adjust(left=0.3)
-            plt.margins(x=0.2)
+        plt.title(f"Top {limit} Appartements les Plus Consultés{' à ' + ville if ville else ''}", 
+                pad=20, fontsize=12, fontweight='bold')
+        plt.xlabel("Nombre de Vues", fontsize=10)
 
-            plt.gca().spines['top'].set_visible(False)
-            plt.gca().spines['right'].set_visible(False)
+        for bar in bars:
+            x_val = bar.get_width()
+            y_val = bar.get_y() + bar.get_height()/2
+            plt.text(x_val + (max(popularite) * 0.02),
+                    y_val,
+                    f'{int(x_val):,}',
+                    va='center',
+                    ha='left',
+                    fontsize=9)
 
-            filename = f"top_appartements_{self._normalize_ville(ville)}.png"  # Utilisation de la normalisation améliorée
-            filepath = os.path.join(self.image_dir, filename)
-            plt.savefig(filepath, bbox_inches='tight', dpi=300)
-            plt.close()
+        plt.subplots_adjust(left=0.3)
+        plt.margins(x=0.2)
 
-            return filepath
+        plt.gca().spines['top'].set_visible(False)
+        plt.gca().spines['right'].set_visible(False)
 
-        except Exception as e:
-            self.logger.error(f"Erreur lors de la génération du graphique: {str(e)}")
-            return ""
+        plt.savefig(filepath, format='png', bbox_inches='tight', dpi=300)
+        plt.close()
 
 if __name__ == "__main__":
-    # Configuration du logging
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s'
-    )
+    from app.logging_config import configure_logging
+
+    configure_logging()
     
     visualizer = AppartementVisualizer()
     visualizer.cleanup_images()
@@ -0,0 +1,224 @@
+"""
+Pré-calcul du tableau de bord.
+
+Les statistiques et graphiques du tableau de bord ne changent qu'après un
+scraping : DashboardRefresher les recalcule en arrière-plan (après chaque
+scraping ou périodiquement) et les publie dans la collection
+`dashboard_cache`, partagée par tous les workers Gunicorn. Les routes se
+contentent alors de lire cette collection : tant qu'une vue n'est pas
+publiée (premier démarrage), elles servent une vue vide et déclenchent le
+rafraîchissement en arrière-plan.
+
+Un seul worker rafraîchit à la fois grâce à un bail (lease) stocké dans la
+collection `locks` : le bail expire de lui-même si son détenteur meurt.
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+import logging
+import os
+import socket
+import threading
+import time
+
+from pymongo.errors import DuplicateKeyError
+
+from app.instrumentation import timed
+
+# Vues pré-calculées : toutes les villes, puis chaque ville
+DASHBOARD_VILLES = [None, 'Yaoundé', 'Douala']
+
+# Format des documents publiés : une vue d'un autre format est recalculée
+VIEW_FORMAT = 2
+
+
+def view_key(ville: Optional[str]) -> str:
+    return ville or 'all'
+
+
+class LeaseLock:
+    """Verrou distribué à durée limitée, stocké dans MongoDB"""
+
+    def __init__(self, db, name: str, lease_seconds: float = 300):
+        self.collection = db.db.locks
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+    def acquire(self) -> bool:
+        now = datetime.now()
+        try:
+            # Le bail n'est repris que s'il a expiré (ou s'il nous appartient déjà)
+            self.collection.find_one_and_update(
+                {"_id": self.name,
+                 "$or": [{"expires_at": {"$lt": now}}, {"owner": self.owner}]},
+                {"$set": {"owner": self.owner,
+                          "expires_at": now + timedelta(seconds=self.lease_seconds)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            # Bail détenu par un autre worker : l'upsert entre en conflit avec son document
+            return False
+
+    def release(self):
+        self.collection.delete_one({"_id": self.name, "owner": self.owner})
+
+
+class DashboardRefresher:
+    def __init__(self, db, visualizer=None, lease_seconds: float = 300):
+        self.db = db
+        self._visualizer = visualizer
+        self.store = db.db.dashboard_cache
+        self.lock = LeaseLock(db, 'dashboard_refresh', lease_seconds)
+        self.logger = logging.getLogger(__name__)
+        self._thread = None
+        self._pending = None
+        self._pending_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    @property
+    def visualizer(self):
+        # Import différé : le module des graphiques n'est chargé qu'au premier rendu
+        if self._visualizer is None:
+            from app.visualizations.charts import AppartementVisualizer
+            self._visualizer = AppartementVisualizer(self.db)
+        return self._visualizer
+
+    def data_version(self) -> str:
+        """Version des données : compteur de version, sinon dernière mise à jour et volume"""
+        version = self.db.get_data_version()
+        if version is not None:
+            return str(version)
+        latest = self.db.get_latest_update()
+        return f"{latest.isoformat() if latest else ''}|{self.db.estimated_count()}"
+
+    @timed('dashboard.get')
+    def get(self, ville: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Vue pré-calculée pour `ville`.
+
+        Lecture seule : si aucune vue n'a encore été publiée (premier
+        démarrage), une vue vide est retournée et le rafraîchissement est
+        lancé en arrière-plan (sous bail). Seules les villes de
+        DASHBOARD_VILLES ont une vue : toute autre valeur lève ValueError.
+        """
+        if ville not in DASHBOARD_VILLES:
+            raise ValueError(f"Ville absente du tableau de bord : {ville!r}")
+        view = self.store.find_one({"_id": view_key(ville)})
+        if view is None or view.get("format") != VIEW_FORMAT:
+            self.trigger()
+            return self.placeholder(ville)
+        return view
+
+    def placeholder(self, ville: Optional[str]) -> Dict[str, Any]:
+        """Vue vide servie tant que la vue de `ville` n'est pas publiée"""
+        return {
+            "_id": view_key(ville),
+            "format": VIEW_FORMAT,
+            "stats": {},
+            "charts": {'distribution': None, 'top': None},
+            "series": self.visualizer.chart_series(ville, [], []),
+            "data_version": "en-attente",
+            "pending": True
+        }
+
+    def trigger(self) -> threading.Thread:
+        """Lance un rafraîchissement en arrière-plan, sauf s'il y en a déjà un dans ce processus"""
+        with self._pending_lock:
+            if self._pending is None or not self._pending.is_alive():
+                self._pending = threading.Thread(target=self._refresh_logged,
+                                                 name='dashboard-refresh-now', daemon=True)
+                self._pending.start()
+            return self._pending
+
+    def is_stale(self, version: str) -> bool:
+        fresh = self.store.count_documents({"data_version": version, "format": VIEW_FORMAT,
+                                            "_id": {"$in": [view_key(v) for v in DASHBOARD_VILLES]}})
+        return fresh < len(DASHBOARD_VILLES)
+
+    def refresh(self, force: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Recalcule et publie toutes les vues si les données ont changé.
+
+        Retourne le compte rendu du rafraîchissement, ou None si les vues
+        sont à jour ou si un autre worker détient le bail.
+        """
+        version = self.data_version()
+        if not force and not self.is_stale(version):
+            return None
+        if not self.lock.acquire():
+            self.logger.info("Rafraîchissement du tableau de bord déjà en cours ailleurs")
+            return None
+
+        try:
+            start = time.perf_counter()
+            # Une seule agrégation alimente toutes les vues
+            data = self.visualizer.get_dashboard_data([v for v in DASHBOARD_VILLES if v])
+            for ville in DASHBOARD_VILLES:
+                view = self._compute(ville, data[ville], version)
+                self.store.replace_one({"_id": view["_id"]}, view, upsert=True)
+            duration_ms = (time.perf_counter() - start) * 1000
+            report = {
+                "_id": "dashboard_refresh",
+                "data_version": version,
+                "duration_ms": round(duration_ms, 1),
+                "refreshed_at": datetime.now(),
+                "owner": self.lock.owner
+            }
+            self.db.db.meta.replace_one({"_id": "dashboard_refresh"}, report, upsert=True)
+            self.logger.info("Tableau de bord rafraîchi (version %s) en %.0f ms", version, duration_ms)
+            return report
+        finally:
+            self.lock.release()
+
+    def _compute(self, ville: Optional[str], data: Dict[str, Any], version: str) -> Dict[str, Any]:
+        start = time.perf_counter()
+        charts = {
+            'distribution': os.path.basename(
+                self.visualizer.plot_distribution_chambres(ville, data=data['distribution'])
+            ),
+            'top': os.path.basename(self.visualizer.plot_top_appartements(ville, data=data['top']))
+        }
+        return {
+            "_id": view_key(ville),
+            "format": VIEW_FORMAT,
+            "stats": data['stats'],
+            "charts": charts,
+            "series": self.visualizer.chart_series(ville, data['distribution'], data['top']),
+            "data_version": version,
+            "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+            "refreshed_at": datetime.now()
+        }
+
+    def start(self, interval: float = 300) -> threading.Thread:
+        """Lance le rafraîchissement périodique dans un thread démon"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(interval,),
+                                            name='dashboard-refresh', daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, interval: float):
+        while not self._stop.is_set():
+            self._refresh_logged()
+            self._stop.wait(interval)
+
+    def _refresh_logged(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            self.logger.error(f"Erreur lors du rafraîchissement du tableau de bord : {e}")
+
+
+if __name__ == "__main__":
+    from app.database.db_config import DatabaseConnection
+    from app.logging_config import configure_logging
+
+    configure_logging()
+    report = DashboardRefresher(DatabaseConnection.shared()).refresh(force=True)
+    print(report)
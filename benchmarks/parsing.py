@@ -0,0 +1,210 @@
+"""
+Débit de l'analyse HTML du scraper (cartes d'annonces par seconde).
+
+Compare l'analyse d'origine (document complet, html.parser, parcours de
+tous les <span>) à ListingParser, avec chaque backend disponible, et
+vérifie que les annonces extraites sont identiques.
+
+Les pages par défaut sont celles de tests/fixtures/pages, partagées avec
+les tests du crawl : des pages de listing anonymisées (structure du site,
+annonces, identifiants et photos fictifs) ; --synthetic génère des pages
+de taille réglable.
+
+    python benchmarks/parsing.py                       # pages enregistrées (tests/fixtures/pages)
+    python benchmarks/parsing.py --fixtures pages/     # autre répertoire de pages (*.html)
+    python benchmarks/parsing.py --synthetic --pages 50 --cards 24 --json parsing.json
+    python benchmarks/parsing.py --workers 4          # + pool de processus d'analyse
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+
+from app.scraper.parsing import HTML_PARSER, ListingParser
+
+SITE_ROOT = "https://koutchoumi.com"
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            'tests', 'fixtures', 'pages')
+QUARTIERS = {'Yaoundé': ['Bastos', 'Odza', 'Essos', 'Mvog-Mbi'],
+             'Douala': ['Akwa', 'Kotto', 'Bali', 'Bonapriso']}
+
+
+def synthetic_page(ville: str, page: int, cards: int, rnd: random.Random) -> bytes:
+    """Page de listing proche du site : en-tête, filtres, cartes, pagination, pied de page"""
+    items = []
+    for i in range(cards):
+        quartier = rnd.choice(QUARTIERS[ville])
+        prix = rnd.choice([75000, 150000, 250000, 400000, 750000, 1500000])
+        chambres = rnd.randint(1, 5)
+        items.append(f'''
+<div class="col-md-6"><div class="card card-list">
+  <a href="/annonce/{ville.lower()}-{page}-{i}.html"><img class="card-img-top" src="/img/{i}.jpg" alt=""></a>
+  <div class="card-body">
+    <span class="badge badge-success">Nouveau</span>
+    <h2 class="text-primary">{prix:,} F | {quartier}, {ville}</h2>
+    <h3 class="card-title">Appartement {chambres} chambres à louer à {quartier}</h3>
+    <p class="card-text">{"Bel appartement moderne, eau et électricité. " * 3}</p>
+    <ul class="list-inline"><li><span><i class="fa fa-bed"></i> {chambres}</span></li>
+      <li><span><i class="fa fa-bath"></i> {rnd.randint(1, 3)}</span></li></ul>
+  </div>
+  <div class="card-footer"><span class="text-muted"><i class="fa fa-eye"></i> {rnd.randint(0, 900)} vues</span>
+    <span class="text-muted">il y a {rnd.randint(1, 30)} jours</span></div>
+</div></div>'''.replace(',', ' ', 1))
+    menu = ''.join(f'<li><a href="/rubrique/{k}.html">Rubrique {k}</a></li>' for k in range(40))
+    active = ' class="active"'
+    pagination = ''.join(
+        f'<li{active if p == page else ""}><a href="?page={p}">{p}</a></li>'
+        for p in range(max(1, page - 2), page + 3)
+    )
+    html = f'''<!DOCTYPE html><html><head><title>Appartements à louer</title>
+<script>{"var x = 1; " * 200}</script><style>{".a {{ color: red }} " * 200}</style></head>
+<body><nav><ul class="menu">{menu}</ul></nav>
+<aside><form>{"<select><option>x</option><option>y</option></select>" * 10}</form></aside>
+<div class="container"><div class="row">{"".join(items)}</div>
+<ul class="pagination">{pagination}</ul></div>
+<footer>{"<p>Koutchoumi - annonces immobilières au Cameroun</p>" * 20}</footer></body></html>'''
+    return html.encode('utf-8')
+
+
+def legacy_parse(content: bytes, ville: str) -> List[Dict[str, Any]]:
+    """Analyse d'origine du scraper (document complet, regex recompilées, parcours des <span>)"""
+    soup = BeautifulSoup(content, 'html.parser')
+    listings = []
+    for card in soup.find_all('div', class_='card card-list'):
+        price_element = card.find('h2', class_='text-primary')
+        if not price_element:
+            continue
+        prix_text = price_element.get_text(strip=True)
+        prix_match = re.search(r'(\d+[\s\d]*)\s*F', prix_text)
+        prix = int(prix_match.group(1).replace(' ', '')) if prix_match else 0
+        quartier_match = re.search(r'\|\s*(.*?),', prix_text)
+        quartier = quartier_match.group(1).strip() if quartier_match else ''
+        description = card.find('h3', class_='card-title')
+        if not description:
+            continue
+        description_text = description.get_text(strip=True)
+        chambres_match = re.search(r'(\d+)\s*chambre', description_text.lower())
+        nb_chambres = int(chambres_match.group(1)) if chambres_match else 0
+        url_element = card.find('a', href=True)
+        url = url_element['href'] if url_element else ''
+        if url and not url.startswith('http'):
+            url = f"{SITE_ROOT}{url}"
+        popularite = 0
+        for span in card.find_all('span'):
+            if 'vues' in span.text.lower():
+                views_match = re.search(r'(\d+)\s*vues', span.text)
+                popularite = int(views_match.group(1)) if views_match else 0
+                break
+        listings.append({'titre': f"{prix} F | {quartier}, {ville}", 'ville': ville,
+                         'quartier': quartier, 'prix': prix, 'nb_chambres': nb_chambres,
+                         'description': description_text, 'popularite': popularite,
+                         'url_annonce': url})
+    return listings
+
+
+def comparable(listings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    keys = ('titre', 'ville', 'quartier', 'prix', 'nb_chambres', 'description', 'popularite', 'url_annonce')
+    return [{k: listing[k] for k in keys} for listing in listings]
+
+
+def measure(parse: Callable[[bytes, str], List], pages: List[tuple], repeat: int) -> Dict[str, float]:
+    best = None
+    cards = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cards = sum(len(parse(content, ville)) for content, ville in pages)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {'cards': cards, 'seconds': best, 'cards_per_s': cards / best if best else 0.0}
+
+
+def measure_pool(listing_parser: ListingParser, pages: List[tuple], workers: int,
+                 repeat: int) -> Dict[str, float]:
+    """Débit du pool de processus d'analyse utilisé par run_concurrent"""
+    with ProcessPoolExecutor(workers) as pool:
+        # Démarrage des processus hors mesure
+        list(pool.map(listing_parser.parse, *zip(*pages[:workers])))
+        best = None
+        cards = 0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            cards = sum(len(parsed.listings)
+                        for parsed in pool.map(listing_parser.parse, *zip(*pages)))
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    return {'cards': cards, 'seconds': best, 'cards_per_s': cards / best if best else 0.0}
+
+
+def load_pages(args) -> List[tuple]:
+    if not args.synthetic:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(args.fixtures, '*.html'))):
+            # Ville déduite du nom de fichier (…douala…), Yaoundé par défaut
+            ville = 'Douala' if 'douala' in os.path.basename(path).lower() else 'Yaoundé'
+            with open(path, 'rb') as f:
+                pages.append((f.read(), ville))
+        return pages
+    rnd = random.Random(args.seed)
+    return [(synthetic_page(ville, page, args.cards, rnd), ville)
+            for page in range(1, args.pages + 1) for ville in QUARTIERS]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Débit de l'analyse HTML du scraper")
+    parser.add_argument('--fixtures', default=FIXTURES_DIR,
+                        help="répertoire de pages enregistrées (*.html, défaut : tests/fixtures/pages)")
+    parser.add_argument('--synthetic', action='store_true', help="pages synthétiques au lieu des pages enregistrées")
+    parser.add_argument('--pages', type=int, default=20, help="pages synthétiques par ville")
+    parser.add_argument('--cards', type=int, default=20, help="cartes par page synthétique")
+    parser.add_argument('--repeat', type=int, default=3, help="répétitions (meilleur temps retenu)")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="mesurer aussi un pool de N processus d'analyse")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="fichier de sortie JSON")
+    args = parser.parse_args()
+
+    pages = load_pages(args)
+    if not pages:
+        sys.exit("Aucune page à analyser")
+
+    variants = {'avant (html.parser, document complet)': legacy_parse}
+    backends = ['html.parser'] + (['lxml'] if HTML_PARSER == 'lxml' else [])
+    for backend in backends:
+        listing_parser = ListingParser(SITE_ROOT, parser=backend)
+        variants[f"ListingParser ({backend})"] = \
+            lambda content, ville, p=listing_parser: p.parse(content, ville).listings
+
+    reference = [comparable(legacy_parse(content, ville)) for content, ville in pages]
+    report = {'pages': len(pages), 'bytes': sum(len(c) for c, _ in pages), 'results': {}}
+    print(f"{len(pages)} page(s), {report['bytes'] / 1024:.0f} Ko")
+    for name, parse in variants.items():
+        identical = all(comparable(parse(content, ville)) == expected
+                        for (content, ville), expected in zip(pages, reference))
+        result = measure(parse, pages, args.repeat)
+        result['identical'] = identical
+        report['results'][name] = result
+        print(f"  {name:<40} {result['cards_per_s']:10.0f} cartes/s "
+              f"({result['cards']} cartes en {result['seconds'] * 1000:.0f} ms)"
+              f"{'' if identical else '  ⚠️  résultats différents'}")
+    if args.workers:
+        result = measure_pool(ListingParser(SITE_ROOT), pages, args.workers, args.repeat)
+        report['results'][f"pool de {args.workers} processus ({HTML_PARSER})"] = result
+        print(f"  {f'pool de {args.workers} processus ({HTML_PARSER})':<40} "
+              f"{result['cards_per_s']:10.0f} cartes/s")
+    if HTML_PARSER != 'lxml':
+        print("  (lxml non installé : backend html.parser uniquement)")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,271 @@
+"""
+Latence et débit des chemins critiques, sur des collections synthétiques.
+
+Pour chaque taille de collection (1k, 10k, 100k lignes par défaut ; 1M avec
+--sizes) :
+- chargement de ApartmentRecommender (instantané froid, puis à chaud)
+- latence de get_recommendations (p50 / p95 / p99) sans cache, avec le
+  cache de classement, puis de get_cached_recommendations (réponse en
+  cache), sur un mélange de requêtes réalistes
+- ApartmentClassifier.classify_apartments
+- AppartementVisualizer : agrégation du tableau de bord et rendu des graphiques
+
+    python benchmarks/recommendation.py                          # mongomock
+    python benchmarks/recommendation.py --sizes 1000 10000 100000 1000000 --json reco.json
+    python benchmarks/recommendation.py --backend mongod --uri mongodb://localhost:27017
+
+Avec --backend mongod, les données sont écrites dans une base dédiée
+(--database, koutchoumi_bench par défaut), vidée avant chaque taille : la
+base de l'application n'est jamais touchée. mongomock doit être installé
+pour le backend par défaut (pip install mongomock).
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+# Quartiers par ville, du plus au moins représenté, avec un niveau de prix relatif
+QUARTIERS = {
+    'Yaoundé': [('Bastos', 2.2), ('Odza', 0.9), ('Essos', 0.8), ('Biyem-Assi', 0.8),
+                ('Mvog-Mbi', 0.7), ('Nkolbisson', 0.6), ('Emana', 0.8), ('Ngousso', 0.9),
+                ('Omnisport', 0.9), ('Mimboman', 0.6), ('Santa Barbara', 1.6), ('Golf', 2.0)],
+    'Douala': [('Bonapriso', 2.0), ('Akwa', 1.5), ('Bonanjo', 1.8), ('Makepe', 1.0),
+               ('Bonamoussadi', 1.1), ('Kotto', 0.9), ('Logpom', 0.7), ('Deido', 0.8),
+               ('Bali', 1.2), ('Ndogbong', 0.7), ('Bepanda', 0.6), ('Japoma', 0.5)]
+}
+VILLES = [('Yaoundé', 0.55), ('Douala', 0.45)]
+CHAMBRES = [(1, 0.30), (2, 0.30), (3, 0.22), (4, 0.11), (5, 0.05), (6, 0.02)]
+
+
+def _weights(n: int) -> np.ndarray:
+    """Répartition de Zipf : quelques quartiers concentrent la plupart des annonces"""
+    weights = 1 / np.arange(1, n + 1)
+    return weights / weights.sum()
+
+
+def synthetic_apartments(n: int, seed: int = 0):
+    """Annonces au format du scraper, générées par blocs de 10 000"""
+    rng = np.random.default_rng(seed)
+    villes = [v for v, _ in VILLES]
+    chambres, p_chambres = zip(*CHAMBRES)
+    start = datetime(2024, 1, 1)
+    for offset in range(0, n, 10_000):
+        size = min(10_000, n - offset)
+        ville_idx = rng.choice(len(villes), size=size, p=[w for _, w in VILLES])
+        nb_chambres = rng.choice(chambres, size=size, p=p_chambres)
+        base = rng.lognormal(mean=np.log(90_000), sigma=0.45, size=size)
+        vues = rng.geometric(0.01, size=size)
+        quartier_idx = np.empty(size, dtype=np.int64)
+        for v, ville in enumerate(villes):
+            rows = ville_idx == v
+            count = len(QUARTIERS[ville])
+            quartier_idx[rows] = rng.choice(count, size=rows.sum(), p=_weights(count))
+        batch = []
+        for i in range(size):
+            ville = villes[ville_idx[i]]
+            quartier, niveau = QUARTIERS[ville][quartier_idx[i]]
+            prix = int(round(base[i] * niveau * (0.6 + 0.4 * nb_chambres[i]), -4)) or 10_000
+            moment = start + timedelta(minutes=offset + i)
+            batch.append({
+                'titre': f"{prix} F | {quartier}, {ville}",
+                'ville': ville,
+                'quartier': quartier,
+                'prix': prix,
+                'nb_chambres': int(nb_chambres[i]),
+                'description': f"Appartement {nb_chambres[i]} chambres à louer à {quartier}",
+                'popularite': int(vues[i]),
+                'url_annonce': f"https://koutchoumi.com/annonce/{offset + i}.html",
+                'categorie': 'Moyen',
+                'date_ajout': moment,
+                'derniere_maj': moment
+            })
+        yield batch
+
+
+def query_mix(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Requêtes du formulaire : noms exacts, préfixes, fautes de frappe et quartiers inconnus"""
+    from app.models.enums import SalaryRange
+
+    rnd = random.Random(seed)
+    tranches = list(SalaryRange)
+    queries = []
+    for _ in range(count):
+        ville = rnd.choices([v for v, _ in VILLES], [w for _, w in VILLES])[0]
+        quartier = rnd.choice(QUARTIERS[ville])[0]
+        variant = rnd.random()
+        if variant < 0.15:
+            quartier = quartier[:max(3, len(quartier) // 2)].lower()
+        elif variant < 0.25:
+            quartier = quartier[:-1] + 'x'
+        elif variant < 0.30:
+            quartier = 'Quartier inconnu'
+        queries.append({'ville': ville, 'quartier': quartier,
+                        'tranche': rnd.choice(tranches), 'nb_personnes': rnd.randint(1, 6)})
+    return queries
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    values = np.asarray(samples) * 1000
+    return {
+        'p50_ms': float(np.percentile(values, 50)),
+        'p95_ms': float(np.percentile(values, 95)),
+        'p99_ms': float(np.percentile(values, 99)),
+        'mean_ms': float(values.mean()),
+        'requests_per_s': len(values) / (values.sum() / 1000) if values.sum() else 0.0
+    }
+
+
+def timed(func: Callable[[], Any]) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def connect(args):
+    """Connexion à une base dédiée au benchmark (mongomock ou mongod)"""
+    import app.database.db_config as db_config
+
+    if args.backend == 'mongomock':
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit("mongomock n'est pas installé (pip install mongomock) ; sinon --backend mongod")
+        client = mongomock.MongoClient()
+        db_config.MongoClient = lambda *a, **k: client
+        os.environ.setdefault('MONGODB_URI', 'mongodb://localhost:27017')
+    else:
+        os.environ['MONGODB_URI'] = args.uri
+    db = db_config.DatabaseConnection()
+    db.db = db.client[args.database]
+    return db
+
+
+def run_size(args, n: int) -> Dict[str, Any]:
+    from app.database.indexes import ensure_indexes
+    from app.models.classification import ApartmentClassifier
+    from app.models.recommendation import ApartmentRecommender, Location, RecommendationRequest
+    from app.visualizations.chart_cache import ChartCache
+    from app.visualizations.charts import AppartementVisualizer
+
+    db = connect(args)
+    db.db.apartments.drop()
+    db.db.meta.drop()
+    start = time.perf_counter()
+    for batch in synthetic_apartments(n, args.seed):
+        db.db.apartments.insert_many(batch, ordered=False)
+    ensure_indexes(db)
+    db.bump_data_version()
+    result = {'rows': n, 'insert_s': time.perf_counter() - start}
+
+    # Chargement : instantané construit au premier recommender, partagé ensuite
+    result['load_cold_s'] = timed(lambda: ApartmentRecommender(db))
+    result['load_warm_ms'] = timed(lambda: ApartmentRecommender(db)) * 1000
+
+    recommender = ApartmentRecommender(db)
+    requests = [
+        RecommendationRequest(Location(q['ville'], q['quartier']), q['tranche'], q['nb_personnes'])
+        for q in query_mix(args.queries, args.seed)
+    ]
+    derived = recommender.snapshot._derived
+    uncached = []
+    for request in requests:
+        # Caches de classement et de réponses vidés : coût complet de chaque requête
+        derived.pop('rankings', None)
+        derived.pop('responses', None)
+        uncached.append(timed(lambda: recommender.get_recommendations(request)))
+    # Caches remplis par un premier passage, puis mesurés
+    for request in requests:
+        recommender.get_cached_recommendations(request)
+        recommender.get_recommendations(request)
+    cached = [timed(lambda: recommender.get_recommendations(request)) for request in requests]
+    responses = [timed(lambda: recommender.get_cached_recommendations(request))
+                 for request in requests]
+    result['recommendations'] = {'queries': len(requests),
+                                 'uncached': percentiles(uncached),
+                                 'cached': percentiles(cached),
+                                 'response_cache': percentiles(responses)}
+
+    classifier = ApartmentClassifier(db)
+    result['classify_s'] = timed(classifier.classify_apartments)
+
+    cache_dir = tempfile.mkdtemp(prefix='bench_charts_')
+    try:
+        visualizer = AppartementVisualizer(db, chart_cache=ChartCache(cache_dir))
+        villes = [v for v, _ in VILLES]
+        data = {}
+        result['dashboard_aggregate_s'] = timed(
+            lambda: data.update(visualizer.get_dashboard_data(villes))
+        )
+
+        def render_all():
+            for ville in [None] + villes:
+                visualizer.plot_distribution_chambres(ville, data=data[ville]['distribution'])
+                visualizer.plot_top_appartements(ville, data=data[ville]['top'])
+
+        result['charts_render_s'] = timed(render_all)
+        result['charts_cached_ms'] = timed(render_all) * 1000
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    if args.backend == 'mongod':
+        db.db.client.drop_database(args.database)
+    return result
+
+
+def print_result(result: Dict[str, Any]):
+    reco = result['recommendations']
+    print(f"{result['rows']:>9,} lignes  (insertion {result['insert_s']:.1f} s)")
+    print(f"  chargement recommender : {result['load_cold_s'] * 1000:9.1f} ms à froid, "
+          f"{result['load_warm_ms']:.2f} ms à chaud")
+    for mode, label in (('uncached', 'sans cache'), ('cached', 'classement en cache'),
+                        ('response_cache', 'réponse en cache')):
+        stats = reco[mode]
+        print(f"  recommandations, {label:<19}: p50 {stats['p50_ms']:7.2f} ms  p95 {stats['p95_ms']:7.2f} ms  "
+              f"p99 {stats['p99_ms']:7.2f} ms  ({stats['requests_per_s']:.0f} req/s)")
+    print(f"  classify_apartments    : {result['classify_s'] * 1000:9.1f} ms")
+    print(f"  tableau de bord        : agrégation {result['dashboard_aggregate_s'] * 1000:.1f} ms, "
+          f"rendu {result['charts_render_s'] * 1000:.1f} ms, en cache {result['charts_cached_ms']:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark des recommandations et du tableau de bord")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000],
+                        help="tailles de collection (lignes)")
+    parser.add_argument('--queries', type=int, default=500, help="requêtes de recommandation par taille")
+    parser.add_argument('--backend', choices=['mongomock', 'mongod'], default='mongomock')
+    parser.add_argument('--uri', default='mongodb://localhost:27017', help="URI du mongod local")
+    parser.add_argument('--database', default='koutchoumi_bench', help="base utilisée (vidée)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="fichier de sortie JSON")
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.WARNING)
+
+    report = {
+        'backend': args.backend,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'seed': args.seed,
+        'results': []
+    }
+    for n in args.sizes:
+        result = run_size(args, n)
+        report['results'].append(result)
+        print_result(result)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,123 @@
+"""
+Mesure du démarrage d'un worker de l'application.
+
+Chaque mesure est faite dans un processus Python neuf :
+- import du paquet `app` et création de l'application (app.app)
+- temps jusqu'à la première réponse (client de test Flask)
+- mémoire résidente maximale (RSS) du processus
+- détail `python -X importtime` : modules les plus coûteux
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 10 --path /about --json startup.json
+
+Les tâches de fond (index, rafraîchissement du tableau de bord) sont
+désactivées par défaut pour ne mesurer que le démarrage ; --background les
+réactive. MongoDB n'est pas nécessaire pour la route /about.
+"""
+
+from collections import defaultdict
+from typing import Any, Dict, List
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Script exécuté dans le processus mesuré
+PROBE = """
+import json, resource, sys, time
+t0 = time.perf_counter()
+import app as package
+t_import = time.perf_counter()
+flask_app = package.app
+t_app = time.perf_counter()
+response = flask_app.test_client().get(sys.argv[1])
+t_first = time.perf_counter()
+print(json.dumps({
+    'import_ms': (t_import - t0) * 1000,
+    'create_app_ms': (t_app - t_import) * 1000,
+    'first_response_ms': (t_first - t0) * 1000,
+    'status': response.status_code,
+    'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'modules': len(sys.modules),
+    'heavy_modules': sorted(m for m in ('pandas', 'numpy', 'matplotlib', 'seaborn', 'sklearn')
+                            if m in sys.modules)
+}))
+"""
+
+
+def probe_env(background: bool) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.setdefault('MONGODB_URI', 'mongodb://localhost:27017')
+    if not background:
+        env['MONGODB_ENSURE_INDEXES'] = '0'
+        env['DASHBOARD_REFRESH_INTERVAL'] = '0'
+    return env
+
+
+def measure_boot(path: str, env: Dict[str, str]) -> Dict[str, Any]:
+    result = subprocess.run([sys.executable, '-c', PROBE, path], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def import_breakdown(env: Dict[str, str], top: int = 10) -> List[Dict[str, Any]]:
+    """Temps d'import propre (self) cumulé par paquet de premier niveau"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app; app.app'],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    per_package = defaultdict(int)
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        per_package[name.strip().split('.')[0]] += int(self_us)
+    ranked = sorted(per_package.items(), key=lambda item: item[1], reverse=True)
+    return [{'package': name, 'self_ms': us / 1000} for name, us in ranked[:top]]
+
+
+def run(runs: int, path: str, background: bool) -> Dict[str, Any]:
+    env = probe_env(background)
+    samples = [measure_boot(path, env) for _ in range(runs)]
+    summary = {
+        key: statistics.median(s[key] for s in samples)
+        for key in ('import_ms', 'create_app_ms', 'first_response_ms', 'rss_mb', 'modules')
+    }
+    return {
+        'runs': runs,
+        'path': path,
+        'background': background,
+        'median': summary,
+        'status': samples[-1]['status'],
+        'heavy_modules': samples[-1]['heavy_modules'],
+        'imports': import_breakdown(env)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mesure du démarrage d'un worker")
+    parser.add_argument('--runs', type=int, default=5, help="nombre de processus mesurés")
+    parser.add_argument('--path', default='/about', help="route de la première requête")
+    parser.add_argument('--background', action='store_true',
+                        help="garder les tâches de fond (index, tableau de bord)")
+    parser.add_argument('--json', help="fichier de sortie JSON")
+    args = parser.parse_args()
+
+    report = run(args.runs, args.path, args.background)
+    median = report['median']
+    print(f"Démarrage ({report['runs']} processus, médiane) :")
+    print(f"  import app           : {median['import_ms']:8.1f} ms")
+    print(f"  create_app()         : {median['create_app_ms']:8.1f} ms")
+    print(f"  1re réponse {report['path']:<9}: {median['first_response_ms']:8.1f} ms (HTTP {report['status']})")
+    print(f"  RSS max              : {median['rss_mb']:8.1f} Mo")
+    print(f"  modules chargés      : {median['modules']:8.0f}")
+    print(f"  modules lourds       : {', '.join(report['heavy_modules']) or 'aucun'}")
+    print("Imports les plus coûteux (temps propre) :")
+    for entry in report['imports']:
+        print(f"  {entry['package']:<20} {entry['self_ms']:8.1f} ms")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
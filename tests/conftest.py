@@ -0,0 +1,80 @@
+"""
+Fixtures communes : une base MongoDB en mémoire (mongomock) et un jeu
+d'annonces couvrant les cas limites (prix nul, manquant ou non numérique,
+quartier ou ville manquant, popularité manquante).
+"""
+
+from datetime import datetime, timedelta
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+mongomock = pytest.importorskip('mongomock')
+
+QUARTIERS = {
+    'Yaoundé': ['Bastos', 'Odza', 'Essos', 'Biyem-Assi', 'Mvog-Mbi', 'Santa Barbara', 'Emana'],
+    'Douala': ['Bonapriso', 'Akwa', 'Bonanjo', 'Makepe', 'Bonamoussadi', 'Kotto', 'Deido']
+}
+PRIX = [25_000, 50_000, 75_000, 100_000, 150_000, 200_000, 250_000, 300_000,
+        500_000, 750_000, 1_000_000, 1_500_000, 2_000_000]
+
+
+def make_apartments(n: int = 400, seed: int = 0):
+    rnd = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    docs = []
+    for i in range(n):
+        ville = rnd.choice(list(QUARTIERS))
+        chambres = rnd.randint(1, 6)
+        doc = {
+            'titre': f"Appartement {i}",
+            'ville': ville,
+            'quartier': rnd.choice(QUARTIERS[ville]),
+            'prix': rnd.choice(PRIX),
+            'nb_chambres': chambres,
+            'description': f"Appartement {chambres} chambres",
+            'vues': rnd.randint(0, 150),
+            'url_annonce': f"https://koutchoumi.com/annonce/{i}.html",
+            'date_ajout': start + timedelta(minutes=i),
+            'derniere_maj': start + timedelta(minutes=i)
+        }
+        docs.append(doc)
+
+    # Cas limites
+    docs[0]['prix'] = 0
+    docs[1]['prix'] = None
+    docs[2]['prix'] = 'Sur demande'
+    del docs[3]['prix']
+    docs[4]['quartier'] = None
+    del docs[5]['quartier']
+    docs[6]['ville'] = None
+    del docs[7]['vues']
+    docs[8]['nb_chambres'] = None
+    docs[9]['quartier'] = '  bastos '
+    return docs
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """DatabaseConnection branchée sur une base mongomock vide"""
+    import app.database.db_config as db_config
+
+    client = mongomock.MongoClient()
+    monkeypatch.setenv('MONGODB_URI', 'mongodb://localhost:27017')
+    monkeypatch.setattr(db_config, 'MongoClient', lambda *args, **kwargs: client)
+    connection = db_config.DatabaseConnection()
+    yield connection
+    connection.cleanup()
+
+
+@pytest.fixture
+def apartments(db):
+    """Collection `apartments` remplie avec make_apartments()"""
+    docs = make_apartments()
+    db.db.apartments.insert_many(docs)
+    db.bump_data_version()
+    return docs
@@ -0,0 +1,41 @@
+"""
+Classification matérialisée : une mise à jour du prix ou des chambres
+retire la catégorie, que refresh_classifications recalcule.
+"""
+
+import pytest
+
+from app.models.classification import ApartmentClassifier
+from conftest import make_apartments
+
+
+@pytest.fixture
+def classifier(db):
+    """Annonces du scraper (champ popularite), classées"""
+    docs = make_apartments(50)[10:]
+    for doc in docs:
+        doc['popularite'] = doc.pop('vues')
+    db.db.apartments.insert_many(docs)
+    classifier = ApartmentClassifier(db)
+    assert classifier.refresh_classifications() == len(docs)
+    return classifier
+
+
+def test_price_update_reclassifies(db, classifier):
+    doc = db.db.apartments.find_one({'prix': {'$lt': 350_000}})
+    assert doc['classification'] == 'Low Cost'
+
+    assert db.update_apartment(doc['_id'], {'prix': 2_000_000})
+    updated = db.db.apartments.find_one({'_id': doc['_id']})
+    assert 'classification' not in updated and 'classification_version' not in updated
+
+    assert classifier.refresh_classifications() == 1
+    assert db.db.apartments.find_one({'_id': doc['_id']})['classification'] == 'Luxueux'
+
+
+def test_other_updates_keep_classification(db, classifier):
+    doc = db.db.apartments.find_one({'classification': {'$exists': True}})
+
+    assert db.update_apartment(doc['_id'], {'titre': 'Nouveau titre'})
+    assert db.db.apartments.find_one({'_id': doc['_id']})['classification'] == doc['classification']
+    assert classifier.refresh_classifications() == 0
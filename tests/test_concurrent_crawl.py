@@ -0,0 +1,130 @@
+"""
+Crawl concurrent (run_concurrent) contre un serveur HTTP local qui sert les
+pages de listing enregistrées dans tests/fixtures/pages (2 villes × 4 pages).
+"""
+
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import os
+import re
+import threading
+import time
+
+import pytest
+
+from app.scraper.scraper import KoutchoumiScraper
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'pages')
+CITIES = {'yaounde': 'Yaoundé', 'douala': 'Douala'}
+PAGES = 4
+LISTINGS_PER_PAGE = 10
+_LISTING_PATH = re.compile(r'^/appartements-a-louer-a-(\w+)-cameroun\.html$')
+
+
+class FixtureSite(ThreadingHTTPServer):
+    """Serveur de pages enregistrées : note chaque requête et le nombre de requêtes simultanées"""
+
+    daemon_threads = True
+
+    def __init__(self, delay: float = 0.05):
+        super().__init__(('127.0.0.1', 0), FixtureHandler)
+        self.delay = delay
+        self.hits = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    @property
+    def root(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        site = self.server
+        url = urlparse(self.path)
+        match = _LISTING_PATH.match(url.path)
+        if not match or match.group(1) not in CITIES:
+            self.send_error(404)
+            return
+        page = int(parse_qs(url.query).get('page', ['1'])[0])
+        with site.lock:
+            site.hits.append((time.monotonic(), match.group(1), page))
+            site.in_flight += 1
+            site.max_in_flight = max(site.max_in_flight, site.in_flight)
+        try:
+            time.sleep(site.delay)
+            with open(os.path.join(PAGES_DIR, f"{match.group(1)}-{page}.html"), 'rb') as f:
+                body = f.read()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with site.lock:
+                site.in_flight -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def site():
+    server = FixtureSite()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def scraper(db, site, monkeypatch):
+    scraper = KoutchoumiScraper(db, site_root=site.root, base_urls={
+        ville: f"{site.root}/appartements-a-louer-a-{city}-cameroun.html"
+        for city, ville in CITIES.items()
+    })
+    # Le rendu du tableau de bord n'est pas l'objet de ces tests
+    monkeypatch.setattr(scraper, 'refresh_dashboard', lambda: None)
+    return scraper
+
+
+@pytest.mark.parametrize('parse_workers', [0, 2])
+def test_every_page_fetched_once(db, site, scraper, parse_workers):
+    pages = scraper.run_concurrent(max_workers=4, requests_per_second=100, burst=8,
+                                   parse_workers=parse_workers)
+
+    fetched = Counter((city, page) for _, city, page in site.hits)
+    assert fetched == Counter({(city, page): 1 for city in CITIES for page in range(1, PAGES + 1)})
+    assert pages == {ville: PAGES for ville in CITIES.values()}
+    assert db.db.apartments.count_documents({}) == len(CITIES) * PAGES * LISTINGS_PER_PAGE
+    assert scraper.ingestion.totals['inserted'] == len(CITIES) * PAGES * LISTINGS_PER_PAGE
+
+
+@pytest.mark.parametrize('max_workers', [1, 3])
+def test_max_workers_respected(site, scraper, max_workers):
+    site.delay = 0.1
+    scraper.run_concurrent(max_workers=max_workers, requests_per_second=1000, burst=100,
+                           parse_workers=0)
+
+    assert len(site.hits) == len(CITIES) * PAGES
+    assert site.max_in_flight <= max_workers
+    if max_workers > 1:
+        # Pages découvertes en avance : les téléchargements se recouvrent
+        assert site.max_in_flight > 1
+
+
+def test_token_bucket_rate_honored(site, scraper):
+    rate, burst = 20.0, 2
+    site.delay = 0
+    scraper.run_concurrent(max_workers=4, requests_per_second=rate, burst=burst, parse_workers=0)
+
+    times = sorted(t for t, _, _ in site.hits)
+    assert len(times) == len(CITIES) * PAGES
+    # Un seul hôte : au plus `burst` requêtes immédiates, puis `rate` par seconde
+    tolerance = 0.02
+    for i, t in enumerate(times):
+        assert t - times[0] >= (i + 1 - burst) / rate - tolerance, (i, t - times[0])
+    assert times[-1] - times[0] >= (len(times) - burst) / rate - tolerance
@@ -0,0 +1,57 @@
+"""
+Historique des observations : vues gagnées par jour rangées dans les seaux
+par refresh_rollups, puis lues triées par view_velocity.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.database.history import ObservationStore
+
+MOIS = '2024-05'
+START = datetime(2024, 5, 2)
+
+
+def observation(i, vues, ville='Douala'):
+    return {'url_annonce': f"https://koutchoumi.com/annonce/{i}.html", 'ville': ville,
+            'quartier': 'Akwa', 'prix': 100000 + i, 'popularite': vues}
+
+
+@pytest.fixture
+def store(db):
+    store = ObservationStore(db)
+    listings = [observation(i, 10 * i, 'Douala' if i % 2 else 'Yaoundé') for i in range(12)]
+    store.record(listings, observed_at=START)
+    # Vues gagnées en deux jours : i², sauf l'annonce 5 (observée une seule fois)
+    later = [observation(i, 10 * i + i * i, 'Douala' if i % 2 else 'Yaoundé')
+             for i in range(12) if i != 5]
+    later.append({**observation(5, None, 'Douala'), 'url_annonce': 'https://koutchoumi.com/autre.html'})
+    store.record(later, observed_at=START + timedelta(days=2))
+    assert store.refresh_rollups() > 0
+    return store
+
+
+def test_velocity_ranked_from_buckets(store):
+    ranked = store.view_velocity(mois=MOIS, limit=4)
+
+    assert [item['url_annonce'] for item in ranked] == [
+        f"https://koutchoumi.com/annonce/{i}.html" for i in (11, 10, 9, 8)]
+    assert ranked[0] == {'url_annonce': "https://koutchoumi.com/annonce/11.html",
+                         'ville': 'Douala', 'quartier': 'Akwa', 'prix': 100011,
+                         'vues': 231, 'vues_gagnees': 121, 'vues_par_jour': 60.5}
+
+
+def test_velocity_filtered_by_city(store):
+    ranked = store.view_velocity('Yaoundé', mois=MOIS, limit=20)
+
+    assert [item['vues_gagnees'] for item in ranked] == [i * i for i in (10, 8, 6, 4, 2, 0)]
+    assert all(item['ville'] == 'Yaoundé' for item in ranked)
+
+
+def test_single_observation_not_ranked(store):
+    urls = {item['url_annonce'] for item in store.view_velocity(mois=MOIS, limit=50)}
+
+    assert len(urls) == 11
+    assert "https://koutchoumi.com/annonce/5.html" not in urls
+    assert "https://koutchoumi.com/autre.html" not in urls
@@ -0,0 +1,53 @@
+"""
+Upserts groupés (bulk_upsert_apartments) : contenu réécrit seulement quand
+l'empreinte change, popularité toujours tenue à jour.
+"""
+
+from app.scraper.crawl_state import listing_fingerprint
+
+
+def listing(i=0, **changes):
+    data = {'titre': "150000 F | Akwa, Douala", 'ville': 'Douala', 'quartier': 'Akwa',
+            'prix': 150000, 'nb_chambres': 2, 'description': f"Appartement {i}",
+            'popularite': 10, 'url_annonce': f"https://koutchoumi.com/annonce/{i}.html"}
+    data.update(changes)
+    data['empreinte'] = listing_fingerprint(data)
+    return data
+
+
+def stored(db, i=0):
+    return db.db.apartments.find_one({'url_annonce': f"https://koutchoumi.com/annonce/{i}.html"})
+
+
+def test_identical_listing_unchanged(db):
+    assert db.bulk_upsert_apartments([listing()])['inserted'] == 1
+    version = db.get_data_version()
+    before = stored(db)
+
+    counts = db.bulk_upsert_apartments([listing()])
+
+    assert counts == {'inserted': 0, 'updated': 0, 'unchanged': 1, 'errors': 0}
+    assert db.get_data_version() == version
+    assert stored(db)['derniere_maj'] == before['derniere_maj']
+
+
+def test_popularity_updated_without_content_change(db):
+    db.bulk_upsert_apartments([listing(0), listing(1)])
+    version = db.get_data_version()
+    untouched = stored(db, 1)['derniere_maj']
+
+    counts = db.bulk_upsert_apartments([listing(0, popularite=99), listing(1)])
+
+    assert counts == {'inserted': 0, 'updated': 1, 'unchanged': 1, 'errors': 0}
+    assert stored(db, 0)['popularite'] == 99 and stored(db, 1)['popularite'] == 10
+    assert stored(db, 1)['derniere_maj'] == untouched
+    assert db.get_data_version() == version + 1
+
+
+def test_content_and_popularity_change_counted_once(db):
+    db.bulk_upsert_apartments([listing()])
+
+    counts = db.bulk_upsert_apartments([listing(prix=175000, popularite=42)])
+
+    assert counts == {'inserted': 0, 'updated': 1, 'unchanged': 0, 'errors': 0}
+    assert stored(db)['prix'] == 175000 and stored(db)['popularite'] == 42
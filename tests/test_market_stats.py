@@ -0,0 +1,71 @@
+"""
+Table des statistiques de marché (MarketStats) : un groupby().agg() par
+niveau de regroupement, comparé au calcul groupe par groupe sur les Series.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.models.market_stats import GROUPINGS, MarketStats, stats_key
+from app.models.recommendation import ApartmentStats
+
+FIELDS = ('avg_price', 'median_price', 'min_price', 'max_price',
+          'avg_popularity', 'max_popularity', 'count')
+
+
+def market_frame(n=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'ville': rng.choice(['Yaoundé', 'Douala', 'DOUALA', 'Kribi'], n),
+        'quartier': rng.choice([f"Quartier {i}" for i in range(40)], n),
+        'nb_chambres': rng.integers(1, 6, n).astype(float),
+        'prix': rng.integers(20, 3000, n) * 1000.0 + rng.random(n),
+        'popularite': rng.integers(0, 900, n).astype(float)
+    })
+    df.loc[::97, 'quartier'] = None
+    df.loc[::89, 'nb_chambres'] = np.nan
+    df.loc[::53, 'prix'] = np.nan
+    return df
+
+
+def expected_table(df):
+    """Calcul d'origine : filtrage de chaque groupe puis réductions des Series"""
+    keys = pd.DataFrame({'ville': df['ville'].str.lower(), 'quartier': df['quartier'].str.lower(),
+                         'nb_chambres': df['nb_chambres']})
+    table = {stats_key(): df}
+    for columns in GROUPINGS:
+        for values, positions in keys.groupby(list(columns), dropna=True).indices.items():
+            values = values if isinstance(values, tuple) else (values,)
+            table[stats_key(**dict(zip(columns, values)))] = df.iloc[positions]
+    return {key: ApartmentStats(
+        avg_price=group['prix'].mean(), median_price=group['prix'].median(),
+        min_price=group['prix'].min(), max_price=group['prix'].max(),
+        avg_popularity=group['popularite'].mean(), max_popularity=group['popularite'].max(),
+        count=len(group)
+    ) for key, group in table.items()}
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_table_matches_per_group_reductions(seed):
+    df = market_frame(seed=seed)
+    table = MarketStats.from_frame(df, ApartmentStats).table
+    expected = expected_table(df)
+
+    assert table.keys() == expected.keys()
+    for key, stats in expected.items():
+        for name in FIELDS:
+            np.testing.assert_allclose(getattr(table[key], name), getattr(stats, name),
+                                       rtol=1e-12, err_msg=f"{key} {name}")
+
+
+def test_lookup_is_case_insensitive():
+    df = market_frame()
+    stats = MarketStats.from_frame(df, ApartmentStats)
+
+    douala = df[df['ville'].str.lower() == 'douala']
+    assert stats.get('Douala').count == stats.get('DOUALA').count == len(douala)
+    assert stats.get('Douala', 'quartier 3', 2).count == len(douala[
+        (douala['quartier'] == 'Quartier 3') & (douala['nb_chambres'] == 2)])
+    assert stats.get('Garoua') is None
+    assert len(MarketStats.from_frame(df.iloc[:0], ApartmentStats)) == 0
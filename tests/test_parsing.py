@@ -0,0 +1,71 @@
+"""
+Bornage de la page (listing_region) : la zone analysée va de la première
+carte d'annonce à la fin de la vraie pagination, quel que soit le texte des
+annonces.
+"""
+
+import os
+import re
+
+import pytest
+from bs4 import BeautifulSoup
+
+from app.scraper.parsing import PAGE_CONTENT, ListingParser, listing_region
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'pages')
+SITE_ROOT = "https://koutchoumi.com"
+PAGE_URL = f"{SITE_ROOT}/appartements-a-louer-a-yaounde-cameroun.html?page=1"
+
+
+def fixture_page(name: str) -> bytes:
+    with open(os.path.join(PAGES_DIR, name), 'rb') as f:
+        return f.read()
+
+
+def full_document(parser: ListingParser, content: bytes, ville: str):
+    """Analyse sans bornage : référence de ce que listing_region doit conserver"""
+    soup = BeautifulSoup(content, parser.parser, parse_only=PAGE_CONTENT)
+    listings = [parser.extract_apartment_info(card, ville)
+                for card in soup.find_all('div', class_='card card-list')]
+    return [listing for listing in listings if listing], parser.pagination(soup, PAGE_URL)
+
+
+def without_dates(listings):
+    return [{k: v for k, v in listing.items() if k not in ('date_ajout', 'derniere_maj')}
+            for listing in listings]
+
+
+@pytest.mark.parametrize('text', [
+    b'Pagination du parking : 2 places.',
+    b'<ul class="list-inline"><li>pagination</li></ul>',
+    b'<span class="pagination-hint">1 / 3</span>',
+])
+def test_pagination_word_in_card_keeps_every_listing(text):
+    # Feuille de style externe : « card-list » n'apparaît qu'à partir des cartes
+    content = re.sub(rb'<style>.*?</style>', b'', fixture_page('yaounde-1.html'), flags=re.DOTALL)
+    first_text = content.index(b'<p class="card-text">') + len(b'<p class="card-text">')
+    content = content[:first_text] + text + b' ' + content[first_text:]
+
+    parser = ListingParser(SITE_ROOT)
+    parsed = parser.parse(content, 'Yaoundé', PAGE_URL)
+    expected_listings, expected_page = full_document(parser, content, 'Yaoundé')
+
+    assert len(parsed.listings) == 10
+    assert without_dates(parsed.listings) == without_dates(expected_listings)
+    assert parsed.page == expected_page
+    assert parsed.page.next_page is not None and parsed.page.next_page.endswith('?page=2')
+
+
+def test_region_ends_with_pagination_list():
+    content = fixture_page('douala-2.html')
+    region = listing_region(content)
+
+    assert region.startswith(b'<div class="card card-list">')
+    assert region.rstrip().endswith(b'</ul>')
+    assert b'<ul class="pagination">' in region
+    assert b'<footer' not in region and b'<nav' not in region
+
+
+def test_region_without_markers_is_whole_document():
+    content = b'<html><body><p>Aucune annonce</p></body></html>'
+    assert listing_region(content) == content
@@ -0,0 +1,157 @@
+"""
+Équivalence du score vectorisé (score_frame, top_k_indices) avec le calcul
+ligne à ligne d'origine (calculate_score, DataFrame.nlargest).
+"""
+
+from difflib import get_close_matches
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.models.enums import SalaryRange
+from app.models.recommendation import (
+    ApartmentRecommender, ApartmentScorer, ApartmentStats, Formatter, Location,
+    RecommendationRequest, top_k_indices
+)
+from app.models.recommendation import SalaryRange as RecommendationSalaryRange
+
+VILLES = ['Yaoundé', 'Douala', 'Kribi']
+QUARTIERS = ['Bastos', 'bast', 'Bastoss', 'Akwa', 'Santa Barbara', 'Quartier inconnu']
+
+
+def requests_mix():
+    for ville, quartier, tranche, nb_personnes in itertools.product(
+            VILLES, QUARTIERS, list(SalaryRange), (1, 3, 6)):
+        yield RecommendationRequest(Location(ville, quartier), tranche, nb_personnes)
+
+
+def reference_top(scores: pd.Series, k: int) -> pd.Series:
+    """
+    nlargest(k, keep='first') : à score égal, la ligne la plus ancienne d'abord.
+
+    Pour k >= len(scores), nlargest se rabat sur un tri instable (l'ordre des
+    égalités y est arbitraire) : le tri stable en donne l'ordre attendu.
+    """
+    return scores.sort_values(ascending=False, kind='stable').head(k)
+
+
+def raw_frame(db) -> pd.DataFrame:
+    """Annonces brutes, sans le filtrage du prétraitement (NaN et zéros conservés)"""
+    df = pd.DataFrame(list(db.db.apartments.find()))
+    for column in ('prix', 'nb_chambres', 'vues'):
+        df[column] = pd.to_numeric(df[column], errors='coerce')
+    return df.rename(columns={'vues': 'popularite'})
+
+
+def frame_stats(df: pd.DataFrame, max_popularity=None) -> ApartmentStats:
+    prix = df['prix'][df['prix'] > 0]
+    return ApartmentStats(
+        avg_price=prix.mean(), median_price=prix.median(), min_price=prix.min(),
+        max_price=prix.max(), avg_popularity=df['popularite'].mean(),
+        max_popularity=df['popularite'].max() if max_popularity is None else max_popularity,
+        count=len(df)
+    )
+
+
+def baseline_ranking(recommender, request, limit):
+    """Classement d'origine : apply(calculate_score) puis nlargest sur les annonces du quartier"""
+    df = recommender.df
+    mask = (
+        (df['ville'].str.lower() == request.location.ville.lower()) &
+        (df['prix'] <= request.tranche_salariale.max_rent) &
+        (df['nb_chambres'] >= max(1, (request.nb_personnes + 1) // 2))
+    )
+    filtered = df[mask].copy()
+    if len(filtered) == 0:
+        return []
+    stats = recommender.get_stats(request.location.ville)
+    filtered['score'] = filtered.apply(
+        lambda row: recommender.scorer.calculate_score(row, request, stats), axis=1
+    )
+    search = request.location.quartier.lower()
+
+    def matches(quartier):
+        # Le code d'origine échouait sur un quartier manquant : il ne correspond à rien
+        return isinstance(quartier, str) and (
+            quartier == search or quartier.startswith(search) or search.startswith(quartier)
+            or bool(get_close_matches(search, [quartier], n=1, cutoff=0.8))
+        )
+
+    in_quartier = filtered[filtered['quartier'].str.lower().apply(matches)]
+    candidates = in_quartier if len(in_quartier) else filtered
+    best = candidates.loc[reference_top(candidates['score'], limit).index]
+    assert best['score'].tolist() == candidates.nlargest(limit, 'score')['score'].tolist()
+    return [(str(row['_id']), Formatter.percentage(row['score'] * 100)) for _, row in best.iterrows()]
+
+
+@pytest.mark.parametrize('max_popularity', [None, 0])
+def test_score_frame_matches_calculate_score(db, apartments, max_popularity):
+    df = raw_frame(db)
+    assert df['prix'].isna().sum() == 3 and (df['prix'] == 0).sum() == 1
+    assert df['quartier'].isna().sum() == 2 and df['ville'].isna().sum() == 1
+
+    scorer = ApartmentScorer()
+    stats = frame_stats(df, max_popularity)
+    rows = [row for _, row in df.iterrows()]
+    for request in requests_mix():
+        expected = np.array([scorer.calculate_score(row, request, stats) for row in rows], dtype=float)
+        np.testing.assert_array_equal(scorer.score_frame(df, request, stats), expected,
+                                      err_msg=str(request))
+
+
+def test_score_frame_unbounded_budget(db, apartments):
+    df = raw_frame(db)
+    scorer = ApartmentScorer()
+    request = RecommendationRequest(Location('Douala', 'Akwa'), SalaryRange.VERY_HIGH, 2)
+    assert request.tranche_salariale.max_rent == float('inf')
+
+    scores = scorer.score_frame(df, request, frame_stats(df))
+    assert np.isfinite(scores).all()
+    # Prix nul : composante prix à 0 ; prix inconnu : min(1.0, NaN) = 1.0, comme en Python
+    expected = [scorer.calculate_score(df.iloc[i], request, frame_stats(df)) for i in range(4)]
+    np.testing.assert_array_equal(scores[:4], expected)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_top_k_indices_matches_nlargest(seed):
+    rng = np.random.default_rng(seed)
+    # Peu de valeurs distinctes : beaucoup d'égalités à départager
+    scores = rng.integers(0, 8, size=200) / 8
+    series = pd.Series(scores)
+    for k in (0, 1, 5, 37, 199, 200, 250):
+        selected = top_k_indices(scores, k)
+        np.testing.assert_array_equal(selected, reference_top(series, k).index.to_numpy(),
+                                      err_msg=f"k={k}")
+        np.testing.assert_array_equal(scores[selected], series.nlargest(k).to_numpy(),
+                                      err_msg=f"k={k}")
+
+
+def test_recommendations_match_baseline_order(db, apartments):
+    recommender = ApartmentRecommender(db)
+    compared = 0
+    for request in requests_mix():
+        for limit in (1, 6, 50):
+            expected = baseline_ranking(recommender, request, limit)
+            response = recommender.get_recommendations(request, limit=limit)
+            actual = [(apt['id'], apt['score']) for apt in response['recommendations']]
+            assert actual == expected, (request, limit)
+            compared += bool(expected)
+    assert compared > 100
+
+
+@pytest.mark.parametrize('tranche', [SalaryRange.MEDIUM, RecommendationSalaryRange.MEDIUM()],
+                         ids=['enums', 'recommendation'])
+def test_cached_recommendations_accept_both_salary_ranges(db, apartments, tranche):
+    recommender = ApartmentRecommender(db)
+    request = RecommendationRequest(Location('douala', 'akwa'), tranche, 2)
+
+    canonical, response, hit = recommender.get_cached_recommendations(request, limit=6)
+    assert not hit and response['status'] == 'success'
+    assert canonical.location == Location('Douala', 'Akwa')
+    assert response['recommendations'] == \
+        recommender.get_recommendations(request, limit=6)['recommendations']
+
+    _, cached, hit = recommender.get_cached_recommendations(request, limit=6)
+    assert hit and cached is response
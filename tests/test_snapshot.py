@@ -0,0 +1,95 @@
+"""
+Rafraîchissement de l'instantané (SnapshotStore) : fusion incrémentale des
+documents modifiés, rechargement complet après une suppression.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.snapshot import SnapshotStore
+
+
+@pytest.fixture
+def store(db, apartments, monkeypatch):
+    store = SnapshotStore(db, preprocess=lambda df: df, check_interval=0)
+    builds = []
+    build = store._build
+    monkeypatch.setattr(store, '_build', lambda signature: builds.append(signature) or build(signature))
+    store.builds = builds
+    return store
+
+
+def later(minutes=1):
+    return datetime.now() + timedelta(minutes=minutes)
+
+
+def test_update_is_merged(db, apartments, store):
+    first = store.get()
+    assert len(first.df) == len(apartments) and len(store.builds) == 1
+
+    db.db.apartments.update_one({'_id': apartments[20]['_id']},
+                                {'$set': {'prix': 123456, 'derniere_maj': later()}})
+    db.bump_data_version()
+    second = store.get()
+
+    assert len(store.builds) == 1
+    assert second.signature != first.signature
+    row = second.df[second.df['_id'] == apartments[20]['_id']]
+    assert row['prix'].tolist() == [123456]
+    assert second.df['_id'].tolist() == first.df['_id'].tolist()
+
+
+def test_unchanged_version_keeps_snapshot(store):
+    first = store.get()
+    assert store.get() is first
+
+
+def test_delete_forces_rebuild(db, apartments, store):
+    store.get()
+    deleted = apartments[30]['_id']
+    # Suppression et modification dans le même intervalle : le nombre de
+    # documents ne change pas, seul le compteur de suppressions le signale
+    assert db.delete_apartment(deleted)
+    db.db.apartments.insert_one({'titre': 'nouvelle', 'ville': 'Douala', 'quartier': 'Akwa',
+                                 'prix': 200000, 'nb_chambres': 2, 'vues': 3,
+                                 'derniere_maj': later()})
+    db.bump_data_version()
+
+    snapshot = store.get()
+    assert len(store.builds) == 2
+    assert deleted not in set(snapshot.df['_id'])
+    assert len(snapshot.df) == len(apartments)
+    assert snapshot.raw_count == len(apartments)
+
+
+def test_delete_seen_without_document_count(db, apartments, store, monkeypatch):
+    store.get()
+    # Compte estimé (métadonnées) pas encore à jour : la suppression passe par la version
+    monkeypatch.setattr(db, 'estimated_count', lambda: len(apartments))
+    deleted = apartments[40]['_id']
+    assert db.delete_apartment(deleted)
+
+    snapshot = store.get()
+    assert len(store.builds) == 2
+    assert deleted not in set(snapshot.df['_id'])
+    assert len(snapshot.df) == len(apartments) - 1
+
+
+def test_late_commit_below_high_water_mark_is_merged(db, apartments, store):
+    store.get()
+    stamp = later(2)
+    # Deux lots écrits en parallèle : le plus récent est visible le premier
+    db.db.apartments.update_one({'_id': apartments[50]['_id']},
+                                {'$set': {'prix': 111111, 'derniere_maj': stamp}})
+    db.bump_data_version()
+    assert store.get().high_water_mark >= stamp.replace(microsecond=0)
+    db.db.apartments.update_one({'_id': apartments[60]['_id']},
+                                {'$set': {'prix': 222222, 'derniere_maj': stamp - timedelta(minutes=1)}})
+    db.bump_data_version()
+
+    snapshot = store.get()
+    assert len(store.builds) == 1
+    prix = snapshot.df.set_index('_id')['prix']
+    assert prix[apartments[50]['_id']] == 111111 and prix[apartments[60]['_id']] == 222222
+    assert len(snapshot.df) == len(apartments)